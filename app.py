@@ -4,17 +4,31 @@
 """
 
 import sys
+import time
+import atexit
+import uuid
 import platform
+import threading
+import contextvars
+from collections import OrderedDict
 from datetime import datetime
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
 from flask import Flask, request, Response, jsonify
-from twilio.twiml.voice_response import VoiceResponse, Gather
-from twilio.rest import Client
 
 # استيراد الموديولات المحلية
 from config import *
-from assistant import generate_response, format_numbers_for_speech, SmartAssistant
-from data import get_user_by_phone, get_expiring_documents
+from assistant import generate_response, format_numbers_for_speech, get_prompt_cache_stats, SmartAssistant, faq_cache, seed_faq_cache, llm, llm_guard
+from data import get_user_by_phone, get_expiring_documents, users
+from reminders import get_reminder_scheduler
+from transactions import idempotency_key, get_transaction_stats
 from prompts import get_greeting
+from session_store import create_session_backend
+from call_context import CallContextCache
+from intents import match_intents
+from metrics import latency, PROMETHEUS_CONTENT_TYPE
+from call_journal import get_call_journal, turn_event
+import twiml_templates
 
 # ==========================
 # 🎨 تهيئة Flask
@@ -24,33 +38,130 @@ app = Flask(__name__)
 # ==========================
 # 💾 ذاكرة المحادثات
 # ==========================
-conversations = {}
+# المكالمات المنتهية بدون "مع السلامة" تُحذف تلقائياً بعد SESSION_TTL_SECONDS
+# مع SESSION_BACKEND=sqlite يمكن تشغيل التطبيق بعدة عمليات تتشارك نفس الجلسات
+conversations = create_session_backend()
+conversations.start_sweeper()
+
+# إرسال التذكيرات في مواعيدها
+reminder_scheduler = get_reminder_scheduler()
+reminder_scheduler.start()
+
+# سجل المكالمات: الطلب يضع الحدث في طابور، والكتابة على القرص في خيط منفصل
+call_journal = get_call_journal()
+call_journal.start()
+atexit.register(call_journal.stop)  # كتابة ما تبقى في الطابور عند الإيقاف
+
+def console(message, level=2):
+    """طباعة حسب CONSOLE_VERBOSITY (1: سطر لكل دور، 2: كل التفاصيل) - الأخطاء تُطبع دائماً"""
+    if CONSOLE_VERBOSITY >= level:
+        print(message)
 
 def get_conversation(call_sid):
     """الحصول على تاريخ المحادثة"""
-    if call_sid not in conversations:
-        conversations[call_sid] = []
-    return conversations[call_sid]
+    return conversations.get_history(call_sid)
 
 def update_conversation(call_sid, user_message, assistant_message):
-    """تحديث تاريخ المحادثة"""
-    history = get_conversation(call_sid)
-    history.append({"role": "user", "content": user_message})
-    history.append({"role": "assistant", "content": assistant_message})
-    
-    # الحد من طول التاريخ
-    if len(history) > MAX_CONVERSATION_HISTORY:
-        conversations[call_sid] = history[-MAX_CONVERSATION_HISTORY:]
+    """تحديث تاريخ المحادثة (الحد من الطول داخل المخزن)"""
+    conversations.append_turn(call_sid, user_message, assistant_message)
 
 def clear_conversation(call_sid):
     """حذف محادثة"""
-    if call_sid in conversations:
-        del conversations[call_sid]
+    conversations.clear(call_sid)
+    call_contexts.invalidate(call_sid)
+    with _assistants_lock:
+        call_assistants.pop(call_sid, None)
+
+# ==========================
+# 📦 سياق المكالمات
+# ==========================
+# يُجهز عند /voice أثناء رسالة الترحيب: المستخدم، مستنداته، البرومت، ورد "وش عندي من جديد"
+call_contexts = CallContextCache()
+
+# أسئلة الخدمات العامة جاهزة من أول مكالمة
+seed_faq_cache()
+
+# ==========================
+# 🧭 التوجيه المحلي
+# ==========================
+# SmartAssistant لكل مكالمة يجاوب على النوايا المعروفة (الجديد، المحفظة، التجديد، التذكير)
+# بدون نموذج. حالته (المستند قيد التجديد) تُحفظ في مخزن الجلسات لأي عامل.
+call_assistants = OrderedDict()
+_assistants_lock = threading.Lock()
+
+def get_call_assistant(call_sid, phone_number, context=None):
+    """المساعد الخاص بالمكالمة (يُنشأ من السياق المجهز إن وجد)"""
+    with _assistants_lock:
+        assistant = call_assistants.get(call_sid)
+        if assistant is not None and assistant.phone_number == phone_number:
+            call_assistants.move_to_end(call_sid)
+            return assistant
+    
+    if context is not None and context.phone_number == phone_number:
+        assistant = SmartAssistant.from_context(context)
+    else:
+        assistant = SmartAssistant(phone_number)
+    
+    with _assistants_lock:
+        call_assistants[call_sid] = assistant
+        while len(call_assistants) > SESSION_MAX_ENTRIES:
+            call_assistants.popitem(last=False)
+    
+    return assistant
+
+@latency.timed("intent_routing")
+def route_turn(call_sid, phone_number, user_speech, context=None, turn=None):
+    """
+    محاولة الرد محلياً عبر المساعد الخاص بالمكالمة
+    
+    Args:
+        turn: رقم الدور المقروء قبل قفل المكالمة (get_turn_number) - مفتاح منع تكرار التجديد
+    
+    Returns:
+        الرد، أو None إذا كان السؤال مفتوحاً ويحتاج النموذج
+    """
+    
+    assistant = get_call_assistant(call_sid, phone_number, context)
+    
+    state = conversations.get_state(call_sid)
+    assistant.restore_state(state.get("assistant"))
+    
+    previous = assistant.to_state()
+    reply = assistant.route(user_speech, idempotency_key(call_sid, turn) if turn is not None else None)
+    
+    # الرد المحلي يزيد رقم الدور؛ وحتى دور النموذج يحفظ إلغاء التجديد المعلق
+    if reply is not None:
+        state["turn"] = state.get("turn", 0) + 1
+    if reply is not None or assistant.to_state() != previous:
+        state["assistant"] = assistant.to_state()
+        conversations.set_state(call_sid, state)
+    
+    return reply
+
+def get_turn_number(call_sid):
+    """
+    رقم الدور الحالي في المكالمة (عدد الأدوار المجابة محلياً)
+    
+    يُقرأ قبل قفل المكالمة: إعادة Twilio لنفس الطلب أثناء تنفيذه تقرأ نفس الرقم
+    فتحصل على نفس مفتاح العملية، بينما الدور التالي يقرأ رقماً جديداً.
+    """
+    return conversations.get_state(call_sid).get("turn", 0)
+
+def is_awaiting_confirmation(call_sid):
+    """هل المساعد ينتظر تأكيد تجديد في هذه المكالمة؟"""
+    return bool(conversations.get_state(call_sid).get("assistant", {}).get("current_renewal"))
+
+# ==========================
+# ⏱️ مهلة الدور
+# ==========================
+# توليد الرد يتم في خيوط منفصلة حتى نرجع لـ Twilio خلال TURN_DEADLINE_SECONDS مهما تأخر النموذج
+turn_executor = ThreadPoolExecutor(max_workers=TURN_WORKERS, thread_name_prefix="turn")
 
 # ==========================
 # 📞 Webhook - استقبال المكالمة
 # ==========================
 @app.route("/voice", methods=['GET', 'POST'])
+@latency.timed("call_start")
 def voice_webhook():
     """
     نقطة البداية - استقبال المكالمة
@@ -59,154 +170,312 @@ def voice_webhook():
     
     try:
         call_sid = request.values.get('CallSid', 'unknown')
-        caller_number = request.values.get('From', 'unknown')
-        
-        # طباعة معلومات المكالمة
-        print("=" * 70)
-        print(f"📞 مكالمة جديدة")
-        print(f"   Call SID: {call_sid}")
-        print(f"   من: {caller_number}")
-        print(f"   الوقت: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-        print("=" * 70)
-        
-        # تهيئة المحادثة
-        get_conversation(call_sid)
-        
-        # التعرف على المستخدم
-        user = get_user_by_phone(caller_number)
-        
-        # بناء الرد
-        response = VoiceResponse()
-        
-        # جمع الكلام
-        gather = Gather(
-            input='speech',
-            language=VOICE_LANGUAGE,
-            timeout=SPEECH_TIMEOUT,
-            speech_timeout='auto',
-            action='/handle-speech',
-            method='POST',
-            hints=SPEECH_HINTS
-        )
-        
-        # رسالة ترحيب مخصصة
-        if user:
-            greeting = get_greeting(user)
-        else:
-            greeting = GREETING_MESSAGE
         
-        gather.say(greeting, language=VOICE_LANGUAGE, voice=VOICE_NAME)
-        response.append(gather)
-        
-        # إذا لم يتكلم المستخدم
-        response.say(TIMEOUT_MESSAGE, language=VOICE_LANGUAGE, voice=VOICE_NAME)
-        response.hangup()
-        
-        return Response(str(response), mimetype='text/xml')
+        return Response(start_call(call_sid, get_caller_number(request.values)), mimetype='text/xml')
         
     except Exception as e:
         print(f"❌ خطأ في /voice: {e}")
         return create_error_response()
 
+def get_caller_number(values, default='unknown'):
+    """رقم المستخدم: From في المكالمة الواردة، و To في الصادرة (حملات الاتصال)"""
+    if values.get('Direction', '').startswith('outbound'):
+        return values.get('To') or default
+    return values.get('From') or default
+
+def start_call(call_sid, caller_number):
+    """
+    بداية المكالمة: تهيئة الجلسة ورسالة الترحيب
+    
+    Returns:
+        TwiML كنص (مشتركة بين app و app_async)
+    """
+    
+    # طباعة معلومات المكالمة
+    console(f"📞 مكالمة جديدة {call_sid} من {caller_number}", level=1)
+    console("=" * 70)
+    console(f"📞 مكالمة جديدة")
+    console(f"   Call SID: {call_sid}")
+    console(f"   من: {caller_number}")
+    console(f"   الوقت: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    console("=" * 70)
+    
+    # تهيئة المحادثة (الحالة محفوظة في المخزن المشترك لأي عامل يستقبل الطلب التالي)
+    conversations.set_state(call_sid, {"caller": caller_number})
+    
+    # التعرف على المستخدم
+    with latency.time("user_lookup"):
+        user = get_user_by_phone(caller_number)
+    
+    # تجهيز سياق المكالمة في الخلفية بينما رسالة الترحيب تُقال
+    call_contexts.prefetch(call_sid, caller_number, user)
+    
+    # رسالة ترحيب مخصصة
+    if user:
+        greeting = get_greeting(user)
+    else:
+        greeting = GREETING_MESSAGE
+    
+    call_journal.record(turn_event(call_sid, caller_number, "", greeting, "greeting", event="start", known_user=bool(user)))
+    
+    return build_speech_twiml(greeting)
+
 # ==========================
 # 🗣️ Webhook - معالجة الكلام
 # ==========================
 @app.route("/handle-speech", methods=['POST'])
+@latency.timed("turn_total")
 def handle_speech():
     """
     معالجة كلام المستخدم وتوليد الرد
     """
     
     try:
+        started = time.perf_counter()
         call_sid = request.values.get('CallSid', 'unknown')
         user_speech = request.values.get('SpeechResult', '').strip()
+        caller = get_caller_number(request.values, None)
         
-        print(f"\n🗣️ المستخدم قال: '{user_speech}'")
+        # كلام فارغ أو كلمة إنهاء
+        early_twiml = begin_turn(call_sid, user_speech, caller)
+        if early_twiml:
+            return Response(early_twiml, mimetype='text/xml')
         
-        # إذا لم يُفهم الكلام
-        if not user_speech:
-            print("⚠️ لم يتم فهم الكلام")
-            return create_repeat_response()
-        
-        # فحص كلمات الإنهاء
-        if is_exit_command(user_speech):
-            print("👋 إنهاء المكالمة")
-            clear_conversation(call_sid)
-            return create_farewell_response()
-        
-        # معالجة الطلبات الخاصة (تجديد، استعلام، إلخ)
-        special_response = handle_special_requests(user_speech)
-        
-        # توليد الرد من AI
-        history = get_conversation(call_sid)
+        # قفل المكالمة: طلبان متداخلان لنفس المكالمة (إعادة إرسال Twilio مثلاً) ينفذان بالترتيب
+        # capture: أزمنة مراحل هذا الدور لسجل المكالمات
+        deferred = None
+        turn = get_turn_number(call_sid)
+        with latency.capture() as timings, conversations.lock(call_sid):
+            context = call_contexts.get(call_sid)
+            phone_number = caller or conversations.get_state(call_sid).get("caller")
+            turn_info = {"caller": phone_number, "timings": timings, "started": started}
+            
+            # معالجة الطلبات المعروفة محلياً (الجديد، المحفظة، التجديد، التذكير)
+            special_response = route_turn(call_sid, phone_number, user_speech, context, turn)
+            
+            if special_response:
+                console("🧭 رد محلي بدون نموذج")
+                twiml = finish_turn(call_sid, user_speech, special_response, dict(turn_info, route="local"))
+            else:
+                # سؤال مفتوح: توليد الرد من AI (بنسخة من السياق حتى تُحسب أزمنة النموذج لهذا الدور)
+                history = get_conversation(call_sid)
+                future = turn_executor.submit(
+                    contextvars.copy_context().run, generate_response, user_speech, phone_number, history, context
+                )
+                try:
+                    ai_reply = future.result(timeout=TURN_DEADLINE_SECONDS)
+                    twiml = finish_turn(call_sid, user_speech, ai_reply, dict(turn_info, route="model"))
+                except FutureTimeout:
+                    # الرد متأخر: جملة انتظار الآن، والرد يكمل في الخلفية
+                    turn_id = defer_turn(call_sid, user_speech)
+                    deferred = (future, turn_id, dict(turn_info, route="deferred"))
+                    twiml = filler_twiml(turn_id)
         
-        if special_response:
-            ai_reply = special_response
-        else:
-            ai_reply = generate_response(user_speech, history)
+        # خارج القفل: إذا انتهى التوليد في هذه اللحظة ينفذ الاستدعاء فوراً في نفس الخيط
+        if deferred:
+            future, turn_id, turn_info = deferred
+            future.add_done_callback(partial(complete_deferred_turn, call_sid, turn_id, user_speech, turn_info=turn_info))
         
-        # تنسيق الأرقام للنطق
-        ai_reply = format_numbers_for_speech(ai_reply)
+        return Response(twiml, mimetype='text/xml')
         
-        print(f"🤖 الرد: {ai_reply}")
+    except Exception as e:
+        print(f"❌ خطأ في /handle-speech: {e}")
+        return create_error_response()
+
+# ==========================
+# ⏳ Webhook - انتظار الرد المتأخر
+# ==========================
+@app.route("/poll-reply", methods=['GET', 'POST'])
+def poll_reply():
+    """
+    Twilio يرجع هنا بعد جملة الانتظار
+    يقدّم الرد فور جاهزيته، وإلا ينتظر ثانية ويعيد المحاولة
+    """
+    
+    try:
+        call_sid = request.values.get('CallSid', 'unknown')
+        turn_id = request.values.get('turn', '')
         
-        # حفظ في التاريخ
-        update_conversation(call_sid, user_speech, ai_reply)
+        return Response(poll_turn(call_sid, turn_id), mimetype='text/xml')
         
-        # بناء الرد
-        response = VoiceResponse()
+    except Exception as e:
+        print(f"❌ خطأ في /poll-reply: {e}")
+        return create_error_response()
+
+def defer_turn(call_sid, user_speech):
+    """
+    تسجيل دور ينتظر رده في حالة الجلسة (مشتركة بين العمليات)
+    
+    Returns:
+        رقم الدور المستخدم في رابط الانتظار
+    """
+    
+    turn_id = uuid.uuid4().hex[:12]
+    state = conversations.get_state(call_sid)
+    state["pending"] = {"turn": turn_id, "speech": user_speech, "started": time.time()}
+    conversations.set_state(call_sid, state)
+    
+    console(f"⏳ الرد تأخر أكثر من {TURN_DEADLINE_SECONDS} ثانية - يكمل في الخلفية (دور {turn_id})")
+    return turn_id
+
+def complete_deferred_turn(call_sid, turn_id, user_speech, future, turn_info=None):
+    """حفظ الرد المتأخر عند جاهزيته ليقدمه /poll-reply"""
+    
+    try:
+        ai_reply = future.result()
+    except Exception as e:
+        print(f"❌ خطأ في توليد الرد المتأخر: {e}")
+        ai_reply = ERROR_MESSAGE
+    
+    with conversations.lock(call_sid):
+        state = conversations.get_state(call_sid)
+        pending = state.get("pending")
         
-        gather = Gather(
-            input='speech',
-            language=VOICE_LANGUAGE,
-            timeout=SPEECH_TIMEOUT,
-            speech_timeout='auto',
-            action='/handle-speech',
-            method='POST',
-            hints=SPEECH_HINTS
-        )
+        # المكالمة انتهت أو الدور أُلغي
+        if not pending or pending["turn"] != turn_id:
+            return
         
-        gather.say(ai_reply, language=VOICE_LANGUAGE, voice=VOICE_NAME)
-        response.append(gather)
+        pending["reply"] = record_turn(call_sid, user_speech, ai_reply, turn_info)
+        conversations.set_state(call_sid, state)
+
+def poll_turn(call_sid, turn_id):
+    """
+    حالة الدور المتأخر
+    
+    Returns:
+        TwiML الرد إذا جهز، أو انتظار وإعادة توجيه، أو خطأ بعد TURN_MAX_WAIT_SECONDS
+    """
+    
+    with conversations.lock(call_sid):
+        state = conversations.get_state(call_sid)
+        pending = state.get("pending")
         
-        # إذا لم يرد المستخدم
-        response.say(TIMEOUT_MESSAGE, language=VOICE_LANGUAGE, voice=VOICE_NAME)
-        response.hangup()
+        if not pending or pending["turn"] != turn_id:
+            return error_twiml()
         
-        return Response(str(response), mimetype='text/xml')
+        if "reply" in pending:
+            del state["pending"]
+            conversations.set_state(call_sid, state)
+            return build_speech_twiml(pending["reply"])
         
-    except Exception as e:
-        print(f"❌ خطأ في /handle-speech: {e}")
-        return create_error_response()
+        if time.time() - pending["started"] > TURN_MAX_WAIT_SECONDS:
+            print(f"❌ انتهت مهلة الدور {turn_id}")
+            del state["pending"]
+            conversations.set_state(call_sid, state)
+            return error_twiml()
+    
+    return hold_twiml(turn_id)
+
+def begin_turn(call_sid, user_speech, caller=None):
+    """
+    الفحوصات قبل توليد الرد
+    
+    Returns:
+        TwiML إذا انتهى الدور هنا (كلام غير مفهوم أو إنهاء)، وإلا None
+    """
+    
+    console(f"\n🗣️ المستخدم قال: '{user_speech}'")
+    
+    # إذا لم يُفهم الكلام
+    if not user_speech:
+        console("⚠️ لم يتم فهم الكلام")
+        call_journal.record(turn_event(call_sid, caller, user_speech, NO_SPEECH_MESSAGE, "no_speech"))
+        return repeat_twiml()
+    
+    # فحص كلمات الإنهاء ("تمام" بعد سؤال التجديد تأكيد وليست إنهاء)
+    intents = match_intents(user_speech)
+    if intents.is_exit and not ("confirm" in intents and is_awaiting_confirmation(call_sid)):
+        console("👋 إنهاء المكالمة")
+        call_journal.record(turn_event(call_sid, caller, user_speech, FAREWELL_MESSAGE, "exit", event="end"))
+        clear_conversation(call_sid)
+        return farewell_twiml()
+    
+    return None
+
+def finish_turn(call_sid, user_speech, ai_reply, turn_info=None):
+    """
+    تنسيق الرد وحفظه في التاريخ
+    
+    Returns:
+        TwiML الرد
+    """
+    
+    return build_speech_twiml(record_turn(call_sid, user_speech, ai_reply, turn_info))
+
+def record_turn(call_sid, user_speech, ai_reply, turn_info=None):
+    """
+    تنسيق الأرقام للنطق وحفظ الدور في التاريخ وسجل المكالمات
+    
+    Args:
+        turn_info: المتصل وطريقة الرد وأزمنة المراحل وبداية الدور (لسجل المكالمات)
+    
+    Returns:
+        الرد بعد التنسيق
+    """
+    
+    # تنسيق الأرقام للنطق
+    with latency.time("number_format"):
+        ai_reply = format_numbers_for_speech(ai_reply)
+    
+    console(f"🤖 الرد: {ai_reply}")
+    
+    # حفظ في التاريخ
+    update_conversation(call_sid, user_speech, ai_reply)
+    
+    if turn_info:
+        event = turn_event(
+            call_sid, turn_info["caller"], user_speech, ai_reply, turn_info["route"],
+            turn_info["timings"], turn_info["started"]
+        )
+        call_journal.record(event)
+        console(f"🗣️ {call_sid} [{event['route']}] {event['duration_ms']:.0f} ms", level=1)
+    
+    return ai_reply
 
 # ==========================
 # 🔧 دوال مساعدة
 # ==========================
 def is_exit_command(text):
     """التحقق من كلمات الإنهاء"""
-    text_lower = text.lower()
-    return any(keyword in text_lower for keyword in EXIT_KEYWORDS)
+    return match_intents(text).is_exit
+
+
+@latency.timed("twiml_render")
+def build_speech_twiml(text):
+    """رد يقول النص ثم ينتظر كلام المستخدم، وينهي المكالمة إذا لم يرد (قالب جاهز)"""
+    return twiml_templates.speech_twiml(text)
+
+def filler_twiml(turn_id):
+    """جملة انتظار قصيرة ثم إعادة توجيه لـ /poll-reply"""
+    return twiml_templates.filler_twiml(turn_id)
+
+def hold_twiml(turn_id):
+    """انتظار صامت ثم إعادة المحاولة"""
+    return twiml_templates.hold_twiml(turn_id)
+
+def error_twiml():
+    """TwiML رد الخطأ (جاهز من بداية التشغيل)"""
+    return twiml_templates.ERROR_TWIML
+
+def repeat_twiml():
+    """TwiML طلب الإعادة"""
+    return twiml_templates.REPEAT_TWIML
+
+def farewell_twiml():
+    """TwiML الوداع"""
+    return twiml_templates.FAREWELL_TWIML
 
 def create_error_response():
     """إنشاء رد خطأ"""
-    response = VoiceResponse()
-    response.say(ERROR_MESSAGE, language=VOICE_LANGUAGE, voice=VOICE_NAME)
-    response.hangup()
-    return Response(str(response), mimetype='text/xml')
+    return Response(error_twiml(), mimetype='text/xml')
 
 def create_repeat_response():
     """إنشاء رد لطلب الإعادة"""
-    response = VoiceResponse()
-    response.say(NO_SPEECH_MESSAGE, language=VOICE_LANGUAGE, voice=VOICE_NAME)
-    response.redirect('/voice', method='POST')
-    return Response(str(response), mimetype='text/xml')
+    return Response(repeat_twiml(), mimetype='text/xml')
 
 def create_farewell_response():
     """إنشاء رد الوداع"""
-    response = VoiceResponse()
-    response.say(FAREWELL_MESSAGE, language=VOICE_LANGUAGE, voice=VOICE_NAME)
-    response.hangup()
-    return Response(str(response), mimetype='text/xml')
+    return Response(farewell_twiml(), mimetype='text/xml')
 
 # ==========================
 # 🧪 صفحات الاختبار
@@ -214,20 +483,38 @@ def create_farewell_response():
 @app.route("/test", methods=['GET'])
 def test_page():
     """صفحة اختبار TwiML"""
-    response = VoiceResponse()
-    response.say("اختبار. السيرفر يعمل بنجاح!", language=VOICE_LANGUAGE, voice=VOICE_NAME)
-    return Response(str(response), mimetype='text/xml')
+    return Response(twiml_templates.TEST_TWIML, mimetype='text/xml')
 
 @app.route("/status", methods=['GET'])
 def status_page():
     """صفحة حالة النظام"""
-    return jsonify({
+    return jsonify(get_status())
+
+@app.route("/metrics", methods=['GET'])
+def metrics_page():
+    """زمن كل مرحلة بصيغة Prometheus"""
+    return Response(latency.render_prometheus(), content_type=PROMETHEUS_CONTENT_TYPE)
+
+def get_status():
+    """معلومات حالة النظام"""
+    return {
         "status": "active",
         "platform": platform.system(),
         "python_version": sys.version,
         "active_conversations": len(conversations),
+        "sessions": conversations.stats(),
+        "call_contexts": call_contexts.stats(),
+        "prompt_cache": get_prompt_cache_stats(),
+        "llm_backend": llm.stats(),
+        "llm_guard": llm_guard.stats(),
+        "faq_cache": faq_cache.stats(),
+        "users": users.stats(),
+        "reminders": reminder_scheduler.stats(),
+        "transactions": get_transaction_stats(),
+        "call_journal": call_journal.stats(),
+        "latency": latency.summary(),
         "timestamp": datetime.now().isoformat()
-    })
+    }
 
 @app.route("/")
 def home_page():
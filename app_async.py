@@ -0,0 +1,211 @@
+"""
+وضع التشغيل غير المتزامن - نفس webhooks التطبيق الرئيسي على Quart
+عملية واحدة تخدم مئات المكالمات التي تنتظر رد النموذج في نفس الوقت
+
+التشغيل:
+    hypercorn app_async:app --bind 0.0.0.0:5000
+"""
+
+import sys
+import time
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from functools import partial
+from quart import Quart, request, Response, jsonify
+
+from config import FLASK_HOST, FLASK_PORT, TURN_DEADLINE_SECONDS, TURN_WORKERS, validate_config
+from assistant import generate_response_async
+from metrics import latency, PROMETHEUS_CONTENT_TYPE
+from app import (
+    start_call, get_caller_number, begin_turn, finish_turn, get_conversation, get_status,
+    defer_turn, complete_deferred_turn, poll_turn, filler_twiml, route_turn, get_turn_number,
+    conversations, call_contexts, error_twiml, print_startup_info
+)
+
+app = Quart(__name__)
+
+# ==========================
+# 🧵 الكود المتزامن
+# ==========================
+# مخزن الجلسات (SQLite)، التجديد (أقفال وكتابة)، وأقفال المكالمات كلها متزامنة:
+# تُنفذ في خيوط حتى لا يتوقف الـ event loop وكل المكالمات الأخرى معه
+sync_executor = ThreadPoolExecutor(max_workers=TURN_WORKERS, thread_name_prefix="sync")
+
+async def run_sync(function, *args, **kwargs):
+    """تشغيل دالة متزامنة في خيط بنفس السياق (أزمنة مراحل الدور)"""
+    return await _run_in(sync_executor, function, *args, **kwargs)
+
+async def _run_in(executor, function, *args, **kwargs):
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(
+        executor, partial(context.run, function, *args, **kwargs)
+    )
+
+# ==========================
+# 🔒 أقفال المكالمات
+# ==========================
+# الطلبات المتداخلة لنفس المكالمة داخل العملية تنتظر على asyncio.Lock بدون خيط،
+# وكل ما قد ينتظر قفل المخزن (حجز الماسك، poll_turn، complete_deferred_turn) في مجموعة
+# خيوط خاصة، فالمنتظرون لا يستهلكون خيوط sync_executor التي يحتاجها الماسك للتحرير
+lock_executor = ThreadPoolExecutor(max_workers=TURN_WORKERS, thread_name_prefix="call-lock")
+call_waiters = {}  # call_sid -> [asyncio.Lock، عدد المنتظرين]
+
+async def run_locked(function, *args, **kwargs):
+    """مثل run_sync لدالة تحجز قفل المكالمة بنفسها (قد تنتظر)"""
+    return await _run_in(lock_executor, function, *args, **kwargs)
+
+@asynccontextmanager
+async def call_lock(call_sid):
+    """
+    نفس قفل المكالمة في app.py (conversations.lock - صف SQLite بين العمليات)،
+    لكن الحجز والتحرير في خيوط بدل الانتظار على الـ event loop
+    """
+    entry = call_waiters.setdefault(call_sid, [asyncio.Lock(), 0])
+    entry[1] += 1
+    try:
+        async with entry[0]:
+            lock = conversations.lock(call_sid)
+            acquiring = asyncio.ensure_future(run_locked(lock.__enter__))
+            try:
+                await asyncio.shield(acquiring)
+            except asyncio.CancelledError:
+                # الحجز يكمل في خيطه - نحرره فور اكتماله
+                acquiring.add_done_callback(
+                    lambda future: future.cancelled() or future.exception() or
+                    asyncio.ensure_future(run_sync(lock.__exit__, None, None, None))
+                )
+                raise
+
+            try:
+                yield
+            finally:
+                # التحرير يكمل في خيطه حتى لو أُلغي الطلب
+                await asyncio.shield(asyncio.ensure_future(run_sync(lock.__exit__, None, None, None)))
+    finally:
+        entry[1] -= 1
+        if entry[1] == 0:
+            del call_waiters[call_sid]
+
+def xml_response(twiml):
+    return Response(twiml, mimetype='text/xml')
+
+def _complete_deferred(call_sid, turn_id, user_speech, turn_info, task):
+    """اكتمال التوليد المتأخر: الحفظ (يحجز قفل المكالمة) في خيط"""
+    asyncio.ensure_future(run_locked(complete_deferred_turn, call_sid, turn_id, user_speech, task, turn_info=turn_info))
+
+# ==========================
+# 📞 Webhooks
+# ==========================
+@app.route("/voice", methods=['GET', 'POST'])
+@latency.timed("call_start")
+async def voice_webhook():
+    """استقبال المكالمة"""
+
+    try:
+        values = await request.values
+        return xml_response(await run_sync(start_call, values.get('CallSid', 'unknown'), get_caller_number(values)))
+
+    except Exception as e:
+        print(f"❌ خطأ في /voice: {e}")
+        return xml_response(error_twiml())
+
+def _route_locked_turn(call_sid, caller, user_speech, turn):
+    """الجزء المتزامن داخل القفل: السياق، التوجيه المحلي، أو التاريخ للنموذج"""
+    # بدون انتظار: إذا لم يكتمل السياق بعد يُبنى داخل generate_response_async
+    context = call_contexts.get(call_sid, timeout=0)
+    phone_number = caller or conversations.get_state(call_sid).get("caller")
+
+    # النوايا المعروفة تُجاب محلياً في أجزاء من الملي ثانية
+    special_response = route_turn(call_sid, phone_number, user_speech, context, turn)
+    history = None if special_response else get_conversation(call_sid)
+    return context, phone_number, special_response, history
+
+@app.route("/handle-speech", methods=['POST'])
+@latency.timed("turn_total")
+async def handle_speech():
+    """معالجة كلام المستخدم - الانتظار على النموذج لا يحجز خيطاً"""
+
+    try:
+        started = time.perf_counter()
+        values = await request.values
+        call_sid = values.get('CallSid', 'unknown')
+        user_speech = values.get('SpeechResult', '').strip()
+
+        caller = get_caller_number(values, None)
+
+        early_twiml = await run_sync(begin_turn, call_sid, user_speech, caller)
+        if early_twiml:
+            return xml_response(early_twiml)
+
+        turn = await run_sync(get_turn_number, call_sid)
+        # المهمة تنسخ السياق عند إنشائها فتُحسب أزمنة النموذج لنفس الدور
+        with latency.capture() as timings:
+            async with call_lock(call_sid):
+                context, phone_number, special_response, history = await run_sync(
+                    _route_locked_turn, call_sid, caller, user_speech, turn
+                )
+                turn_info = {"caller": phone_number, "timings": timings, "started": started}
+
+                if special_response:
+                    return xml_response(await run_sync(
+                        finish_turn, call_sid, user_speech, special_response, dict(turn_info, route="local")
+                    ))
+
+                task = asyncio.ensure_future(generate_response_async(user_speech, phone_number, history, context, run_sync))
+                try:
+                    # shield: انتهاء المهلة لا يلغي التوليد
+                    ai_reply = await asyncio.wait_for(asyncio.shield(task), TURN_DEADLINE_SECONDS)
+                    twiml = await run_sync(finish_turn, call_sid, user_speech, ai_reply, dict(turn_info, route="model"))
+                except asyncio.TimeoutError:
+                    turn_id = await run_sync(defer_turn, call_sid, user_speech)
+                    task.add_done_callback(partial(
+                        _complete_deferred, call_sid, turn_id, user_speech, dict(turn_info, route="deferred")
+                    ))
+                    twiml = filler_twiml(turn_id)
+
+        return xml_response(twiml)
+
+    except Exception as e:
+        print(f"❌ خطأ في /handle-speech: {e}")
+        return xml_response(error_twiml())
+
+@app.route("/poll-reply", methods=['GET', 'POST'])
+async def poll_reply():
+    """انتظار الرد المتأخر"""
+
+    try:
+        values = await request.values
+        return xml_response(await run_locked(poll_turn, values.get('CallSid', 'unknown'), values.get('turn', '')))
+
+    except Exception as e:
+        print(f"❌ خطأ في /poll-reply: {e}")
+        return xml_response(error_twiml())
+
+@app.route("/status", methods=['GET'])
+async def status_page():
+    """صفحة حالة النظام"""
+    status = await run_sync(get_status)
+    status["mode"] = "async"
+    return jsonify(status)
+
+@app.route("/metrics", methods=['GET'])
+async def metrics_page():
+    """زمن كل مرحلة بصيغة Prometheus"""
+    return Response(latency.render_prometheus(), content_type=PROMETHEUS_CONTENT_TYPE)
+
+# ==========================
+# 🚀 تشغيل التطبيق
+# ==========================
+if __name__ == "__main__":
+    if not validate_config():
+        print("\n⚠️ يرجى تكملة الإعدادات في ملف .env قبل التشغيل.\n")
+        sys.exit(1)
+
+    print_startup_info()
+
+    try:
+        app.run(host=FLASK_HOST, port=FLASK_PORT)
+    except KeyboardInterrupt:
+        print("\n\n👋 تم إيقاف السيرفر. مع السلامة!")
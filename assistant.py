@@ -3,15 +3,74 @@
 يعرف المستخدم ويتعامل معه بشكل شخصي
 """
 
-from openai import OpenAI
-from config import OPENAI_API_KEY, OPENAI_MODEL, OPENAI_TEMPERATURE, OPENAI_MAX_TOKENS, OPENAI_TIMEOUT
-from data import get_user_by_phone, get_expiring_documents, renew_document, create_reminder
-from prompts import build_system_prompt, get_whats_new_message, RENEWAL_CONFIRMATION, RENEWAL_SUCCESS, INSUFFICIENT_FUNDS, REMINDER_SET
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+from config import (
+    OPENAI_MODEL, OPENAI_TEMPERATURE, OPENAI_MAX_TOKENS, OPENAI_TIMEOUT, STREAM_MIN_CLAUSE_CHARS,
+    FAQ_CACHE_TTL, FAQ_CACHE_MAX_ENTRIES, FAQ_CACHE_SIMILARITY
+)
+from data import (
+    get_user_by_phone, get_expiring_documents, renew_document, renew_documents, quote_renewals, create_reminder,
+    get_document_name_ar, ABSHER_SERVICES
+)
+from intents import match_intents, normalize_arabic, ACTION_INTENTS
+from number_converter import convert_text_numbers
+from metrics import latency
+from llm_backend import create_llm_backend
+from llm_guard import LLMGuard, CircuitOpenError
+from prompts import (
+    build_system_prompt, get_whats_new_message, RENEWAL_CONFIRMATION, RENEWAL_SUCCESS, INSUFFICIENT_FUNDS, REMINDER_SET,
+    BULK_RENEWAL_CONFIRMATION, BULK_RENEWAL_SUCCESS, RENEWAL_DECLINED, PARTIAL_RENEWAL_NOTE, DOCUMENT_NOT_DUE
+)
 
-# تهيئة OpenAI
-openai_client = None
-if OPENAI_API_KEY:
-    openai_client = OpenAI(api_key=OPENAI_API_KEY)
+# مزود النماذج (LLM_BACKEND): المحادثة هنا، والصوت في الوضع المحلي - نفس النسخة للاثنين
+llm = create_llm_backend()
+
+# استدعاءات المحادثة عبر الحماية: طلب مكرر عند تجاوز p95، وقاطع دائرة يحول للرد الاحتياطي
+llm_guard = LLMGuard(llm)
+llm_guard.register_metrics()
+
+# ==========================
+# 📊 كاش البرومت عند المزود
+# ==========================
+# الجزء الثابت من البرومت يتكرر بنفس البايتات، فالمزود يحسبه من الكاش (cached_tokens)
+prompt_cache_stats = {"requests": 0, "prompt_tokens": 0, "cached_tokens": 0}
+_usage_lock = threading.Lock()
+
+def record_usage(usage):
+    """تسجيل عدد التوكنات المرسلة والمحسوبة من الكاش من رد النموذج (قاموس ChatReply.usage)"""
+    if usage is None:
+        return
+    
+    with _usage_lock:
+        prompt_cache_stats["requests"] += 1
+        prompt_cache_stats["prompt_tokens"] += usage["prompt_tokens"]
+        prompt_cache_stats["cached_tokens"] += usage["cached_tokens"]
+
+def get_prompt_cache_stats():
+    """إحصائيات كاش البرومت مع نسبة التوكنات المحسوبة من الكاش"""
+    with _usage_lock:
+        stats = dict(prompt_cache_stats)
+    stats["cached_ratio"] = round(stats["cached_tokens"] / stats["prompt_tokens"], 3) if stats["prompt_tokens"] else 0.0
+    return stats
+
+# ==========================
+# 📄 المستندات المذكورة في الطلب
+# ==========================
+# مقاطع من اسم كل نوع بعد التوحيد (تطابق "الهويه"، "هويتي"، "والجواز"، "رخصه القياده"...)
+DOCUMENT_STEMS = {
+    "national_id": ("هويه", "هويت", "بطاق"),
+    "passport": ("جواز",),
+    "drivers_license": ("رخص", "قياد"),
+    "iqama": ("اقام",)
+}
+
+def named_document_types(user_text):
+    """أنواع المستندات المذكورة في كلام المستخدم"""
+    text = normalize_arabic(user_text)
+    return {doc_type for doc_type, stems in DOCUMENT_STEMS.items() if any(stem in text for stem in stems)}
 
 # ==========================
 # 🧠 المساعد الذكي
@@ -29,11 +88,79 @@ class SmartAssistant:
         self.user = get_user_by_phone(phone_number)
         self.phone_number = phone_number
         self.expiring_docs = None
-        self.current_renewal = None  # المستند قيد التجديد
+        self.current_renewal = None  # المستند قيد التجديد (أو type="bulk" لكل المستندات)
+        self.whats_new = None  # رد 'وش عندي من جديد' الجاهز (من سياق المكالمة)
         
         if self.user:
             self.expiring_docs = get_expiring_documents(self.user)
     
+    @classmethod
+    def from_context(cls, context):
+        """
+        إنشاء المساعد من سياق مكالمة مجهز مسبقاً (بدون أي بحث في البيانات)
+        
+        Args:
+            context: CallContext
+        """
+        assistant = cls.__new__(cls)
+        assistant.user = context.user
+        assistant.phone_number = context.phone_number
+        assistant.expiring_docs = context.expiring_docs if context.user else None
+        assistant.current_renewal = None
+        assistant.whats_new = context.whats_new
+        return assistant
+    
+    def to_state(self):
+        """حالة المحادثة القابلة للحفظ في مخزن الجلسات (JSON)"""
+        return {"current_renewal": self.current_renewal}
+    
+    def restore_state(self, state):
+        """استرجاع الحالة المحفوظة (قد يكون الطلب السابق عند عامل آخر)"""
+        self.current_renewal = (state or {}).get("current_renewal")
+    
+    def route(self, user_text, turn_key=None):
+        """
+        توجيه الطلبات المعروفة محلياً بدون نموذج
+        
+        Args:
+            user_text: نص المستخدم
+            turn_key: مفتاح الدور (رقم المكالمة والدور) لمنع تكرار التجديد عند إعادة الطلب
+        
+        Returns:
+            الرد، أو None إذا كان الطلب مفتوحاً ويحتاج النموذج
+        """
+        if not self.user:
+            return None
+        
+        intents = match_intents(user_text)
+        
+        # التأكيد يخصم من المحفظة: فقط موافقة صريحة ("نعم"، "ايوه") في الدور التالي مباشرة وبدون نفي
+        # (match_intents تحذف التأكيد مع النفي) - أي كلام غيرها يلغي الطلب المعلق
+        if self.current_renewal:
+            if "confirm" in intents:
+                return self.handle_renewal_request(user_text, turn_key)
+            
+            self.current_renewal = None
+            if "negation" in intents and not intents.intents & ACTION_INTENTS - {"renewal"}:
+                return RENEWAL_DECLINED
+        
+        if "whats_new" in intents:
+            return self.handle_whats_new()
+        
+        if "renewal" in intents:
+            # "كيف اجدد رخصة القيادة" سؤال عن الطريقة لا طلب تجديد: جوابه من الكاش أو النموذج بدون عرض خصم
+            if is_general_question(user_text):
+                return lookup_faq(user_text)
+            return self.handle_renewal_request(user_text, turn_key)
+        
+        if "reminder" in intents:
+            return self.handle_reminder_request()
+        
+        if "wallet" in intents:
+            return self.handle_wallet_inquiry()
+        
+        return None
+    
     def get_greeting(self):
         """الحصول على رسالة ترحيب مخصصة"""
         from prompts import get_greeting
@@ -48,51 +175,50 @@ class SmartAssistant:
         if not self.user:
             return "أحتاج رقم جوالك أولاً للتعرف عليك."
         
-        return get_whats_new_message(self.user, self.expiring_docs)
+        if self.whats_new is None:
+            self.whats_new = get_whats_new_message(self.user, self.expiring_docs)
+        
+        return self.whats_new
     
-    def handle_renewal_request(self, user_text):
+    def handle_renewal_request(self, user_text, turn_key=None):
         """
         معالجة طلب التجديد
         
         Args:
             user_text: نص المستخدم
+            turn_key: مفتاح الدور - مع رقم المستند يصبح مفتاح منع تكرار العملية
         
         Returns:
             الرد المناسب
         """
-        user_lower = user_text.lower()
-        
-        # إذا لم يحدد مستند بعد
+        # إذا لم يحدد مستند بعد: المستند الذي ذكره، أو كل القريبة الانتهاء بعملية وحدة
         if not self.current_renewal:
-            # البحث عن أول مستند يحتاج تجديد
-            if self.expiring_docs:
-                self.current_renewal = self.expiring_docs[0]
-                
-                wallet_balance = self.user.get("family_wallet", {}).get("balance", 0)
-                
-                return RENEWAL_CONFIRMATION.format(
-                    document_type=self.current_renewal['name_ar'],
-                    fee=self.current_renewal['renewal_fee'],
-                    wallet_balance=wallet_balance
-                )
-            else:
+            if not self.expiring_docs:
                 return "كل مستنداتك سارية، ما فيه شي يحتاج تجديد الحين."
+            
+            documents = self.select_renewal_documents(user_text)
+            if not documents:
+                return DOCUMENT_NOT_DUE.format(
+                    document_type=" و".join(get_document_name_ar(doc_type) for doc_type in sorted(named_document_types(user_text)))
+                )
+            
+            return self.offer_renewal(documents)
         
-        # المستخدم قرر طريقة الدفع
-        use_wallet = any(word in user_lower for word in ["محفظة", "محفظتي", "العائلية", "نعم", "أيوه", "تمام"])
+        # المستخدم وافق على الدفع من المحفظة (route لا تصل هنا إلا بتأكيد صريح، والدفع الوحيد هنا المحفظة)
+        if self.current_renewal["type"] == "bulk":
+            return self.confirm_bulk_renewal(turn_key)
         
         # محاكاة التجديد
         result = renew_document(
             self.user,
             self.current_renewal['type'],
             self.current_renewal['number'],
-            use_wallet=use_wallet
+            use_wallet=True,
+            idempotency_key=f"{turn_key}:{self.current_renewal['number']}" if turn_key else None
         )
         
         if result["success"]:
-            wallet_message = ""
-            if use_wallet:
-                wallet_message = f"رصيدك الحالي: {result['wallet_balance']} ريال."
+            wallet_message = f"رصيدك الحالي: {result['wallet_balance']} ريال."
             
             response = RENEWAL_SUCCESS.format(
                 document_type=result['document_type'],
@@ -103,24 +229,159 @@ class SmartAssistant:
                 wallet_message=wallet_message
             )
             
-            # إعادة تعيين
+            # إعادة تعيين (المستودع قد يرجع قاموساً أحدث بعد التجديد)
             self.current_renewal = None
+            self.user = get_user_by_phone(self.user["phone"]) or self.user
             self.expiring_docs = get_expiring_documents(self.user)
+            self.whats_new = None
             
             return response
         else:
-            # فشل التجديد (غالباً رصيد غير كافي)
-            if "غير كافي" in result["message"]:
-                wallet_balance = self.user.get("family_wallet", {}).get("balance", 0)
-                fee = self.current_renewal['renewal_fee']
-                
+            return self.renewal_failure(result)
+    
+    def select_renewal_documents(self, user_text):
+        """
+        المستندات المطلوب تجديدها من القريبة الانتهاء
+        
+        "جدد الهوية" -> الهوية فقط، "جدد اقامة سلمان" -> إقامته فقط،
+        وبدون ذكر مستند -> كلها (بترتيب الأولوية)
+        
+        Returns:
+            قائمة المستندات - فارغة إذا كان المذكور غير قريب الانتهاء
+        """
+        named_types = named_document_types(user_text)
+        
+        # العامل باسمه يكفي ("جدد لمحمد خان")
+        words = set(normalize_arabic(user_text).split())
+        named_workers = {
+            doc["number"] for doc in self.expiring_docs
+            if doc["type"] == "iqama" and words & {word for word in normalize_arabic(doc["name_ar"]).split()[1:] if len(word) > 2}
+        }
+        
+        if not named_types and not named_workers:
+            return list(self.expiring_docs)
+        
+        def named(doc):
+            if doc["type"] == "iqama" and named_workers:
+                return doc["number"] in named_workers
+            return doc["type"] in named_types
+        
+        return [doc for doc in self.expiring_docs if named(doc)]
+    
+    def offer_renewal(self, documents):
+        """
+        عرض تجديد المستندات بسعرها من quote_renewals
+        
+        إذا كان المجموع أكبر من رصيد المحفظة نعرض الأهم فالأهم مما يكفيه الرصيد
+        (مستند واحد أو أكثر بعملية وحدة) ونذكر الباقي
+        """
+        quote = quote_renewals(self.user, documents)
+        fees = {item["doc_number"]: item["fee"] for item in quote["items"]}
+        documents = [doc for doc in documents if doc["number"] in fees]
+        
+        note = ""
+        if quote["shortage"]:
+            affordable, total = [], 0
+            for doc in documents:
+                if total + fees[doc["number"]] <= quote["wallet_balance"]:
+                    affordable.append(doc)
+                    total += fees[doc["number"]]
+            
+            if not affordable:
+                required = min(fees.values(), default=0)
                 return INSUFFICIENT_FUNDS.format(
-                    current_balance=wallet_balance,
-                    required_amount=fee,
-                    shortage=fee - wallet_balance
+                    current_balance=quote["wallet_balance"],
+                    required_amount=required,
+                    shortage=required - quote["wallet_balance"]
                 )
-            else:
-                return result["message"]
+            
+            note = PARTIAL_RENEWAL_NOTE.format(
+                wallet_balance=quote["wallet_balance"],
+                total_fee=quote["total_fee"],
+                remaining="، ".join(doc["name_ar"] for doc in documents if doc not in affordable)
+            )
+            documents = affordable
+            quote = quote_renewals(self.user, documents)
+        
+        if len(documents) == 1:
+            document = documents[0]
+            self.current_renewal = dict(document, renewal_fee=fees[document["number"]])
+            
+            return note + RENEWAL_CONFIRMATION.format(
+                document_type=document["name_ar"],
+                fee=fees[document["number"]],
+                wallet_balance=quote["wallet_balance"]
+            )
+        
+        self.current_renewal = {
+            "type": "bulk",
+            "name_ar": "كل المستندات",
+            "renewal_fee": quote["total_fee"],
+            "documents": [
+                {"type": doc["type"], "number": doc["number"], "name_ar": doc["name_ar"], "renewal_fee": fees[doc["number"]]}
+                for doc in documents
+            ]
+        }
+        
+        return note + BULK_RENEWAL_CONFIRMATION.format(
+            count=len(quote["items"]),
+            documents="\n".join(f"• {item['description']}: {item['fee']} ريال" for item in quote["items"]),
+            total_fee=quote["total_fee"],
+            wallet_balance=quote["wallet_balance"]
+        )
+    
+    def confirm_bulk_renewal(self, turn_key=None):
+        """تنفيذ التجديد الجماعي من المحفظة بعد تأكيد المستخدم"""
+        result = renew_documents(
+            self.user,
+            self.current_renewal["documents"],
+            use_wallet=True,
+            idempotency_key=f"{turn_key}:bulk" if turn_key else None
+        )
+        
+        if not result["success"]:
+            return self.renewal_failure(result)
+        
+        wallet_message = f"رصيدك الحالي: {result['wallet_balance']} ريال."
+        
+        response = BULK_RENEWAL_SUCCESS.format(
+            documents="\n".join(
+                f"• {doc['document_type']}: ينتهي {doc['new_expiry']}" for doc in result["documents"]
+            ),
+            total_fee=result["total_fee"],
+            reference_number=result["reference_number"],
+            wallet_message=wallet_message
+        )
+        
+        self.current_renewal = None
+        self.user = get_user_by_phone(self.user["phone"]) or self.user
+        self.expiring_docs = get_expiring_documents(self.user)
+        self.whats_new = None
+        
+        return response
+    
+    def renewal_failure(self, result):
+        """
+        رد فشل التجديد (غالباً رصيد غير كافي)
+        
+        الطلب المعلق يُلغى: "ايوه" بعدها لا تعيد نفس الخصم الفاشل،
+        والمستخدم يطلب التجديد من جديد بعد شحن المحفظة
+        """
+        renewal, self.current_renewal = self.current_renewal, None
+        
+        if "غير كافي" in result["message"]:
+            # الرصيد تغير بعد العرض - نقرأه من جديد
+            self.user = get_user_by_phone(self.user["phone"]) or self.user
+            wallet_balance = self.user.get("family_wallet", {}).get("balance", 0)
+            fee = renewal['renewal_fee']
+            
+            return INSUFFICIENT_FUNDS.format(
+                current_balance=wallet_balance,
+                required_amount=fee,
+                shortage=fee - wallet_balance
+            )
+        
+        return result["message"]
     
     def handle_reminder_request(self):
         """معالجة طلب تذكير"""
@@ -146,10 +407,291 @@ class SmartAssistant:
         wallet_balance = self.user.get("family_wallet", {}).get("balance", 0)
         return f"رصيد محفظتك العائلية: {wallet_balance} ريال."
 
+# ==========================
+# 📚 كاش الأسئلة العامة
+# ==========================
+# "وش خدمات أبشر؟" و"كيف اجدد رخصة القيادة؟" جوابها واحد لكل المتصلين،
+# فنحفظ الرد بعد أول مرة ونرجعه للصيغ القريبة بدون رحلة للنموذج
+
+# نوايا تعني أن السؤال عن بيانات المتصل نفسه
+PERSONAL_INTENTS = frozenset({"whats_new", "wallet", "reminder", "confirm"})
+
+# كلمات تدل على السؤال عن الطريقة لا طلب التنفيذ ("كيف اجدد" عامة، "جددها" شخصية)
+HOW_TO_WORDS = frozenset({"كيف", "طريقه", "خطوات", "شروط", "متطلبات", "وش", "ايش", "ويش", "هل"})
+
+# كلمات المتكلم (جوازي، عندي، لي...) - بعد التوحيد
+PERSONAL_WORDS = frozenset({
+    "عندي", "لي", "حقي", "حقتي", "جوازي", "اقامتي", "رخصتي", "هويتي", "بطاقتي", "تاشيرتي",
+    "مخالفاتي", "بياناتي", "اسرتي", "عائلتي", "زوجتي", "ولدي", "بنتي", "سايقي", "عمالتي",
+    "رقمي", "حسابي", "جددها", "جدده", "جددلي", "ذكرني"
+})
+
+# كلمات عامة في أسماء الخدمات لا تدل على موضوع بعينه
+_CATALOG_STOP_WORDS = frozenset({
+    "تجديد", "اصدار", "جديد", "طباعه", "نقل", "سداد", "تحديث", "خروج", "وعوده", "الاستعلام", "عن", "سفر", "خدمات"
+})
+
+def _topic_words(phrase):
+    """كلمات الموضوع في العبارة بعد التوحيد وبدون "ال" والكلمات العامة"""
+    topics = set()
+    for word in normalize_arabic(phrase).split():
+        if word in _CATALOG_STOP_WORDS or len(word) < 3:
+            continue
+        topics.add(word[2:] if word.startswith("ال") and len(word) > 4 else word)
+    return topics
+
+def _catalog_topics(catalog):
+    """مواضيع الخدمات من الكتالوج (الجوازات، الاقامه، رخصه، المخالفات...) بدون "ال" """
+    topics = {"ابشر", "خدمات", "خدمه", "اقامه", "جواز"}
+    for category, services in catalog.items():
+        for phrase in [category, *services]:
+            topics |= _topic_words(phrase)
+    return frozenset(topics)
+
+FAQ_TOPICS = _catalog_topics(ABSHER_SERVICES)
+
+def is_general_question(user_text: str) -> bool:
+    """
+    هل السؤال عن الخدمات نفسها لا عن بيانات المتصل؟
+    
+    لازم يذكر موضوع خدمة (حتى لا نحفظ "وكم رسومها؟" التي تعتمد على ما قبلها)،
+    وبدون نوايا شخصية ولا كلمات المتكلم، والتجديد فقط بصيغة السؤال عن الطريقة.
+    """
+    
+    intents = match_intents(user_text)
+    if intents.intents & PERSONAL_INTENTS or intents.is_exit:
+        return False
+    
+    words = normalize_arabic(user_text).split()
+    if not words or PERSONAL_WORDS.intersection(words):
+        return False
+    
+    if "renewal" in intents and not HOW_TO_WORDS.intersection(words):
+        return False
+    
+    text = " ".join(words)
+    return any(topic in text for topic in FAQ_TOPICS)
+
+def is_general_reply(reply: str, user=None) -> bool:
+    """هل الرد خالٍ من بيانات المتصل (الاسم، الكنية، الرصيد، أرقام المستندات، أسماء العائلة والعمالة)؟"""
+    
+    if not reply or reply.startswith("عذراً"):
+        return False
+    
+    if not user:
+        return True
+    
+    balance = user.get("family_wallet", {}).get("balance")
+    personal = [user.get("name"), user.get("nickname"), user.get("national_id")]
+    if balance is not None:
+        personal.extend([f"{balance:g}", f"{balance:.0f}", f"{balance:.2f}"])
+    personal.extend(document.get("number") for document in user.get("documents", {}).values())
+    personal.extend(child.get("name") for child in user.get("children", []))
+    for worker in user.get("workers", []):
+        personal.extend([worker.get("name"), worker.get("iqama_number")])
+    
+    return not any(value and str(value) in reply for value in personal)
+
+def _ngrams(text, size=3):
+    """حروف ثلاثية مع حدود الكلمات (" كيف " -> " كي", "كيف", "يف ")"""
+    padded = f" {text} "
+    return frozenset(padded[i:i + size] for i in range(len(padded) - size + 1))
+
+class FAQCache:
+    """
+    كاش ردود الأسئلة العامة
+    
+    المفتاح هو النص بعد التوحيد. إذا لم يوجد نفس النص نبحث عن أقرب سؤال
+    محفوظ بتشابه الحروف الثلاثية (Jaccard) عبر فهرس عكسي. TTL + LRU.
+    """
+    
+    def __init__(self, ttl=FAQ_CACHE_TTL, max_entries=FAQ_CACHE_MAX_ENTRIES, similarity=FAQ_CACHE_SIMILARITY):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.similarity = similarity
+        self._entries = OrderedDict()  # key -> (reply, ngrams, expires_at)
+        self._index = {}  # ngram -> set(keys)
+        self._lock = threading.Lock()
+        
+        self.hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.rejected = 0
+        self.evictions = 0
+    
+    def get(self, user_text: str):
+        """الرد المحفوظ للسؤال أو لأقرب صيغة له، أو None"""
+        
+        key = normalize_arabic(user_text)
+        now = time.monotonic()
+        
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] <= now:
+                self._remove(key)
+                entry = None
+            
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            
+            match = self._closest(key, now)
+            if match is not None:
+                self._entries.move_to_end(match)
+                self.similar_hits += 1
+                return self._entries[match][0]
+            
+            self.misses += 1
+            return None
+    
+    def put(self, user_text: str, reply: str, user=None, ttl=None):
+        """
+        حفظ الرد إذا كان السؤال والرد عامين
+        
+        Returns:
+            True إذا حُفظ
+        """
+        
+        if not is_general_question(user_text) or not is_general_reply(reply, user):
+            self.rejected += 1
+            return False
+        
+        self._store(normalize_arabic(user_text), reply, ttl)
+        return True
+    
+    def seed(self, questions_and_replies, ttl=None):
+        """تعبئة الكاش مسبقاً بأسئلة وأجوبة موثوقة (بدون فحص التصنيف)"""
+        for question, reply in questions_and_replies:
+            self._store(normalize_arabic(question), reply, ttl)
+    
+    def _store(self, key, reply, ttl):
+        if not key:
+            return
+        
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        grams = _ngrams(key)
+        
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            
+            self._entries[key] = (reply, grams, expires_at)
+            for gram in grams:
+                self._index.setdefault(gram, set()).add(key)
+            self.stores += 1
+            
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+    
+    def _closest(self, key, now):
+        """أقرب سؤال محفوظ بتشابه >= الحد - داخل القفل"""
+        
+        grams = _ngrams(key)
+        shared = {}
+        for gram in grams:
+            for candidate in self._index.get(gram, ()):
+                shared[candidate] = shared.get(candidate, 0) + 1
+        
+        best, best_score = None, self.similarity
+        for candidate, count in shared.items():
+            candidate_grams = self._entries[candidate][1]
+            score = count / (len(grams) + len(candidate_grams) - count)
+            if score >= best_score and self._entries[candidate][2] > now:
+                best, best_score = candidate, score
+        
+        return best
+    
+    def _remove(self, key):
+        """حذف سؤال من الكاش والفهرس - داخل القفل"""
+        _, grams, _ = self._entries.pop(key)
+        for gram in grams:
+            keys = self._index.get(gram)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._index[gram]
+    
+    def __len__(self):
+        return len(self._entries)
+    
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.similar_hits + self.misses
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "similar_hits": self.similar_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.hits + self.similar_hits) / lookups, 3) if lookups else 0.0,
+                "stores": self.stores,
+                "rejected": self.rejected,
+                "evictions": self.evictions
+            }
+
+faq_cache = FAQCache()
+
+# المصدر في اسم الخدمة -> الفعل كما يقوله المتصل
+_SERVICE_VERBS = {
+    "تجديد": "اجدد",
+    "إصدار": "اطلع",
+    "سداد": "اسدد",
+    "طباعة": "اطبع",
+    "تحديث": "احدث",
+    "نقل": "انقل",
+    "الاستعلام عن": "استعلم عن"
+}
+
+def seed_faq_cache(cache=None, catalog=ABSHER_SERVICES):
+    """
+    تعبئة الكاش من كتالوج خدمات أبشر
+    
+    سؤال "وش خدمات أبشر" وسؤال "كيف ..." لكل خدمة، بأجوبة مبنية من الكتالوج نفسه.
+    
+    Returns:
+        عدد الأسئلة المضافة
+    """
+    
+    cache = cache or faq_cache
+    
+    categories = "، ".join(catalog)
+    overview = f"أبشر منصة وزارة الداخلية، وتقدم خدمات {categories}. وش الخدمة اللي تبغاها؟"
+    pairs = [
+        ("وش خدمات أبشر", overview),
+        ("ايش الخدمات اللي يقدمها أبشر", overview)
+    ]
+    
+    for category, services in catalog.items():
+        listed = "، ".join(services)
+        pairs.append((f"وش خدمات {category}", f"خدمات {category} في أبشر: {listed}. تبغى أساعدك في وحدة منها؟"))
+        
+        for service in services:
+            reply = f"تقدر تسوي {service} من أبشر، قسم {category}، بدون مراجعة. تبغاني أساعدك فيها الحين؟"
+            pairs.append((f"كيف {service}", reply))
+            pairs.append((f"وش طريقة {service}", reply))
+            
+            # الصيغة المحكية: "كيف اجدد رخصة القيادة" بدل "كيف تجديد رخصة القيادة"
+            for noun, verb in _SERVICE_VERBS.items():
+                if service.startswith(noun + " "):
+                    pairs.append((f"كيف {verb}{service[len(noun):]}", reply))
+                    break
+    
+    cache.seed(pairs)
+    return len(pairs)
+
+@latency.timed("faq_lookup")
+def lookup_faq(user_text: str):
+    """رد السؤال العام من الكاش إن وجد (الأسئلة الشخصية لا تُبحث أصلاً)"""
+    if not is_general_question(user_text):
+        return None
+    return faq_cache.get(user_text)
+
 # ==========================
 # 💬 توليد الردود
 # ==========================
-def generate_response(user_text: str, phone_number: str = None, conversation_history: list = None) -> str:
+def generate_response(user_text: str, phone_number: str = None, conversation_history: list = None, context=None) -> str:
     """
     توليد رد ذكي من المساعد
     
@@ -157,26 +699,142 @@ def generate_response(user_text: str, phone_number: str = None, conversation_his
         user_text: نص المستخدم
         phone_number: رقم الجوال
         conversation_history: تاريخ المحادثة
+        context: سياق المكالمة المجهز مسبقاً (CallContext) إن وجد
     
     Returns:
         رد المساعد
     """
     
-    # إذا OpenAI غير متوفر
-    if not openai_client:
-        return generate_fallback_response(user_text, phone_number)
+    reply, user, messages = prepare_response(user_text, phone_number, conversation_history, context)
+    if reply:
+        return reply
+    
+    try:
+        with latency.time("llm_total"):
+            response = llm_guard.chat(chat_request(messages))
+        record_usage(response.usage)
+        
+        reply = response.text.strip()
+        faq_cache.put(user_text, reply, user)
+        return reply
+    
+    except CircuitOpenError:
+        return generate_fallback_response(user_text, phone_number, user, degraded=True)
+        
+    except Exception as e:
+        print(f"❌ خطأ في مزود النماذج ({llm.name}): {e}")
+        return generate_fallback_response(user_text, phone_number, user, degraded=True)
+
+async def generate_response_async(user_text: str, phone_number: str = None, conversation_history: list = None, context=None,
+                                  run_sync=asyncio.to_thread) -> str:
+    """
+    نفس generate_response لكن بدون حجز خيط أثناء انتظار النموذج
+    
+    Args:
+        user_text: نص المستخدم
+        phone_number: رقم الجوال
+        conversation_history: تاريخ المحادثة
+        context: سياق المكالمة المجهز مسبقاً (CallContext) إن وجد
+        run_sync: مشغّل الكود المتزامن في خيط (المستودع والبرومت والرد الاحتياطي لا تُنفذ على الـ event loop)
+    
+    Returns:
+        رد المساعد
+    """
+    
+    reply, user, messages = await run_sync(prepare_response, user_text, phone_number, conversation_history, context)
+    if reply:
+        return reply
+    
+    try:
+        with latency.time("llm_total"):
+            response = await llm_guard.chat_async(chat_request(messages))
+        record_usage(response.usage)
+        
+        reply = response.text.strip()
+        faq_cache.put(user_text, reply, user)
+        return reply
+    
+    except CircuitOpenError:
+        return await run_sync(generate_fallback_response, user_text, phone_number, user, degraded=True)
+        
+    except Exception as e:
+        print(f"❌ خطأ في مزود النماذج ({llm.name}): {e}")
+        return await run_sync(generate_fallback_response, user_text, phone_number, user, degraded=True)
+
+def prepare_response(user_text: str, phone_number: str = None, conversation_history: list = None, context=None):
+    """
+    الجزء المتزامن قبل النموذج: كاش الأسئلة العامة، بيانات المستخدم (المستودع) والبرومت
+    
+    Returns:
+        (reply, user, messages) - reply جاهز بدون نموذج (كاش، مزود غير متوفر، رقم غير معروف)
+        وإلا None مع الرسائل للنموذج
+    """
+    
+    # أسئلة الخدمات العامة جوابها محفوظ
+    cached_reply = lookup_faq(user_text)
+    if cached_reply:
+        return cached_reply, None, None
+    
+    # إذا المزود غير متوفر
+    if not llm.available:
+        return generate_fallback_response(user_text, phone_number), None, None
     
     # الحصول على بيانات المستخدم
-    user = get_user_by_phone(phone_number) if phone_number else None
+    user, system_prompt = resolve_user(phone_number, context)
     
     if not user:
-        return "ممكن رقم جوالك للتعرف عليك وأقدر أخدمك بشكل أفضل؟"
+        return "ممكن رقم جوالك للتعرف عليك وأقدر أخدمك بشكل أفضل؟", None, None
+    
+    return None, user, build_messages(user, user_text, conversation_history, system_prompt)
+
+def chat_request(messages: list, **extra) -> dict:
+    """إعدادات طلب المحادثة المشتركة بين كل طرق الاستدعاء"""
+    return {
+        "model": OPENAI_MODEL,
+        "messages": messages,
+        "temperature": OPENAI_TEMPERATURE,
+        "max_tokens": OPENAI_MAX_TOKENS,
+        "timeout": OPENAI_TIMEOUT,
+        **extra
+    }
+
+@latency.timed("user_lookup")
+def resolve_user(phone_number: str = None, context=None):
+    """
+    بيانات المستخدم والبرومت الجاهز من سياق المكالمة إن وجد
+    
+    Returns:
+        (user, system_prompt) - البرومت None إذا لم يكن مجهزاً مسبقاً
+    """
+    
+    # السياق صالح فقط إذا لم تتغير بيانات المستخدم بعد بنائه (تجديد مثلاً)
+    if context is not None and context.phone_number == phone_number:
+        if not context.user or context.user.get("version", 0) == context.version:
+            return context.user, context.system_prompt
+    
+    return (get_user_by_phone(phone_number) if phone_number else None), None
+
+@latency.timed("prompt_build")
+def build_messages(user, user_text: str, conversation_history: list = None, system_prompt: str = None) -> list:
+    """
+    بناء رسائل المحادثة المرسلة للنموذج
+    
+    Args:
+        user: بيانات المستخدم
+        user_text: نص المستخدم
+        conversation_history: تاريخ المحادثة
+        system_prompt: برومت جاهز (من سياق المكالمة) - يُبنى إذا لم يُمرر
     
-    # الحصول على المستندات المنتهية
-    expiring_docs = get_expiring_documents(user)
+    Returns:
+        قائمة الرسائل (البرومت + التاريخ + سؤال المستخدم)
+    """
     
-    # بناء البرومت
-    system_prompt = build_system_prompt(user, expiring_docs)
+    if system_prompt is None:
+        # الحصول على المستندات المنتهية
+        expiring_docs = get_expiring_documents(user)
+        
+        # بناء البرومت
+        system_prompt = build_system_prompt(user, expiring_docs)
     
     messages = [{"role": "system", "content": system_prompt}]
     
@@ -185,60 +843,214 @@ def generate_response(user_text: str, phone_number: str = None, conversation_his
     
     messages.append({"role": "user", "content": user_text})
     
+    return messages
+
+# ==========================
+# 🌊 توليد الردود بالبث
+# ==========================
+def generate_response_stream(user_text: str, phone_number: str = None, conversation_history: list = None):
+    """
+    نفس generate_response لكن يُرجع الرد قطعة قطعة أثناء توليده
+    
+    Args:
+        user_text: نص المستخدم
+        phone_number: رقم الجوال
+        conversation_history: تاريخ المحادثة
+    
+    Yields:
+        أجزاء نص الرد بالترتيب
+    """
+    
+    cached_reply = lookup_faq(user_text)
+    if cached_reply:
+        yield cached_reply
+        return
+    
+    if not llm.available:
+        yield generate_fallback_response(user_text, phone_number)
+        return
+    
+    with latency.time("user_lookup"):
+        user = get_user_by_phone(phone_number) if phone_number else None
+    
+    if not user:
+        yield "ممكن رقم جوالك للتعرف عليك وأقدر أخدمك بشكل أفضل؟"
+        return
+    
+    messages = build_messages(user, user_text, conversation_history)
+    
     try:
-        response = openai_client.chat.completions.create(
-            model=OPENAI_MODEL,
-            messages=messages,
-            temperature=OPENAI_TEMPERATURE,
-            max_tokens=OPENAI_MAX_TOKENS,
-            timeout=OPENAI_TIMEOUT
-        )
+        started = time.perf_counter()
         
-        return response.choices[0].message.content.strip()
+        parts = []
+        for chunk in llm_guard.chat_stream(chat_request(messages)):
+            if chunk.text:
+                if not parts:
+                    latency.observe("llm_first_token", time.perf_counter() - started)
+                parts.append(chunk.text)
+                yield parts[-1]
+            # آخر قطعة فيها الاستخدام
+            if chunk.usage:
+                record_usage(chunk.usage)
+        
+        # من الطلب لآخر قطعة (يشمل وقت المستهلك بين القطع، مثل التشغيل في الوضع المحلي)
+        latency.observe("llm_total", time.perf_counter() - started)
+        faq_cache.put(user_text, "".join(parts).strip(), user)
+    
+    except CircuitOpenError:
+        yield generate_fallback_response(user_text, phone_number, user, degraded=True)
         
     except Exception as e:
-        print(f"❌ خطأ في OpenAI: {e}")
-        return "عذراً، صار عندي خطأ بسيط. ممكن تعيد؟"
+        print(f"❌ خطأ في مزود النماذج ({llm.name}): {e}")
+        # إذا بدأ الرد بالوصول لا نبدأ رداً ثانياً فوقه
+        yield "عذراً، صار عندي خطأ بسيط. ممكن تعيد؟" if parts else generate_fallback_response(
+            user_text, phone_number, user, degraded=True
+        )
+
+# علامات نهاية الجملة (عربية ولاتينية) - الفاصلة العربية تُعامل كنهاية مقطع
+SENTENCE_ENDINGS = ".!?؟؛\n"
+CLAUSE_ENDING = "،"
+
+def split_sentences(chunks, min_clause_chars: int = STREAM_MIN_CLAUSE_CHARS):
+    """
+    تقطيع نص متدفق إلى جمل جاهزة للنطق
+    
+    يُقطع النص عند علامة نهاية متبوعة بمسافة (حتى لا تنقطع الأرقام مثل 1.5)،
+    وعند الفاصلة العربية فقط إذا صار المقطع طويلاً بما يكفي.
+    
+    Args:
+        chunks: أجزاء النص كما تصل من النموذج
+        min_clause_chars: أقل طول للمقطع قبل القطع عند الفاصلة
+    
+    Yields:
+        الجمل بالترتيب
+    """
+    
+    buffer = ""
+    scan = 0
+    
+    for chunk in chunks:
+        buffer += chunk
+        
+        # نحتاج الحرف التالي للتأكد أن العلامة نهاية جملة فعلاً
+        while scan < len(buffer) - 1:
+            char = buffer[scan]
+            is_boundary = char in SENTENCE_ENDINGS or (char == CLAUSE_ENDING and scan + 1 >= min_clause_chars)
+            
+            if is_boundary and buffer[scan + 1].isspace():
+                sentence = buffer[:scan + 1].strip()
+                buffer = buffer[scan + 1:]
+                scan = 0
+                if sentence:
+                    yield sentence
+            else:
+                scan += 1
+    
+    # ما تبقى بعد انتهاء البث
+    tail = buffer.strip()
+    if tail:
+        yield tail
 
 # ==========================
 # 🔄 ردود احتياطية
 # ==========================
-def generate_fallback_response(user_text: str, phone_number: str = None) -> str:
+# الخدمة وقسمها وكلمات موضوعها من الكتالوج
+_CATALOG_INDEX = [
+    (category, service, _topic_words(service), _topic_words(category))
+    for category, services in ABSHER_SERVICES.items()
+    for service in services
+]
+
+# رد المساعد وقت تعطل المزود (قاطع الدائرة مفتوح أو فشل الطلب)
+DEGRADED_REPLY = "الخدمة عليها ضغط الحين. أقدر أساعدك في التجديد، المحفظة، والتذكير، أو قل وش الجديد."
+
+def match_catalog_service(user_text: str, renewal: bool = False):
     """
-    ردود بسيطة بدون AI
+    أقرب خدمة في كتالوج أبشر لكلام المستخدم
+    
+    Args:
+        user_text: نص المستخدم
+        renewal: طلب تجديد - عند التساوي تُفضل خدمات التجديد
+    
+    Returns:
+        (القسم، الخدمة) - والخدمة None إذا لم يُذكر إلا القسم - أو None
+    """
+    
+    words = _topic_words(user_text)
+    if not words:
+        return None
+    
+    best, best_score = None, 0
+    for category, service, service_words, category_words in _CATALOG_INDEX:
+        score = len(words & service_words) * 2
+        if score and renewal and service.startswith("تجديد"):
+            score += 1
+        if score > best_score:
+            best, best_score = (category, service), score
+    if best:
+        return best
+    
+    for category, _, _, category_words in _CATALOG_INDEX:
+        if words & category_words:
+            return category, None
+    return None
+
+def generate_fallback_response(user_text: str, phone_number: str = None, user=None, degraded: bool = False) -> str:
+    """
+    ردود بدون AI: النوايا المعروفة ببيانات المستخدم، ثم كتالوج الخدمات
     
     Args:
         user_text: نص المستخدم
         phone_number: رقم الجوال
+        user: بيانات المستخدم إن كانت محملة
+        degraded: المزود معطل مؤقتاً (لا غير متوفر أصلاً) - الرد الأخير يوضح ذلك
     
     Returns:
         رد بسيط
     """
     
-    user_lower = user_text.lower()
-    user = get_user_by_phone(phone_number) if phone_number else None
+    latency.increment("llm_fallback")
+    intents = match_intents(user_text)
+    if user is None and phone_number:
+        user = get_user_by_phone(phone_number)
     
     # ترحيب
-    if any(word in user_lower for word in ["السلام", "مرحبا", "هلا"]):
+    if "greeting" in intents:
         if user:
             nickname = user.get("nickname", user.get("name", "").split()[0])
             return f"هلا والله {nickname}، كيف أقدر أخدمك؟"
         return "هلا والله، كيف أقدر أخدمك في أبشر؟"
     
-    # وش الجديد
-    if any(word in user_lower for word in ["جديد", "عندي"]):
+    # وش الجديد (والتجديد بدون تحديد: نفس الرسالة فيها المستندات ورسومها)
+    if "whats_new" in intents or ("renewal" in intents and user and not match_catalog_service(user_text)):
         if user:
             expiring = get_expiring_documents(user)
             return get_whats_new_message(user, expiring)
         return "أحتاج رقم جوالك للتعرف عليك."
     
     # المحفظة
-    if "محفظة" in user_lower or "رصيد" in user_lower:
+    if "wallet" in intents:
         if user:
             balance = user.get("family_wallet", {}).get("balance", 0)
             return f"رصيد محفظتك العائلية: {balance} ريال."
         return "أحتاج رقم جوالك أولاً."
     
+    # التذكير
+    if "reminder" in intents:
+        return "أقدر أذكرك قبل ما تنتهي مستنداتك. قل ذكرني وأنا أضبطه لك."
+    
+    # خدمة من الكتالوج (نفس صياغة أجوبة الكاش)
+    match = match_catalog_service(user_text, renewal="renewal" in intents)
+    if match:
+        category, service = match
+        if service:
+            return f"تقدر تسوي {service} من أبشر، قسم {category}، بدون مراجعة. تبغاني أساعدك فيها الحين؟"
+        listed = "، ".join(ABSHER_SERVICES[category])
+        return f"خدمات {category} في أبشر: {listed}. تبغى أساعدك في وحدة منها؟"
+    
+    if degraded:
+        return DEGRADED_REPLY
+    
     # خدمات عامة
     return "تمام، كيف أقدر أساعدك في خدمات أبشر؟"
 
@@ -246,15 +1058,47 @@ def generate_fallback_response(user_text: str, phone_number: str = None) -> str:
 # 🗣️ تنسيق الأرقام للنطق
 # ==========================
 def format_numbers_for_speech(text: str) -> str:
-    """تحويل الأرقام لصيغة منطوقة"""
+    """تحويل الأرقام لصيغة منطوقة (مبالغ وأعداد بالكلمات، تواريخ، أرقام طويلة رقمين رقمين)"""
+    return convert_text_numbers(text)
+
+# ==========================
+# ✅ فحص التوجيه
+# ==========================
+def check_routing(phone_number="+966501234567"):
+    """
+    فحص سريع لتوجيه الطلبات المحلية (بدون نموذج ولا خصم من المحفظة)
+    """
+    if not len(faq_cache):
+        seed_faq_cache()
     
-    numbers_map = {
-        '0': 'صفر', '1': 'واحد', '2': 'اثنين', '3': 'ثلاثة', '4': 'أربعة',
-        '5': 'خمسة', '6': 'ستة', '7': 'سبعة', '8': 'ثمانية', '9': 'تسعة'
-    }
+    # سؤال الطريقة يرجع جواب الكاش ولا يترك تجديداً معلقاً يخصمه "ايوه" التالية
+    for question in ["كيف اجدد رخصة القيادة", "كيف أجدد رخصة القيادة؟", "وش شروط تجديد الجواز"]:
+        assistant = SmartAssistant(phone_number)
+        reply = assistant.route(question)
+        assert assistant.current_renewal is None, question
+        assert reply is None or reply == lookup_faq(question), question
     
-    result = text
-    for num, word in numbers_map.items():
-        result = result.replace(num, f" {word} ")
+    assistant = SmartAssistant(phone_number)
+    assert assistant.route("كيف اجدد رخصة القيادة") == lookup_faq("كيف اجدد رخصة القيادة") is not None
+    assert assistant.route("ايوه") is None and assistant.current_renewal is None
     
-    return result
\ No newline at end of file
+    # المستند المذكور وحده، والعرض الجماعي لا يتجاوز رصيد المحفظة
+    assistant = SmartAssistant(phone_number)
+    assistant.route("جدد الهوية الوطنية")
+    assert assistant.current_renewal and assistant.current_renewal["type"] == "national_id"
+    
+    assistant = SmartAssistant(phone_number)
+    assistant.route("ابغى اجدد مستنداتي")
+    balance = assistant.user.get("family_wallet", {}).get("balance", 0)
+    assert assistant.current_renewal is None or assistant.current_renewal["renewal_fee"] <= balance
+    
+    # فشل الخصم يلغي الطلب المعلق: "ايوه" بعده لا تعيد نفس الخصم
+    assistant = SmartAssistant(phone_number)
+    assistant.route("جدد الهوية الوطنية")
+    assistant.renewal_failure({"success": False, "message": "رصيد المحفظة غير كافي. الرصيد الحالي: 0 ريال"})
+    assert assistant.current_renewal is None and assistant.route("ايوه") is None
+    
+    print("✅ التوجيه المحلي سليم")
+
+if __name__ == "__main__":
+    check_routing()
@@ -0,0 +1,352 @@
+"""
+فحص الانتهاء الجماعي - تصنيف كل المستندات في كل المستخدمين دفعة واحدة بـ NumPy
+للمهام الليلية: نفس نتيجة get_expiring_documents بالضبط، لكن على أعمدة datetime64[D]
+بدل المرور على كل مستند في Python
+
+قياس الأداء:
+    python bulk_expiry.py
+"""
+
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+
+import data
+from data import users, describe_document, describe_worker, get_expiring_documents, parse_date
+from repository import DictUserRepository
+
+# حالات التصنيف
+STATUS_EXPIRED = 0
+STATUS_EXPIRING = 1
+STATUS_VALID = 2
+
+WARNING_DAYS = 30  # نفس حد get_expiring_documents
+INVALID_DAYS = 999  # نفس calculate_days_until للتاريخ غير الصالح
+
+# ==========================
+# 📊 الأعمدة
+# ==========================
+class ExpiryColumns:
+    """
+    كل المستندات والإقامات كأعمدة NumPy (سطر لكل مستند، بنفس ترتيبها داخل كل مستخدم)
+
+    • phones: أرقام الجوال، و owner رقم صاحب كل مستند فيها
+    • kind: رقم نوع المستند في kinds
+    • expiry: datetime64[D] (NaT للتاريخ غير الصالح)، و expiry_text النص الأصلي
+    • number, fee, worker_name: لبناء نفس قواميس get_expiring_documents
+    """
+
+    __slots__ = ("phones", "owner", "kinds", "kind", "number", "expiry_text", "expiry", "fee", "worker_name", "_owner_of")
+
+    def __init__(self, phones, owner, kinds, kind, number, expiry_text, expiry, fee, worker_name):
+        self.phones = phones
+        self.owner = owner
+        self.kinds = kinds
+        self.kind = kind
+        self.number = number
+        self.expiry_text = expiry_text
+        self.expiry = expiry
+        self.fee = fee
+        self.worker_name = worker_name
+        self._owner_of = None
+
+    @classmethod
+    def from_records(cls, records):
+        """
+        بناء الأعمدة من سجلات iter_expiry_dates
+        (phone, doc_type, number, expiry_date, renewal_fee, worker_name)
+        """
+        owners, kinds = {}, {}
+        owner, kind, number, expiry_text, fee, worker_name = [], [], [], [], [], []
+
+        for phone, doc_type, doc_number, expiry_date, renewal_fee, name in records:
+            owner.append(owners.setdefault(phone, len(owners)))
+            kind.append(kinds.setdefault(doc_type, len(kinds)))
+            number.append(doc_number)
+            expiry_text.append(expiry_date)
+            fee.append(renewal_fee)
+            worker_name.append(name or "")
+
+        return cls(
+            phones=np.array(list(owners), dtype=str),
+            owner=np.array(owner, dtype=np.int32),
+            kinds=tuple(kinds),
+            kind=np.array(kind, dtype=np.int8),
+            number=np.array(number, dtype=str),
+            expiry_text=np.array(expiry_text, dtype=str),
+            expiry=parse_expiry_column(expiry_text),
+            fee=np.array(fee),
+            worker_name=np.array(worker_name, dtype=str)
+        )
+
+    @classmethod
+    def from_repository(cls, repository=users):
+        """تصدير أعمدة كل السكان من المستودع"""
+        return cls.from_records(repository.iter_expiry_dates())
+
+    def owner_of(self, phone):
+        """رقم المستخدم داخل الأعمدة أو None"""
+        if self._owner_of is None:
+            self._owner_of = {str(phone): index for index, phone in enumerate(self.phones)}
+        return self._owner_of.get(phone)
+
+    def __len__(self):
+        return len(self.owner)
+
+def parse_expiry_column(expiry_text):
+    """
+    تحويل نصوص YYYY-MM-DD إلى datetime64[D] بنفس قبول/رفض strptime
+
+    المسار السريع للتواريخ القياسية (10 حروف)، وأي شيء آخر ("2026-5-1"، تاريخ غير صالح)
+    يُحلل واحداً واحداً عبر parse_date نفسها - الغير صالح يصبح NaT.
+    """
+    text = np.asarray(expiry_text, dtype=str)
+
+    if len(text) and (np.char.str_len(text) == 10).all():
+        try:
+            return text.astype("datetime64[D]")
+        except ValueError:
+            pass
+
+    return np.array([_parse_or_nat(value) for value in expiry_text], dtype="datetime64[D]")
+
+def _parse_or_nat(value):
+    try:
+        return np.datetime64(parse_date(value).date(), "D")
+    except (TypeError, ValueError):
+        return np.datetime64("NaT", "D")
+
+# ==========================
+# 🔎 الفحص
+# ==========================
+class ExpiryScan:
+    """
+    نتيجة الفحص
+
+    • days_left و status لكل مستند
+    • order: أرقام المستندات المنتهية والقريبة، مجمعة حسب المستخدم ومرتبة بأولوية get_expiring_documents
+    """
+
+    def __init__(self, columns, days_left, status, order):
+        self.columns = columns
+        self.days_left = days_left
+        self.status = status
+        self.order = order
+
+        # حدود كل مستخدم داخل order
+        owners = columns.owner[order]
+        starts = np.flatnonzero(np.r_[True, owners[1:] != owners[:-1]]) if len(order) else np.array([], dtype=np.int64)
+        self._group_owner = owners[starts]
+        self._group_bounds = np.r_[starts, len(order)]
+
+    def counts(self):
+        """عدد المستندات في كل حالة"""
+        expired, expiring, valid = np.bincount(self.status, minlength=3)[:3]
+        return {"expired": int(expired), "expiring": int(expiring), "valid": int(valid)}
+
+    def describe(self, index):
+        """المستند رقم index بنفس شكل get_expiring_documents"""
+        columns = self.columns
+        doc_type = columns.kinds[columns.kind[index]]
+        days_left = int(self.days_left[index])
+        fee = columns.fee[index].item() if hasattr(columns.fee[index], "item") else columns.fee[index]
+
+        if doc_type == "iqama":
+            return describe_worker({
+                "name": str(columns.worker_name[index]),
+                "iqama_number": str(columns.number[index]),
+                "iqama_expiry": str(columns.expiry_text[index]),
+                "renewal_fee": fee
+            }, days_left)
+
+        return describe_document(doc_type, {
+            "number": str(columns.number[index]),
+            "expiry_date": str(columns.expiry_text[index]),
+            "renewal_fee": fee
+        }, days_left)
+
+    def _group(self, group):
+        start, end = self._group_bounds[group], self._group_bounds[group + 1]
+        return [self.describe(index) for index in self.order[start:end]]
+
+    def expiring_documents(self, phone):
+        """نفس get_expiring_documents للمستخدم (قائمة فارغة إذا لم يكن عنده شيء)"""
+        owner = self.columns.owner_of(phone)
+        if owner is None:
+            return []
+        group = np.searchsorted(self._group_owner, owner)
+        if group >= len(self._group_owner) or self._group_owner[group] != owner:
+            return []
+        return self._group(group)
+
+    def iter_users(self):
+        """(phone, المستندات) لكل مستخدم عنده مستند منتهي أو قريب الانتهاء"""
+        for group, owner in enumerate(self._group_owner):
+            yield str(self.columns.phones[owner]), self._group(group)
+
+def scan(columns, now=None, warning_days=WARNING_DAYS):
+    """
+    تصنيف كل المستندات دفعة واحدة
+
+    الأيام المتبقية = (تاريخ الانتهاء - اليوم) - 1 إذا لم يكن now منتصف الليل بالضبط،
+    وهذا نفس (target - now).days في calculate_days_until.
+
+    Args:
+        columns: ExpiryColumns
+        now: الوقت الحالي (الافتراضي: الآن)
+        warning_days: حد "قريب الانتهاء"
+
+    Returns:
+        ExpiryScan
+    """
+    now = now or datetime.now()
+    today = np.datetime64(now.date(), "D")
+    partial_day = 1 if now != datetime.combine(now.date(), datetime.min.time()) else 0
+
+    invalid = np.isnat(columns.expiry)
+    days_left = (columns.expiry - today).astype(np.int64) - partial_day
+    days_left[invalid] = INVALID_DAYS
+    days_left = days_left.astype(np.int32)
+
+    status = np.full(len(columns), STATUS_VALID, dtype=np.int8)
+    status[days_left <= warning_days] = STATUS_EXPIRING
+    status[days_left < 0] = STATUS_EXPIRED
+
+    # المستخدم، ثم المنتهي أولاً، ثم الأقرب - lexsort ثابت فيبقى ترتيب المستندات الأصلي عند التساوي
+    selected = np.flatnonzero(status != STATUS_VALID)
+    order = selected[np.lexsort((
+        days_left[selected],
+        status[selected] != STATUS_EXPIRED,
+        columns.owner[selected]
+    ))]
+
+    return ExpiryScan(columns, days_left, status, order)
+
+def verify(repository=users, now=None):
+    """
+    مقارنة الفحص الجماعي بـ get_expiring_documents لكل مستخدم في المستودع
+
+    Returns:
+        عدد المستخدمين المختلفين (0 = تطابق تام)
+    """
+    now = now or datetime.now()
+    result = scan(ExpiryColumns.from_repository(repository), now)
+    mismatches = 0
+    for phone in result.columns.phones:
+        user = repository.get_by_phone(str(phone))
+        if result.expiring_documents(str(phone)) != get_expiring_documents(user, now):
+            mismatches += 1
+    return mismatches
+
+# ==========================
+# ⏱️ قياس الأداء
+# ==========================
+_SYNTHETIC_KINDS = ("national_id", "passport", "drivers_license", "iqama")
+_SYNTHETIC_FEES = np.array([300, 300, 400, 650])
+
+def make_synthetic_columns(size, now=None, seed=7):
+    """
+    سكان وهميون: 4 سجلات لكل مستخدم (هوية، جواز، رخصة، إقامة عامل)
+    بتواريخ انتهاء عشوائية من سنة مضت إلى 10 سنوات قادمة
+    """
+    rng = np.random.default_rng(seed)
+    today = np.datetime64((now or datetime.now()).date(), "D")
+
+    index = np.arange(size)
+    owner = (index // 4).astype(np.int32)
+    kind = (index % 4).astype(np.int8)
+    expiry = today + rng.integers(-365, 3650, size).astype("timedelta64[D]")
+
+    return ExpiryColumns(
+        phones=np.char.add("+9665", np.arange(owner[-1] + 1 if size else 0).astype("U8")),
+        owner=owner,
+        kinds=_SYNTHETIC_KINDS,
+        kind=kind,
+        number=index.astype("U10"),
+        expiry_text=expiry.astype("U10"),
+        expiry=expiry,
+        fee=_SYNTHETIC_FEES[kind],
+        worker_name=np.where(kind == 3, "عامل", "")
+    )
+
+def materialize_users(columns):
+    """نفس السكان الوهميين كقواميس MOCK_USERS (للمقارنة مع الدالة الفردية)"""
+    population = {}
+    for index in range(len(columns)):
+        phone = str(columns.phones[columns.owner[index]])
+        user = population.get(phone)
+        if user is None:
+            user = population[phone] = {"phone": phone, "national_id": phone, "name": phone, "documents": {}, "workers": []}
+
+        doc_type = columns.kinds[columns.kind[index]]
+        fee = columns.fee[index].item()
+        if doc_type == "iqama":
+            user["workers"].append({
+                "iqama_number": str(columns.number[index]),
+                "name": str(columns.worker_name[index]),
+                "iqama_expiry": str(columns.expiry_text[index]),
+                "renewal_fee": fee
+            })
+        else:
+            user["documents"][doc_type] = {
+                "number": str(columns.number[index]),
+                "expiry_date": str(columns.expiry_text[index]),
+                "renewal_fee": fee
+            }
+    return population
+
+def run_benchmark(sizes=(100_000, 1_000_000, 10_000_000), python_limit=1_000_000):
+    """
+    مقارنة الفحص الجماعي بالمرور على كل مستخدم
+
+    • التسريع = زمن Python ÷ زمن (الفحص + بناء قوائم المستخدمين)، لأن الطرفين
+      يُرجعان نفس الناتج
+    • فوق python_limit لا تُبنى قواميس المستخدمين (الذاكرة)، فيُعرض زمن Python
+      كإسقاط من معدل آخر حجم مقاس (projected) بدون نسبة تسريع
+    """
+    now = datetime.now()
+    print(f"تطابق مع get_expiring_documents على بيانات المستودع: {verify(users, now) == 0}")
+    print()
+    print(f"{'documents':>12} {'numpy scan':>12} {'+ output':>10} {'python':>12} {'speedup':>9}  match")
+
+    python_rate = None
+    saved_users = data.users
+    try:
+        for size in sizes:
+            columns = make_synthetic_columns(size, now)
+
+            begin = time.perf_counter()
+            result = scan(columns, now)
+            scan_seconds = time.perf_counter() - begin
+            bulk_output = dict(result.iter_users())
+            output_seconds = time.perf_counter() - begin
+
+            match = "-"
+            if size <= python_limit:
+                population = materialize_users(columns)
+                data.users = DictUserRepository(population)
+
+                begin = time.perf_counter()
+                expected = {phone: get_expiring_documents(user, now) for phone, user in population.items()}
+                python_seconds = time.perf_counter() - begin
+                python_rate = python_seconds / size
+                python_label = f"{python_seconds:10.2f}s"
+
+                expected = {phone: documents for phone, documents in expected.items() if documents}
+                match = str(expected == bulk_output)
+                del population, expected
+            else:
+                python_seconds = None
+                python_label = f"~{python_rate * size:.1f}s projected" if python_rate else "-"
+
+            speedup = f"{python_seconds / output_seconds:8.0f}x" if python_seconds else f"{'-':>9}"
+            print(f"{size:>12,} {scan_seconds:11.3f}s {output_seconds:9.2f}s {python_label:>12} "
+                  f"{speedup}  {match}")
+            del columns, result, bulk_output
+    finally:
+        data.users = saved_users
+
+if __name__ == "__main__":
+    run_benchmark(python_limit=int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
@@ -0,0 +1,136 @@
+"""
+سياق المكالمة - تجهيز بيانات المتصل أثناء رسالة الترحيب
+أول دور في المكالمة يلقى كل شي جاهز بدل البحث وبناء البرومت من الصفر
+"""
+
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from config import CALL_CONTEXT_TTL, CALL_CONTEXT_WAIT, PREFETCH_WORKERS
+from data import get_user_by_phone, get_expiring_documents
+from prompts import build_system_prompt, get_whats_new_message
+
+# ==========================
+# 📦 السياق
+# ==========================
+class CallContext:
+    """كل ما يحتاجه الدور الأول: المستخدم، مستنداته، البرومت، ورد 'وش عندي من جديد'"""
+
+    __slots__ = ("phone_number", "user", "version", "expiring_docs", "system_prompt", "whats_new", "created_at")
+
+    def __init__(self, phone_number, user, expiring_docs, system_prompt, whats_new):
+        self.phone_number = phone_number
+        self.user = user
+        self.version = user.get("version", 0) if user else 0  # نسخة البيانات عند البناء
+        self.expiring_docs = expiring_docs
+        self.system_prompt = system_prompt
+        self.whats_new = whats_new
+        self.created_at = time.monotonic()
+
+def build_call_context(phone_number, user=None):
+    """
+    بناء سياق المكالمة
+
+    Args:
+        phone_number: رقم المتصل
+        user: بيانات المستخدم إن كانت معروفة مسبقاً (لتجنب البحث مرة ثانية)
+
+    Returns:
+        CallContext (user = None إذا كان الرقم غير معروف)
+    """
+    if user is None:
+        user = get_user_by_phone(phone_number)
+
+    if not user:
+        return CallContext(phone_number, None, [], None, None)
+
+    expiring_docs = get_expiring_documents(user)
+
+    return CallContext(
+        phone_number,
+        user,
+        expiring_docs,
+        build_system_prompt(user, expiring_docs),
+        get_whats_new_message(user, expiring_docs)
+    )
+
+# ==========================
+# 🗂️ كاش السياقات
+# ==========================
+class CallContextCache:
+    """
+    سياقات المكالمات الجارية داخل العملية
+
+    prefetch يبدأ البناء في الخلفية عند /voice، و get يرجع النتيجة عند أول دور.
+    مع عدة عمليات قد يصل الدور لعامل آخر فيرجع get بـ None ويُبنى السياق كالمعتاد.
+    """
+
+    def __init__(self, ttl=CALL_CONTEXT_TTL, workers=PREFETCH_WORKERS):
+        self.ttl = ttl
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prefetch")
+        self._futures = {}  # call_sid -> (future, وقت البدء)
+        self._lock = threading.Lock()
+
+        self.prefetched = 0
+        self.hits = 0
+        self.misses = 0
+
+    def prefetch(self, call_sid, phone_number, user=None):
+        """بدء بناء السياق في الخلفية"""
+        future = self._executor.submit(build_call_context, phone_number, user)
+
+        with self._lock:
+            self._purge(time.monotonic())
+            self._futures[call_sid] = (future, time.monotonic())
+            self.prefetched += 1
+
+    def get(self, call_sid, timeout=CALL_CONTEXT_WAIT):
+        """
+        السياق الجاهز للمكالمة
+
+        Args:
+            timeout: أقصى انتظار إذا كان البناء لم ينته بعد (0 = بدون انتظار)
+
+        Returns:
+            CallContext أو None
+        """
+        with self._lock:
+            entry = self._futures.get(call_sid)
+
+        if entry is None or time.monotonic() - entry[1] > self.ttl:
+            self.misses += 1
+            return None
+
+        try:
+            context = entry[0].result(timeout=timeout)
+        except FutureTimeout:
+            self.misses += 1
+            return None
+        except Exception as e:
+            print(f"❌ خطأ في تجهيز سياق المكالمة: {e}")
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return context
+
+    def invalidate(self, call_sid):
+        """حذف السياق (بعد انتهاء المكالمة أو تغير بيانات المستخدم)"""
+        with self._lock:
+            self._futures.pop(call_sid, None)
+
+    def _purge(self, now):
+        """حذف السياقات القديمة - داخل القفل"""
+        expired = [sid for sid, (_, started) in self._futures.items() if now - started > self.ttl]
+        for sid in expired:
+            del self._futures[sid]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._futures),
+                "prefetched": self.prefetched,
+                "hits": self.hits,
+                "misses": self.misses
+            }
@@ -0,0 +1,362 @@
+"""
+سجل المكالمات - كل دور كحدث منظم (للتحليل وإعادة التشغيل لاحقاً)
+
+• خيط الطلب يضع الحدث في طابور في الذاكرة فقط (بدون قرص ولا JSON)،
+  وإذا امتلأ الطابور يُسقط الحدث ويُحسب بدل الانتظار
+• خيط الكتابة يجمع الأحداث على دفعات، وكل دفعة = عضو gzip مستقل يُلحق بالملف الحالي
+  (الملف كله يُقرأ بـ gzip عادي) + سطر في فهرس الملف: موضع الدفعة وأرقام مكالماتها
+• ملف جديد بعد CALL_JOURNAL_SEGMENT_BYTES، ويُحذف الأقدم بعد CALL_JOURNAL_MAX_SEGMENTS
+• القراءة: read_call يفك فقط الدفعات التي فيها المكالمة (من الفهرس)
+
+عرض مكالمة:
+    python call_journal.py CA1234...
+"""
+
+import os
+import sys
+import json
+import gzip
+import time
+import queue
+import threading
+from pathlib import Path
+
+from config import (
+    CALL_JOURNAL_ENABLED, CALL_JOURNAL_DIR, CALL_JOURNAL_SEGMENT_BYTES, CALL_JOURNAL_MAX_SEGMENTS,
+    CALL_JOURNAL_BATCH_SIZE, CALL_JOURNAL_FLUSH_SECONDS, CALL_JOURNAL_QUEUE_SIZE
+)
+
+SEGMENT_PATTERN = "calls-*.jsonl.gz"
+INDEX_SUFFIX = ".idx"
+
+_STOP = object()
+
+def turn_event(call_sid, caller, utterance, reply, route, timings=None, started=None, **extra):
+    """
+    حدث دور في المكالمة
+
+    Args:
+        route: طريقة الرد (local / model / deferred / no_speech / exit ...)
+        timings: أزمنة المراحل بالثواني (latency.capture)
+        started: perf_counter عند بداية الدور - لحساب مدته
+    """
+    event = {
+        "ts": time.time(),
+        "event": "turn",
+        "call_sid": call_sid,
+        "caller": caller,
+        "utterance": utterance,
+        "reply": reply,
+        "route": route,
+        "timings_ms": {stage: round(seconds * 1000, 3) for stage, seconds in (timings or {}).items()}
+    }
+    if started is not None:
+        event["duration_ms"] = round((time.perf_counter() - started) * 1000, 3)
+    event.update(extra)
+    return event
+
+class CallJournal:
+    """طابور في الذاكرة + خيط يكتب الدفعات في ملفات JSONL مضغوطة"""
+
+    def __init__(self, directory=CALL_JOURNAL_DIR, segment_bytes=CALL_JOURNAL_SEGMENT_BYTES,
+                 max_segments=CALL_JOURNAL_MAX_SEGMENTS, batch_size=CALL_JOURNAL_BATCH_SIZE,
+                 flush_seconds=CALL_JOURNAL_FLUSH_SECONDS, queue_size=CALL_JOURNAL_QUEUE_SIZE):
+        self.directory = Path(directory)
+        self.segment_bytes = segment_bytes
+        self.max_segments = max_segments
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self._segment = None
+        self._segment_number = 0
+
+        self.recorded = 0
+        self.dropped = 0
+        self.written = 0
+        self.batches = 0
+        self.errors = 0
+
+    # ==========================
+    # ✍️ التسجيل (خيط الطلب)
+    # ==========================
+    def record(self, event):
+        """
+        إضافة حدث بدون انتظار - لا يلمس القرص أبداً
+
+        Returns:
+            False إذا امتلأ الطابور وأُسقط الحدث
+        """
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self.dropped += 1
+            return False
+        self.recorded += 1
+        return True
+
+    # ==========================
+    # 💾 الكتابة (خيط الخلفية)
+    # ==========================
+    def _next_batch(self):
+        """أول حدث (انتظار مفتوح) ثم ما يصل خلال flush_seconds حتى batch_size"""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.flush_seconds
+        while len(batch) < self.batch_size and batch[-1] is not _STOP:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            stopping = batch[-1] is _STOP
+            events = batch[:-1] if stopping else batch
+
+            if events:
+                try:
+                    self._write(events)
+                except Exception as e:
+                    self.errors += 1
+                    print(f"❌ خطأ في كتابة سجل المكالمات: {e}")
+
+            for _ in batch:
+                self._queue.task_done()
+
+            if stopping:
+                return
+
+    def _write(self, events):
+        """دفعة = عضو gzip واحد في الملف + سطر في الفهرس"""
+        lines = b"".join(json.dumps(event, ensure_ascii=False).encode("utf-8") + b"\n" for event in events)
+        member = gzip.compress(lines, compresslevel=6)
+
+        segment = self._current_segment(len(member))
+        with open(segment, "ab") as handle:
+            offset = handle.tell()
+            handle.write(member)
+
+        entry = {
+            "offset": offset,
+            "length": len(member),
+            "events": len(events),
+            "calls": sorted({event.get("call_sid") for event in events if event.get("call_sid")}),
+            "first": events[0].get("ts"),
+            "last": events[-1].get("ts")
+        }
+        with open(str(segment) + INDEX_SUFFIX, "a", encoding="utf-8") as index:
+            index.write(json.dumps(entry) + "\n")
+
+        self.written += len(events)
+        self.batches += 1
+
+    def _current_segment(self, incoming):
+        """الملف الحالي، أو ملف جديد إذا تجاوز الحجم (مع حذف الأقدم)"""
+        if self._segment is not None and self._segment.exists():
+            if self._segment.stat().st_size + incoming <= self.segment_bytes:
+                return self._segment
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._segment_number += 1
+        # الوقت أولاً حتى يكون ترتيب الأسماء ترتيباً زمنياً، والعملية حتى لا تتصادم العمليات
+        name = f"calls-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{self._segment_number:04d}.jsonl.gz"
+        self._segment = self.directory / name
+        self._prune()
+        return self._segment
+
+    def _prune(self):
+        segments = list_segments(self.directory)
+        for segment in segments[:max(0, len(segments) - self.max_segments + 1)]:
+            for path in (segment, Path(str(segment) + INDEX_SUFFIX)):
+                try:
+                    path.unlink()
+                except FileNotFoundError:
+                    pass
+
+    # ==========================
+    # ⚙️ التشغيل والإيقاف
+    # ==========================
+    def start(self):
+        """تشغيل خيط الكتابة (مرة واحدة)"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="call-journal", daemon=True)
+        self._thread.start()
+
+    def flush(self):
+        """انتظار كتابة كل ما في الطابور (للإيقاف والأدوات، وليس لخيط الطلب)"""
+        if self._thread is not None:
+            self._queue.join()
+
+    def stop(self, timeout=5):
+        if self._thread is None:
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def stats(self):
+        return {
+            "directory": str(self.directory),
+            "queued": self._queue.qsize(),
+            "recorded": self.recorded,
+            "written": self.written,
+            "dropped": self.dropped,
+            "batches": self.batches,
+            "errors": self.errors,
+            "segment": self._segment.name if self._segment else None
+        }
+
+class NullJournal:
+    """عند تعطيل السجل (CALL_JOURNAL_ENABLED=0)"""
+
+    def record(self, event):
+        return False
+
+    def start(self):
+        pass
+
+    def flush(self):
+        pass
+
+    def stop(self, timeout=5):
+        pass
+
+    def stats(self):
+        return {"enabled": False}
+
+# ==========================
+# 📖 القراءة
+# ==========================
+def list_segments(directory=CALL_JOURNAL_DIR):
+    """ملفات السجل بالترتيب الزمني"""
+    return sorted(Path(directory).glob(SEGMENT_PATTERN))
+
+def _read_index(segment):
+    """سطور فهرس الملف، أو None إذا لم يوجد (الملف يُقرأ كاملاً)"""
+    try:
+        with open(str(segment) + INDEX_SUFFIX, encoding="utf-8") as index:
+            return [json.loads(line) for line in index if line.strip()]
+    except FileNotFoundError:
+        return None
+
+def _events(data):
+    for line in data.splitlines():
+        if line:
+            yield json.loads(line)
+
+def iter_events(directory=CALL_JOURNAL_DIR):
+    """كل الأحداث في كل الملفات"""
+    for segment in list_segments(directory):
+        with gzip.open(segment, "rb") as handle:
+            yield from _events(handle.read())
+
+def read_call(call_sid, directory=CALL_JOURNAL_DIR):
+    """
+    أحداث مكالمة واحدة بالترتيب الزمني
+
+    يفك فقط دفعات الملفات التي يذكر الفهرس أن فيها المكالمة.
+    أدوار المكالمة قد تكون في ملفات عدة عمليات، فالنتيجة مرتبة بالوقت.
+    """
+    events = []
+
+    for segment in list_segments(directory):
+        index = _read_index(segment)
+
+        if index is None:
+            with gzip.open(segment, "rb") as handle:
+                events.extend(event for event in _events(handle.read()) if event.get("call_sid") == call_sid)
+            continue
+
+        entries = [entry for entry in index if call_sid in entry["calls"]]
+        if not entries:
+            continue
+
+        with open(segment, "rb") as handle:
+            for entry in entries:
+                handle.seek(entry["offset"])
+                data = gzip.decompress(handle.read(entry["length"]))
+                events.extend(event for event in _events(data) if event.get("call_sid") == call_sid)
+
+    events.sort(key=lambda event: event.get("ts", 0))
+    return events
+
+# ==========================
+# 🗂️ السجل المشترك
+# ==========================
+_shared_journal = None
+_shared_lock = threading.Lock()
+
+def get_call_journal():
+    """السجل المشترك (NullJournal إذا كان معطلاً)"""
+    global _shared_journal
+    with _shared_lock:
+        if _shared_journal is None:
+            _shared_journal = CallJournal() if CALL_JOURNAL_ENABLED else NullJournal()
+    return _shared_journal
+
+# ==========================
+# 🧪 العرض والقياس
+# ==========================
+def print_call(call_sid, directory=CALL_JOURNAL_DIR):
+    events = read_call(call_sid, directory)
+    if not events:
+        print(f"⚠️ لا توجد أحداث للمكالمة {call_sid}")
+        return
+
+    for event in events:
+        stamp = time.strftime("%H:%M:%S", time.localtime(event["ts"]))
+        if event["event"] == "turn":
+            print(f"[{stamp}] 🗣️ {event['utterance']}")
+            print(f"           🤖 ({event['route']}, {event.get('duration_ms', 0):.0f} ms) {event['reply']}")
+        else:
+            print(f"[{stamp}] {event['event']}: {event.get('reply', '')}")
+
+def run_benchmark(events=20000, turns_per_call=8):
+    """تكلفة التسجيل على خيط الطلب، وسرعة قراءة مكالمة واحدة من ملفات كثيرة"""
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as directory:
+        journal = CallJournal(directory, segment_bytes=256 * 1024, queue_size=events + 1)
+        journal.start()
+
+        started = time.perf_counter()
+        for index in range(events):
+            journal.record(turn_event(
+                f"CA{index // turns_per_call:032d}", "+966501234567", "وش رصيد المحفظة",
+                "رصيد محفظتك العائلية: ألف وميتين ريال.", "local",
+                {"intent_routing": 0.00002, "number_format": 0.00003}
+            ))
+        record_cost = (time.perf_counter() - started) / events * 1e6
+
+        journal.flush()
+        journal.stop()
+
+        segments = list_segments(directory)
+        size = sum(segment.stat().st_size for segment in segments)
+
+        started = time.perf_counter()
+        call_sid = f"CA{events // turns_per_call // 2:032d}"
+        call = read_call(call_sid, directory)
+        indexed = (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        scanned = [event for event in iter_events(directory) if event["call_sid"] == call_sid]
+        full_scan = (time.perf_counter() - started) * 1000
+
+        assert len(call) == len(scanned) == turns_per_call
+        print(f"✍️ التسجيل على خيط الطلب: {record_cost:.2f} ميكروثانية/حدث")
+        print(f"💾 {journal.written} حدث في {journal.batches} دفعة، {len(segments)} ملف، {size / 1024:.0f} KB")
+        print(f"📖 مكالمة واحدة ({len(call)} دور): بالفهرس {indexed:.1f} ms، قراءة كاملة {full_scan:.1f} ms")
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        print_call(sys.argv[1])
+    else:
+        run_benchmark()
@@ -0,0 +1,479 @@
+"""
+حملات الاتصال الاستباقي - نتصل (أو نرسل SMS) لمن عنده مستند أو إقامة قريبة الانتهاء
+
+• طابور عمل: كل مستخدم مهمة، والمهام المعادة تنتظر موعدها في heap
+• Token bucket بنفس حد المكالمات في الثانية عند المزود، وحد للمكالمات الجارية معاً
+• إعادة المحاولة بانتظار متضاعف (مشغول، لا يرد، 429، خطأ شبكة)
+• حالة كل مهمة محفوظة في SQLite، فالحملة المتوقفة تكمل من حيث وقفت
+• المكالمة الصادرة تستخدم نفس /voice، فالمستخدم يسمع نفس الترحيب والسياق المجهز
+
+التشغيل مع Twilio وهمي:
+    python campaigns.py --fake --jobs 200 --cps 5
+"""
+
+import os
+import sys
+import time
+import uuid
+import heapq
+import random
+import sqlite3
+import argparse
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+from twilio.rest import Client
+from twilio.base.exceptions import TwilioRestException
+
+from config import (
+    TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, TWILIO_PHONE_NUMBER, BASE_URL,
+    CAMPAIGN_DB_PATH, CAMPAIGN_CALLS_PER_SECOND, CAMPAIGN_MAX_CONCURRENT_CALLS, CAMPAIGN_MAX_ATTEMPTS,
+    CAMPAIGN_RETRY_SECONDS, CAMPAIGN_POLL_SECONDS
+)
+
+# حالات المهمة
+PENDING = "pending"
+DIALING = "dialing"
+DONE = "done"
+FAILED = "failed"
+
+# نتائج المكالمة النهائية: ما يستحق إعادة المحاولة وما لا يستحق
+FINAL_CALL_STATUSES = {"completed", "busy", "no-answer", "failed", "canceled"}
+RETRY_CALL_STATUSES = {"busy", "no-answer", "failed"}
+
+# ==========================
+# 🪣 Token bucket
+# ==========================
+class TokenBucket:
+    """
+    حد المعدل: rate طلب في الثانية مع سماح بدفعة حتى capacity
+
+    acquire ينتظر حتى يتوفر رمز - آمن بين الخيوط.
+    """
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Returns:
+            الثواني التي انتظرها
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                pause = (1 - self._tokens) / self.rate
+            time.sleep(pause)
+            waited += pause
+
+# ==========================
+# 🗄️ نقاط الحفظ
+# ==========================
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS campaigns (
+    campaign_id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    channel TEXT NOT NULL,
+    created_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS campaign_jobs (
+    campaign_id TEXT NOT NULL,
+    phone TEXT NOT NULL,
+    message TEXT,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_result TEXT,
+    sid TEXT,
+    updated_at TEXT,
+    PRIMARY KEY (campaign_id, phone)
+);
+CREATE INDEX IF NOT EXISTS campaign_jobs_status ON campaign_jobs (campaign_id, status);
+"""
+
+class CampaignStore:
+    """حالة الحملات ومهامها في ملف SQLite - كل تغيير حالة نقطة حفظ"""
+
+    def __init__(self, path=CAMPAIGN_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._connection().executescript(SQLITE_SCHEMA)
+
+    def _connection(self):
+        """اتصال خاص بالخيط الحالي (ويُعاد إنشاؤه بعد fork)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        else:
+            conn.execute("COMMIT")
+
+    def create(self, name, channel, targets, campaign_id=None):
+        """
+        إنشاء حملة (أو إضافة أهداف لحملة موجودة بنفس الرقم)
+
+        Args:
+            targets: [(phone, message), ...] - رقم الجوال مرة واحدة لكل حملة
+
+        Returns:
+            campaign_id
+        """
+        campaign_id = campaign_id or f"CMP{uuid.uuid4().hex[:12].upper()}"
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO campaigns (campaign_id, name, channel, created_at) VALUES (?, ?, ?, ?)",
+                (campaign_id, name, channel, datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+            )
+            conn.executemany(
+                "INSERT OR IGNORE INTO campaign_jobs (campaign_id, phone, message, status) VALUES (?, ?, ?, ?)",
+                [(campaign_id, phone, message, PENDING) for phone, message in targets]
+            )
+        return campaign_id
+
+    def channel(self, campaign_id):
+        row = self._connection().execute("SELECT channel FROM campaigns WHERE campaign_id = ?", (campaign_id,)).fetchone()
+        if row is None:
+            raise ValueError(f"حملة غير معروفة: {campaign_id}")
+        return row[0]
+
+    def unfinished(self, campaign_id):
+        """
+        المهام التي لم تنته - المتوقفة أثناء الاتصال (DIALING) تُعاد أيضاً
+
+        Returns:
+            [(phone, message, attempts), ...]
+        """
+        return self._connection().execute(
+            "SELECT phone, message, attempts FROM campaign_jobs WHERE campaign_id = ? AND status IN (?, ?)",
+            (campaign_id, PENDING, DIALING)
+        ).fetchall()
+
+    def checkpoint(self, campaign_id, phone, status, attempts, last_result=None, sid=None):
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE campaign_jobs SET status = ?, attempts = ?, last_result = ?, sid = COALESCE(?, sid), updated_at = ? "
+                "WHERE campaign_id = ? AND phone = ?",
+                (status, attempts, last_result, sid, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), campaign_id, phone)
+            )
+
+    def progress(self, campaign_id):
+        return dict(self._connection().execute(
+            "SELECT status, COUNT(*) FROM campaign_jobs WHERE campaign_id = ? GROUP BY status", (campaign_id,)
+        ).fetchall())
+
+# ==========================
+# 🎯 الأهداف
+# ==========================
+def expiring_targets(days=30):
+    """
+    المستخدمون الذين عندهم مستند أو إقامة تنتهي خلال `days` يوم (أو منتهية)
+
+    Returns:
+        [(phone, message), ...] - رسالة SMS عن أقرب مستند لكل مستخدم
+    """
+    from expiry_index import get_expiry_index
+
+    first = {}
+    for user, document in get_expiry_index().expiring_within(days, include_expired=True):
+        current = first.get(user["phone"])
+        if current is None or document["days_left"] < current["days_left"]:
+            first[user["phone"]] = document
+
+    targets = []
+    for phone, document in first.items():
+        if document["days_left"] < 0:
+            message = f"تنبيه من أبشر: {document['name_ar']} منتهية. اتصل على سَمّ ونجددها لك بمكالمة."
+        else:
+            message = f"تنبيه من أبشر: {document['name_ar']} تنتهي بعد {document['days_left']} يوم. اتصل على سَمّ ونجددها لك."
+        targets.append((phone, message))
+    return targets
+
+# ==========================
+# 📞 المتصل
+# ==========================
+def create_twilio_client(base_url=None, account_sid=TWILIO_ACCOUNT_SID, auth_token=TWILIO_AUTH_TOKEN):
+    """عميل Twilio - مع base_url يتصل بالخادم الوهمي بدل api.twilio.com"""
+    client = Client(account_sid or "AC00000000000000000000000000000000", auth_token or "fake")
+    if base_url:
+        client.api.base_url = base_url
+    return client
+
+class _Job:
+    __slots__ = ("phone", "message", "attempts")
+
+    def __init__(self, phone, message, attempts):
+        self.phone = phone
+        self.message = message
+        self.attempts = attempts
+
+class CampaignDialer:
+    """
+    تنفيذ حملة
+
+    عدد العمال = حد المكالمات الجارية، وكل عامل يأخذ رمزاً من الـ bucket قبل كل طلب
+    للمزود. المكالمة تحجز العامل حتى تنتهي (نسأل عن حالتها كل poll_seconds).
+    """
+
+    def __init__(self, store=None, client_factory=create_twilio_client, rate=CAMPAIGN_CALLS_PER_SECOND,
+                 concurrency=CAMPAIGN_MAX_CONCURRENT_CALLS, max_attempts=CAMPAIGN_MAX_ATTEMPTS,
+                 retry_seconds=CAMPAIGN_RETRY_SECONDS, poll_seconds=CAMPAIGN_POLL_SECONDS,
+                 from_number=TWILIO_PHONE_NUMBER, voice_url=None):
+        """
+        Args:
+            client_factory: دالة تنشئ عميل Twilio (عميل لكل عامل)
+            rate: طلبات في الثانية (حد المزود)
+            concurrency: مكالمات جارية في نفس الوقت
+            voice_url: رابط TwiML للمكالمة الصادرة (الافتراضي BASE_URL/voice)
+        """
+        self.store = store or CampaignStore()
+        self.client_factory = client_factory
+        self.bucket = TokenBucket(rate)
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.retry_seconds = retry_seconds
+        self.poll_seconds = poll_seconds
+        self.from_number = from_number or "+10000000000"
+        self.voice_url = voice_url or f"{BASE_URL or 'http://localhost:5000'}/voice"
+
+        self._queue = []  # (ready_at, seq, job)
+        self._seq = 0
+        self._in_flight = 0
+        self._cond = threading.Condition()
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self._reset_stats()
+
+    def _reset_stats(self):
+        self.stats = {
+            "requests": 0,
+            "completed": 0,
+            "failed": 0,
+            "retries": 0,
+            "rate_limited": 0,
+            "outcomes": {},
+            "bucket_wait_seconds": 0.0
+        }
+
+    def _count(self, key, amount=1):
+        with self._stats_lock:
+            self.stats[key] += amount
+
+    def _client(self):
+        client = getattr(self._local, "client", None)
+        if client is None:
+            client = self._local.client = self.client_factory()
+        return client
+
+    # ---------- الطابور ----------
+    def _push(self, job, ready_at):
+        with self._cond:
+            heapq.heappush(self._queue, (ready_at, self._seq, job))
+            self._seq += 1
+            self._cond.notify()
+
+    def _next_job(self):
+        """أقرب مهمة جاهزة، أو None إذا انتهى كل شيء"""
+        with self._cond:
+            while True:
+                if self._queue:
+                    ready_at = self._queue[0][0]
+                    delay = ready_at - time.monotonic()
+                    if delay <= 0:
+                        self._in_flight += 1
+                        return heapq.heappop(self._queue)[2]
+                    self._cond.wait(delay)
+                elif self._in_flight == 0:
+                    return None
+                else:
+                    # مهمة جارية قد ترجع للطابور (إعادة محاولة)
+                    self._cond.wait()
+
+    def _job_done(self):
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    # ---------- التنفيذ ----------
+    def run(self, campaign_id):
+        """
+        تنفيذ الحملة حتى النهاية (أو إكمالها بعد توقف)
+
+        Returns:
+            إحصائيات التنفيذ
+        """
+        channel = self.store.channel(campaign_id)
+        self._reset_stats()
+
+        jobs = self.store.unfinished(campaign_id)
+        now = time.monotonic()
+        for phone, message, attempts in jobs:
+            self._push(_Job(phone, message, attempts), now)
+
+        started = time.monotonic()
+        workers = [
+            threading.Thread(target=self._work, args=(campaign_id, channel), name=f"dialer-{index}", daemon=True)
+            for index in range(min(self.concurrency, len(jobs)) or 1)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.monotonic() - started
+
+        report = dict(self.stats)
+        report["campaign_id"] = campaign_id
+        report["channel"] = channel
+        report["jobs"] = len(jobs)
+        report["elapsed_seconds"] = round(elapsed, 2)
+        report["requests_per_second"] = round(report["requests"] / elapsed, 2) if elapsed else 0.0
+        report["completion_rate"] = round(report["completed"] / len(jobs), 3) if jobs else 1.0
+        report["bucket_wait_seconds"] = round(report["bucket_wait_seconds"], 2)
+        report["progress"] = self.store.progress(campaign_id)
+        return report
+
+    def _work(self, campaign_id, channel):
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            try:
+                self._attempt(campaign_id, channel, job)
+            except Exception as e:
+                print(f"❌ خطأ في مهمة الحملة {job.phone}: {e}")
+                self._retry_or_fail(campaign_id, job, f"error: {e}")
+            finally:
+                self._job_done()
+
+    def _attempt(self, campaign_id, channel, job):
+        job.attempts += 1
+        self.store.checkpoint(campaign_id, job.phone, DIALING, job.attempts)
+
+        self._count("bucket_wait_seconds", self.bucket.acquire())
+        self._count("requests")
+
+        try:
+            if channel == "sms":
+                message = self._client().messages.create(to=job.phone, from_=self.from_number, body=job.message)
+                result, sid = "sent", message.sid
+            else:
+                call = self._client().calls.create(to=job.phone, from_=self.from_number, url=self.voice_url)
+                result, sid = self._wait_for_call(call.sid), call.sid
+        except TwilioRestException as e:
+            if e.status == 429:
+                self._count("rate_limited")
+            # 429 و 5xx مؤقتة، 4xx الأخرى (رقم غير صالح مثلاً) نهائية
+            if e.status == 429 or e.status >= 500:
+                self._retry_or_fail(campaign_id, job, f"http {e.status}")
+            else:
+                self._finish(campaign_id, job, FAILED, f"http {e.status}")
+            return
+
+        with self._stats_lock:
+            self.stats["outcomes"][result] = self.stats["outcomes"].get(result, 0) + 1
+
+        if result in ("completed", "sent"):
+            self._finish(campaign_id, job, DONE, result, sid)
+        elif result in RETRY_CALL_STATUSES:
+            self._retry_or_fail(campaign_id, job, result, sid)
+        else:
+            self._finish(campaign_id, job, FAILED, result, sid)
+
+    def _wait_for_call(self, call_sid):
+        """انتظار انتهاء المكالمة (العامل محجوز طوالها - هذا هو حد المكالمات الجارية)"""
+        while True:
+            time.sleep(self.poll_seconds)
+            status = self._client().calls(call_sid).fetch().status
+            if status in FINAL_CALL_STATUSES:
+                return status
+
+    def _retry_or_fail(self, campaign_id, job, result, sid=None):
+        if job.attempts >= self.max_attempts:
+            self._finish(campaign_id, job, FAILED, result, sid)
+            return
+
+        self._count("retries")
+        self.store.checkpoint(campaign_id, job.phone, PENDING, job.attempts, result, sid)
+        backoff = self.retry_seconds * 2 ** (job.attempts - 1)
+        self._push(job, time.monotonic() + backoff * random.uniform(0.8, 1.2))
+
+    def _finish(self, campaign_id, job, status, result, sid=None):
+        self._count("completed" if status == DONE else "failed")
+        self.store.checkpoint(campaign_id, job.phone, status, job.attempts, result, sid)
+
+# ==========================
+# 🚀 التشغيل
+# ==========================
+def main():
+    parser = argparse.ArgumentParser(description="حملة اتصال استباقي للمستندات قريبة الانتهاء")
+    parser.add_argument("--channel", choices=["call", "sms"], default="call")
+    parser.add_argument("--days", type=int, default=30, help="المستندات التي تنتهي خلال هذه الأيام")
+    parser.add_argument("--resume", help="إكمال حملة سابقة برقمها")
+    parser.add_argument("--fake", action="store_true", help="استخدام خادم Twilio وهمي محلي")
+    parser.add_argument("--jobs", type=int, default=0, help="أهداف وهمية بدل المستخدمين الحقيقيين (مع --fake)")
+    parser.add_argument("--cps", type=float, default=CAMPAIGN_CALLS_PER_SECOND)
+    parser.add_argument("--concurrency", type=int, default=CAMPAIGN_MAX_CONCURRENT_CALLS)
+    parser.add_argument("--db", default=CAMPAIGN_DB_PATH)
+    args = parser.parse_args()
+
+    client_factory = create_twilio_client
+    dialer_options = {}
+    server = None
+
+    if args.fake:
+        from fake_twilio import FakeTwilio, FakeTwilioServer
+        server = FakeTwilioServer(FakeTwilio(cps=args.cps), port=0).start()
+        client_factory = lambda: create_twilio_client(server.base_url)
+        # مكالمات الخادم الوهمي قصيرة، فلا داعي لانتظار دقيقة قبل إعادة المحاولة
+        dialer_options = {"retry_seconds": 1, "poll_seconds": 0.25}
+        print(f"📞 Twilio وهمي على {server.base_url}")
+    elif not (TWILIO_ACCOUNT_SID and TWILIO_AUTH_TOKEN and TWILIO_PHONE_NUMBER and BASE_URL):
+        print("⚠️ الحملات الحقيقية تحتاج إعدادات Twilio و BASE_URL في .env (أو استخدم --fake)")
+        sys.exit(1)
+
+    store = CampaignStore(args.db)
+    if args.resume:
+        campaign_id = args.resume
+    else:
+        if args.fake and args.jobs:
+            targets = [(f"+9665{index:08d}", "تنبيه تجريبي من أبشر") for index in range(args.jobs)]
+        else:
+            targets = expiring_targets(args.days)
+        campaign_id = store.create(f"expiring-{args.days}d", args.channel, targets)
+        print(f"📋 حملة {campaign_id}: {len(targets)} مستخدم")
+
+    dialer = CampaignDialer(store, client_factory, rate=args.cps, concurrency=args.concurrency, **dialer_options)
+    report = dialer.run(campaign_id)
+
+    print()
+    for key, value in report.items():
+        print(f"   {key}: {value}")
+    if server is not None:
+        print(f"   fake_twilio: {server.fake.stats()}")
+        server.stop()
+
+if __name__ == "__main__":
+    main()
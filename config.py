@@ -12,6 +12,7 @@ load_dotenv('.env')
 # 🔑 مفاتيح API
 # ==========================
 OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
+OPENAI_BASE_URL = os.environ.get("OPENAI_BASE_URL")  # خادم متوافق بديل (مثل النموذج الوهمي في load_test.py)
 TWILIO_ACCOUNT_SID = os.environ.get("TWILIO_ACCOUNT_SID")
 TWILIO_AUTH_TOKEN = os.environ.get("TWILIO_AUTH_TOKEN")
 TWILIO_PHONE_NUMBER = os.environ.get("TWILIO_PHONE_NUMBER")
@@ -38,8 +39,121 @@ OPENAI_TEMPERATURE = 0.7
 OPENAI_MAX_TOKENS = 100  # ردود قصيرة لكبار السن
 OPENAI_TIMEOUT = 10
 
+# مجمّع الاتصالات للعميل غير المتزامن (app_async)
+OPENAI_MAX_CONNECTIONS = 200  # طلبات متزامنة للنموذج
+OPENAI_MAX_KEEPALIVE = 50  # اتصالات مفتوحة جاهزة لإعادة الاستخدام
+OPENAI_KEEPALIVE_EXPIRY = 30  # ثواني
+
+# مزود النماذج: "openai" أو "stub" (محلي بدون شبكة) أو "record" / "replay" (تسجيل الردود وتقديمها بدونها)
+LLM_BACKEND = os.environ.get("LLM_BACKEND", "openai")
+LLM_STUB_LATENCY = float(os.environ.get("LLM_STUB_LATENCY", 0.3))  # ثواني حتى أول توكن
+LLM_STUB_TOKENS_PER_SECOND = float(os.environ.get("LLM_STUB_TOKENS_PER_SECOND", 40))
+LLM_REPLAY_DIR = os.environ.get("LLM_REPLAY_DIR", "llm_recordings")
+
+# طلب مكرر (hedge): إذا لم يصل الرد خلال p95 الأخير نرسل نسخة ثانية ونأخذ الأسرع
+LLM_HEDGE_ENABLED = True
+LLM_HEDGE_QUANTILE = 0.95
+LLM_HEDGE_MIN_DELAY = 0.3  # ثواني - لا نكرر قبلها مهما كان p95 صغيراً
+LLM_HEDGE_DEFAULT_DELAY = 1.0  # قبل جمع قياسات كافية
+LLM_HEDGE_MAX_RATIO = 0.1  # أقصى نسبة طلبات مكررة (حتى لا نضاعف الحمل وقت البطء العام)
+LLM_HEDGE_WINDOW = 200  # آخر كم زمن ناجح يُحسب منها p95
+LLM_HEDGE_WORKERS = 64  # خيوط طلبات النموذج (الأصلي والمكرر)
+
+# قاطع الدائرة: عند كثرة الأخطاء أو البطء نرد بالردود الاحتياطية مباشرة ونجرب المزود بطلب واحد كل فترة
+LLM_BREAKER_WINDOW_SECONDS = 30
+LLM_BREAKER_MIN_REQUESTS = 10  # أقل عدد طلبات في النافذة قبل الحكم
+LLM_BREAKER_ERROR_RATE = 0.5
+LLM_BREAKER_SLOW_RATE = 0.5
+LLM_BREAKER_SLOW_SECONDS = 4.0  # الطلب أبطأ من هذا يُعتبر بطيئاً
+LLM_BREAKER_OPEN_SECONDS = 15  # مدة الإيقاف قبل طلب التجربة
+
+# تحويل الكلام لنص (الوضع المحلي)
+STT_MODEL = 'whisper-1'
+
+# البث (الوضع المحلي): نطق الرد جملة بجملة أثناء توليده
+STREAM_RESPONSES = True
+STREAM_MIN_CLAUSE_CHARS = 15  # لا نقطع عند الفاصلة قبل هذا الطول
+TTS_STREAM_WORKERS = 2  # عدد الجمل التي تُحوّل لصوت بالتوازي
+
+# تحويل النص لصوت (الوضع المحلي)
+TTS_MODEL = 'tts-1-hd'
+TTS_VOICE = 'nova'  # صوت نسائي طبيعي
+TTS_SPEED = 0.95  # أبطأ قليلاً لكبار السن
+
+# كاش الصوت
+TTS_CACHE_DIR = 'audio_files/tts_cache'
+TTS_CACHE_MAX_BYTES = 200 * 1024 * 1024  # 200 ميجا
+
+# مهلة الدور: إذا لم يجهز الرد خلالها نقول جملة انتظار ونكمل في الخلفية
+# (Twilio ينتظر الـ webhook حوالي 15 ثانية فقط)
+TURN_DEADLINE_SECONDS = 1.5
+TURN_MAX_WAIT_SECONDS = 20  # بعدها نعتذر بدل الانتظار للأبد
+TURN_POLL_PAUSE = 1  # ثواني الصمت بين كل محاولة
+TURN_WORKERS = 32  # خيوط توليد الردود
+
+# تجهيز سياق المكالمة أثناء رسالة الترحيب
+CALL_CONTEXT_TTL = 10 * 60  # ثواني
+CALL_CONTEXT_WAIT = 0.5  # أقصى انتظار للسياق في أول دور إذا لم يكتمل
+PREFETCH_WORKERS = 8
+
+# كاش أسئلة الخدمات العامة (الردود التي لا تعتمد على المتصل)
+FAQ_CACHE_TTL = 24 * 60 * 60  # ثواني
+FAQ_CACHE_MAX_ENTRIES = 512
+FAQ_CACHE_SIMILARITY = 0.7  # أقل تشابه (حروف ثلاثية) لاعتبار السؤالين نفس السؤال
+
 # الذاكرة
 MAX_CONVERSATION_HISTORY = 6  # آخر 6 رسائل فقط
+SESSION_TTL_SECONDS = 10 * 60  # حذف المحادثة بعد 10 دقائق بدون نشاط
+SESSION_MAX_ENTRIES = 10000  # الحد الأقصى للمكالمات المحفوظة
+SESSION_SWEEP_INTERVAL = 30  # كل كم ثانية نحذف المحادثات المنتهية
+
+# مخزن الجلسات: "memory" لعملية واحدة، "sqlite" عند التشغيل بعدة عمليات (gunicorn -w N)
+SESSION_BACKEND = os.environ.get("SESSION_BACKEND", "memory")
+SESSION_DB_PATH = os.environ.get("SESSION_DB_PATH", "sessions.db")
+SESSION_LOCK_TIMEOUT = 30  # ثواني - أقصى انتظار لقفل المكالمة (أطول من أي webhook)
+SESSION_LOCK_LEASE = 10  # ثواني - صلاحية قفل المكالمة، تتجدد كل ثلثها ما دام الماسك حياً
+
+# مستودع المستخدمين: "memory" (القاموس MOCK_USERS) أو "sqlite" (جداول مفهرسة)
+USER_REPOSITORY = os.environ.get("USER_REPOSITORY", "memory")
+USERS_DB_PATH = os.environ.get("USERS_DB_PATH", "users.db")
+USERS_IDENTITY_MAP_SIZE = 4096  # مستخدمون محمّلون يبقون في الذاكرة (sqlite)
+
+# عمليات المحفظة والتجديد: قفل لكل مستخدم + سجل دائم + مفاتيح منع التكرار
+TRANSACTION_IDEMPOTENCY_TTL = 24 * 60 * 60  # ثواني - نتيجة العملية تُعاد لنفس المفتاح خلالها
+TRANSACTION_IDEMPOTENCY_MAX_ENTRIES = 10000
+TRANSACTION_MAX_RETRIES = 3  # إعادة المحاولة عند تعارض النسخة (عملية أخرى عدّلت المستخدم)
+
+# سجل المكالمات: كل دور كحدث JSON في ملفات مضغوطة تُكتب في الخلفية
+CALL_JOURNAL_ENABLED = os.environ.get("CALL_JOURNAL_ENABLED", "1") == "1"
+CALL_JOURNAL_DIR = os.environ.get("CALL_JOURNAL_DIR", "call_journal")
+CALL_JOURNAL_SEGMENT_BYTES = 8 * 1024 * 1024  # ملف جديد بعد هذا الحجم (مضغوط)
+CALL_JOURNAL_MAX_SEGMENTS = 200  # حذف الأقدم بعدها
+CALL_JOURNAL_BATCH_SIZE = 256  # أحداث في كل دفعة كتابة
+CALL_JOURNAL_FLUSH_SECONDS = 1.0  # أقصى تأخير قبل كتابة الدفعة
+CALL_JOURNAL_QUEUE_SIZE = 10000  # إذا امتلأت الطابور تُسقط الأحداث بدل انتظار القرص
+
+# مخرجات الطرفية: 0 الأخطاء فقط، 1 سطر لكل دور، 2 كل التفاصيل (بداية المكالمة والنصوص)
+CONSOLE_VERBOSITY = int(os.environ.get("CONSOLE_VERBOSITY", 1))
+
+# التذكيرات: مخزن دائم + عامل يرسل المستحق فقط
+REMINDER_DB_PATH = os.environ.get("REMINDER_DB_PATH", "reminders.db")
+REMINDER_NOTIFIER = os.environ.get("REMINDER_NOTIFIER", "console")  # "console" أو "twilio_sms"
+REMINDER_SEND_HOUR = 9  # ساعة الإرسال في يوم التذكير
+REMINDER_BATCH_SIZE = 100  # تذكيرات في كل دفعة إرسال
+REMINDER_WINDOW = 1000  # أقرب التذكيرات المحمّلة في الذاكرة
+REMINDER_LEASE_SECONDS = 60  # مدة الحجز (تتجدد قبل كل رسالة في الدفعة) - إذا لم يُؤكد الإرسال خلالها يُعاد (عامل مات مثلاً)
+REMINDER_RETRY_SECONDS = 30  # أول انتظار بعد فشل الإرسال (يتضاعف)
+REMINDER_MAX_ATTEMPTS = 5
+REMINDER_IDLE_SECONDS = 60  # أقصى نوم للعامل (لالتقاط تذكيرات أضافتها عمليات أخرى)
+
+# حملات الاتصال الاستباقي (مستندات قريبة الانتهاء)
+CAMPAIGN_DB_PATH = os.environ.get("CAMPAIGN_DB_PATH", "campaigns.db")
+CAMPAIGN_CALLS_PER_SECOND = float(os.environ.get("CAMPAIGN_CALLS_PER_SECOND", 1))  # حد الحساب عند المزود
+CAMPAIGN_MAX_CONCURRENT_CALLS = 10  # مكالمات جارية في نفس الوقت
+CAMPAIGN_MAX_ATTEMPTS = 3
+CAMPAIGN_RETRY_SECONDS = 60  # أول انتظار قبل إعادة الاتصال (يتضاعف)
+CAMPAIGN_POLL_SECONDS = 2  # كل كم ثانية نسأل عن حالة المكالمة
+FAKE_TWILIO_PORT = 8765
 
 # ==========================
 # 📋 رسائل النظام
@@ -56,6 +170,13 @@ ERROR_MESSAGE = "عذراً، صار عندي خطأ بسيط. ممكن تعيد
 
 TIMEOUT_MESSAGE = "يبدو إنك مشغول. لو تحتاج شي اتصل في أي وقت. مع السلامة."
 
+# جمل انتظار قصيرة عند تأخر الرد
+FILLER_MESSAGES = [
+    "لحظة من فضلك.",
+    "أبشر، ثواني بس.",
+    "خلني أشوف لك."
+]
+
 # ==========================
 # 🚫 كلمات الإنهاء
 # ==========================
@@ -67,6 +188,10 @@ EXIT_KEYWORDS = [
     "توقف", "قف", "stop"
 ]
 
+# كلمات تأتي أيضاً داخل كلام عادي ("بس ابغى..."، "تمام جددها")
+# تُعتبر إنهاء فقط إذا قالها المستخدم وحدها
+EXIT_WEAK_KEYWORDS = ["بس", "خلاص", "كفاية", "تمام", "توقف", "قف"]
+
 # ==========================
 # ✅ التحقق من الإعدادات
 # ==========================
@@ -75,7 +200,8 @@ def validate_config():
     
     errors = []
     
-    if not OPENAI_API_KEY:
+    # المزود المحلي وإعادة التشغيل لا يحتاجان مفتاحاً
+    if not OPENAI_API_KEY and LLM_BACKEND in ("openai", "record"):
         errors.append("❌ OPENAI_API_KEY غير موجود")
     
     if not TWILIO_ACCOUNT_SID:
@@ -3,8 +3,14 @@
 """
 
 from datetime import datetime, timedelta
+from functools import lru_cache
 import random
 
+from config import TRANSACTION_MAX_RETRIES
+from repository import create_user_repository, renewal_record
+from transactions import run_once, new_reference_number, TransactionError, StaleUserError, InsufficientFundsError
+from reminders import get_reminder_scheduler
+
 # ==========================
 # 👥 مستخدمي أبشر المحسّن
 # ==========================
@@ -127,6 +133,9 @@ MOCK_USERS = {
     }
 }
 
+# كل البحث والتعديل يمر عبر المستودع (القاموس نفسه أو SQLite حسب USER_REPOSITORY)
+users = create_user_repository(seed_users=MOCK_USERS)
+
 # ==========================
 # 🔍 دوال البحث والتعرف
 # ==========================
@@ -145,87 +154,121 @@ def get_user_by_phone(phone_number):
     if not clean_phone.startswith('+'):
         clean_phone = f"+966{clean_phone.lstrip('0')}"
     
-    return MOCK_USERS.get(clean_phone)
+    return users.get_by_phone(clean_phone)
+
+def get_user_by_national_id(national_id):
+    """الحصول على بيانات المستخدم برقم الهوية"""
+    return users.get_by_national_id(national_id)
+
+def find_worker_by_iqama(iqama_number):
+    """
+    صاحب العمل والعامل برقم الإقامة (بدون المرور على كل المستخدمين)
+    
+    Returns:
+        (user, worker) أو (None, None)
+    """
+    return users.find_worker(iqama_number)
+
+# ==========================
+# 📣 تغيّر تواريخ الانتهاء
+# ==========================
+# من يحتاج يعرف عن كل تاريخ انتهاء يتغير (فهرس الانتهاء، التذكيرات...)
+expiry_listeners = []
+
+def on_expiry_change(callback):
+    """
+    تسجيل دالة تُستدعى بعد كل تجديد
+    
+    Args:
+        callback: دالة (user, doc_type, doc_number, old_expiry, new_expiry)
+    """
+    expiry_listeners.append(callback)
+
+def notify_expiry_change(user, doc_type, doc_number, old_expiry, new_expiry):
+    """إبلاغ المسجلين بتغير تاريخ انتهاء مستند"""
+    for callback in expiry_listeners:
+        try:
+            callback(user, doc_type, doc_number, old_expiry, new_expiry)
+        except Exception as e:
+            print(f"❌ خطأ في تحديث تاريخ الانتهاء: {e}")
+
+@lru_cache(maxsize=65536)
+def parse_date(date_str):
+    """تحويل YYYY-MM-DD إلى datetime (محفوظ - نفس التواريخ تتكرر في كل مكالمة)"""
+    return datetime.strptime(date_str, "%Y-%m-%d")
 
-def calculate_days_until(date_str):
+def calculate_days_until(date_str, now=None):
     """
     حساب عدد الأيام المتبقية حتى تاريخ معين
     
     Args:
         date_str: التاريخ بصيغة YYYY-MM-DD
+        now: الوقت الحالي (يُمرر مرة واحدة عند فحص عدة مستندات)
     
     Returns:
         عدد الأيام (سالب إذا انتهى)
     """
     try:
-        target_date = datetime.strptime(date_str, "%Y-%m-%d")
-        today = datetime.now()
+        target_date = parse_date(date_str)
+        today = now or datetime.now()
         delta = target_date - today
         return delta.days
     except:
         return 999
 
-def get_expiring_documents(user):
+def describe_document(doc_type, doc_data, days_left):
+    """مستند شخصي بالشكل المستخدم في قائمة المستندات المنتهية"""
+    return {
+        "type": doc_type,
+        "name_ar": get_document_name_ar(doc_type),
+        "number": doc_data["number"],
+        "expiry_date": doc_data["expiry_date"],
+        "days_left": days_left,
+        "status": "منتهي" if days_left < 0 else "قريب الانتهاء",
+        "renewal_fee": doc_data.get("renewal_fee", 0)
+    }
+
+def describe_worker(worker, days_left):
+    """إقامة عامل بالشكل المستخدم في قائمة المستندات المنتهية"""
+    return {
+        "type": "iqama",
+        "name_ar": f"إقامة {worker['name']}",
+        "number": worker["iqama_number"],
+        "expiry_date": worker["iqama_expiry"],
+        "days_left": days_left,
+        "status": "منتهية" if days_left < 0 else "قريبة الانتهاء",
+        "renewal_fee": worker.get("renewal_fee", 650)
+    }
+
+def get_expiring_documents(user, now=None):
     """
     الحصول على المستندات القريبة من الانتهاء
     
     Args:
         user: بيانات المستخدم
+        now: الوقت الحالي (الافتراضي: الآن)
     
     Returns:
         قائمة المستندات المنتهية أو القريبة من الانتهاء
     """
     expiring = []
+    now = now or datetime.now()
+    
+    # المرشحون فقط من المستودع (فهرس تاريخ الانتهاء في sqlite) - يوم زيادة لأن الأيام تُحسب من الآن لا من بداية اليوم
+    until = (now.date() + timedelta(days=31)).strftime("%Y-%m-%d")
+    candidate_documents, candidate_workers = users.expiring_candidates(user, until)
     
     # فحص المستندات الشخصية
-    for doc_type, doc_data in user.get("documents", {}).items():
-        days_left = calculate_days_until(doc_data["expiry_date"])
-        
-        if days_left < 0:
-            expiring.append({
-                "type": doc_type,
-                "name_ar": get_document_name_ar(doc_type),
-                "number": doc_data["number"],
-                "expiry_date": doc_data["expiry_date"],
-                "days_left": days_left,
-                "status": "منتهي",
-                "renewal_fee": doc_data.get("renewal_fee", 0)
-            })
-        elif days_left <= 30:
-            expiring.append({
-                "type": doc_type,
-                "name_ar": get_document_name_ar(doc_type),
-                "number": doc_data["number"],
-                "expiry_date": doc_data["expiry_date"],
-                "days_left": days_left,
-                "status": "قريب الانتهاء",
-                "renewal_fee": doc_data.get("renewal_fee", 0)
-            })
+    for doc_type, doc_data in candidate_documents:
+        days_left = calculate_days_until(doc_data["expiry_date"], now)
+        if days_left <= 30:
+            expiring.append(describe_document(doc_type, doc_data, days_left))
     
     # فحص إقامات العمالة
-    for worker in user.get("workers", []):
-        days_left = calculate_days_until(worker["iqama_expiry"])
-        
-        if days_left < 0:
-            expiring.append({
-                "type": "iqama",
-                "name_ar": f"إقامة {worker['name']}",
-                "number": worker["iqama_number"],
-                "expiry_date": worker["iqama_expiry"],
-                "days_left": days_left,
-                "status": "منتهية",
-                "renewal_fee": worker.get("renewal_fee", 650)
-            })
-        elif days_left <= 30:
-            expiring.append({
-                "type": "iqama",
-                "name_ar": f"إقامة {worker['name']}",
-                "number": worker["iqama_number"],
-                "expiry_date": worker["iqama_expiry"],
-                "days_left": days_left,
-                "status": "قريبة الانتهاء",
-                "renewal_fee": worker.get("renewal_fee", 650)
-            })
+    for worker in candidate_workers:
+        days_left = calculate_days_until(worker["iqama_expiry"], now)
+        if days_left <= 30:
+            expiring.append(describe_worker(worker, days_left))
     
     # ترتيب حسب الأولوية (المنتهي أولاً، ثم الأقرب)
     expiring.sort(key=lambda x: (0 if x["days_left"] < 0 else 1, x["days_left"]))
@@ -245,104 +288,270 @@ def get_document_name_ar(doc_type):
 # ==========================
 # 💼 عمليات التجديد
 # ==========================
-def renew_document(user, doc_type, doc_number, use_wallet=False):
+def renew_document(user, doc_type, doc_number, use_wallet=False, idempotency_key=None):
     """
     تجديد مستند (محاكاة)
     
+    يتم تحت قفل المستخدم كعملية واحدة في المستودع (تاريخ الانتهاء + الخصم + قيد السجل)،
+    فالطلبات المتداخلة لا تخصم مرتين ولا تجعل الرصيد سالباً.
+    
     Args:
         user: بيانات المستخدم
         doc_type: نوع المستند
         doc_number: رقم المستند
         use_wallet: استخدام المحفظة العائلية
+        idempotency_key: مفتاح منع التكرار (من رقم المكالمة والدور) - نفس المفتاح يرجع نفس النتيجة
     
     Returns:
         نتيجة التجديد
     """
     
-    # تجديد هوية/جواز/رخصة
-    if doc_type in ["national_id", "passport", "drivers_license"]:
-        doc = user["documents"].get(doc_type)
-        
-        if not doc or doc["number"] != doc_number:
-            return {
-                "success": False,
-                "message": "المستند غير موجود"
-            }
-        
-        fee = doc.get("renewal_fee", 300)
-        
-        # فحص المحفظة إذا طلب الدفع منها
-        if use_wallet:
-            wallet_balance = user["family_wallet"]["balance"]
-            if wallet_balance < fee:
-                return {
-                    "success": False,
-                    "message": f"رصيد المحفظة غير كافي. الرصيد الحالي: {wallet_balance} ريال"
-                }
-            
-            # خصم من المحفظة
-            user["family_wallet"]["balance"] -= fee
-        
-        # تحديث تاريخ الانتهاء
-        old_expiry = doc["expiry_date"]
-        new_expiry = (datetime.now() + timedelta(days=365*10)).strftime("%Y-%m-%d")
-        doc["expiry_date"] = new_expiry
-        doc["status"] = "ساري"
+    return _run_renewal(
+        user, idempotency_key,
+        lambda current: _renew_document(current, doc_type, doc_number, use_wallet, idempotency_key)
+    )
+
+def _run_renewal(user, idempotency_key, renew):
+    """
+    تنفيذ التجديد مرة واحدة لكل مفتاح تحت قفل المستخدم، مع إعادة المحاولة عند تعارض النسخة
+    
+    Args:
+        renew: دالة (user) تنفذ التجديد على أحدث نسخة من المستخدم
+    """
+    
+    def find_applied(key):
+        entry = users.find_ledger_entry(key)
+        return renewal_result(entry) if entry else None
+    
+    def operation():
+        current = user
+        for _ in range(TRANSACTION_MAX_RETRIES):
+            try:
+                return renew(current)
+            except StaleUserError:
+                # عملية أخرى عدّلت المستخدم: نحمّله من جديد (وربما نفذت نفس الطلب)
+                applied = find_applied(idempotency_key) if idempotency_key else None
+                if applied:
+                    return applied
+                current = users.get_by_phone(user["phone"]) or user
+            except TransactionError as e:
+                print(f"❌ فشل التجديد: {e}")
+                break
         
         return {
-            "success": True,
-            "document_type": get_document_name_ar(doc_type),
-            "document_number": doc_number,
-            "old_expiry": old_expiry,
-            "new_expiry": new_expiry,
-            "fee": fee,
-            "payment_method": "المحفظة العائلية" if use_wallet else "مدى",
-            "wallet_balance": user["family_wallet"]["balance"] if use_wallet else None,
-            "reference_number": f"REF{int(datetime.now().timestamp())}",
-            "message": "تم التجديد بنجاح"
+            "success": False,
+            "message": "ما قدرت أكمل التجديد الحين، جرب مرة ثانية"
         }
     
-    # تجديد إقامة
-    elif doc_type == "iqama":
-        for worker in user.get("workers", []):
-            if worker["iqama_number"] == doc_number:
-                fee = worker.get("renewal_fee", 650)
-                
-                if use_wallet:
-                    wallet_balance = user["family_wallet"]["balance"]
-                    if wallet_balance < fee:
-                        return {
-                            "success": False,
-                            "message": f"رصيد المحفظة غير كافي. الرصيد: {wallet_balance} ريال"
-                        }
-                    user["family_wallet"]["balance"] -= fee
-                
-                old_expiry = worker["iqama_expiry"]
-                new_expiry = (datetime.now() + timedelta(days=365)).strftime("%Y-%m-%d")
-                worker["iqama_expiry"] = new_expiry
-                worker["status"] = "سارية"
-                
-                return {
-                    "success": True,
-                    "document_type": f"إقامة {worker['name']}",
-                    "document_number": doc_number,
-                    "old_expiry": old_expiry,
-                    "new_expiry": new_expiry,
-                    "fee": fee,
-                    "payment_method": "المحفظة العائلية" if use_wallet else "مدى",
-                    "wallet_balance": user["family_wallet"]["balance"] if use_wallet else None,
-                    "reference_number": f"REF{int(datetime.now().timestamp())}",
-                    "message": "تم التجديد بنجاح"
-                }
-        
+    return run_once(user["phone"], idempotency_key, operation, find_applied)
+
+def _renew_document(user, doc_type, doc_number, use_wallet, idempotency_key):
+    """التجديد نفسه (داخل قفل المستخدم)"""
+    
+    item = renewal_item(user, doc_type, doc_number)
+    if "message" in item:
+        return {"success": False, "message": item["message"]}
+    
+    entry = {
+        "reference_number": new_reference_number(),
+        "idempotency_key": idempotency_key,
+        "phone": user["phone"],
+        "doc_type": doc_type,
+        "doc_number": doc_number,
+        "description": item["description"],
+        "method": "wallet" if use_wallet else "mada",
+        "amount": item["fee"],
+        "old_expiry": item["old_expiry"],
+        "new_expiry": item["new_expiry"],
+        "created_at": datetime.now().isoformat(timespec="seconds")
+    }
+    
+    # الرصيد يُفحص مرة ثانية وقت الخصم داخل المستودع
+    try:
+        users.apply_renewals(user, [(doc_type, doc_number, item["new_expiry"], item["status"])],
+                             item["fee"] if use_wallet else 0, entry)
+    except InsufficientFundsError as e:
+        return {
+            "success": False,
+            "message": f"رصيد المحفظة غير كافي. الرصيد الحالي: {e.balance} ريال"
+        }
+    
+    notify_expiry_change(user, doc_type, doc_number, item["old_expiry"], item["new_expiry"])
+    
+    return renewal_result(entry)
+
+def renewal_item(user, doc_type, doc_number):
+    """
+    تسعير تجديد مستند واحد وتاريخه الجديد (بدون أي تعديل)
+    
+    Returns:
+        {doc_type, doc_number, description, fee, old_expiry, new_expiry, status}
+        أو {"message": سبب الرفض} إذا لم يوجد المستند
+    """
+    if doc_type not in ["national_id", "passport", "drivers_license", "iqama"]:
+        return {"message": "نوع المستند غير معروف"}
+    
+    record, expiry_field = renewal_record(user, doc_type, doc_number)
+    if record is None:
+        return {"message": "رقم الإقامة غير موجود" if doc_type == "iqama" else "المستند غير موجود"}
+    
+    # هوية/جواز/رخصة: 10 سنوات، إقامة: سنة
+    if doc_type == "iqama":
+        fee = record.get("renewal_fee", 650)
+        new_expiry = (datetime.now() + timedelta(days=365)).strftime("%Y-%m-%d")
+        status = "سارية"
+        description = f"إقامة {record['name']}"
+    else:
+        fee = record.get("renewal_fee", 300)
+        new_expiry = (datetime.now() + timedelta(days=365*10)).strftime("%Y-%m-%d")
+        status = "ساري"
+        description = get_document_name_ar(doc_type)
+    
+    return {
+        "doc_type": doc_type,
+        "doc_number": doc_number,
+        "description": description,
+        "fee": fee,
+        "old_expiry": record[expiry_field],
+        "new_expiry": new_expiry,
+        "status": status
+    }
+
+def renewal_result(entry):
+    """نتيجة التجديد من قيد سجل المحفظة (نفس الشكل عند إعادة الطلب)"""
+    if entry.get("items") is not None:
+        return bulk_renewal_result(entry)
+    
+    use_wallet = entry["method"] == "wallet"
+    return {
+        "success": True,
+        "document_type": entry["description"],
+        "document_number": entry["doc_number"],
+        "old_expiry": entry["old_expiry"],
+        "new_expiry": entry["new_expiry"],
+        "fee": entry["amount"],
+        "payment_method": "المحفظة العائلية" if use_wallet else "مدى",
+        "wallet_balance": entry["balance_after"] if use_wallet else None,
+        "reference_number": entry["reference_number"],
+        "message": "تم التجديد بنجاح"
+    }
+
+# ==========================
+# 📦 تجديد كل المستندات
+# ==========================
+def quote_renewals(user, documents):
+    """
+    تسعير تجديد قائمة مستندات دفعة واحدة
+    
+    Args:
+        user: بيانات المستخدم
+        documents: مستندات بشكل get_expiring_documents (type، number)
+    
+    Returns:
+        {"items": [...], "total_fee", "wallet_balance", "shortage"} - المستندات غير الموجودة تُتجاهل
+    """
+    items = []
+    for document in documents:
+        item = renewal_item(user, document["type"], document["number"])
+        if "message" not in item:
+            items.append(item)
+    
+    total_fee = sum(item["fee"] for item in items)
+    wallet_balance = user.get("family_wallet", {}).get("balance", 0)
+    
+    return {
+        "items": items,
+        "total_fee": total_fee,
+        "wallet_balance": wallet_balance,
+        "shortage": max(0, total_fee - wallet_balance)
+    }
+
+def renew_documents(user, documents, use_wallet=False, idempotency_key=None):
+    """
+    تجديد عدة مستندات بعملية واحدة: خصم واحد من المحفظة بالمجموع ورقم عملية واحد
+    
+    إما أن تتجدد كلها أو لا يتجدد شيء (لا خصم جزئي).
+    
+    Args:
+        user: بيانات المستخدم
+        documents: مستندات بشكل get_expiring_documents (type، number)
+        use_wallet: الدفع من المحفظة العائلية
+        idempotency_key: مفتاح منع التكرار
+    
+    Returns:
+        نتيجة التجديد: documents (نتيجة كل مستند)، total_fee، wallet_balance، reference_number
+    """
+    
+    return _run_renewal(
+        user, idempotency_key,
+        lambda current: _renew_documents(current, documents, use_wallet, idempotency_key)
+    )
+
+def _renew_documents(user, documents, use_wallet, idempotency_key):
+    """التجديد الجماعي نفسه (داخل قفل المستخدم)"""
+    
+    quote = quote_renewals(user, documents)
+    items = quote["items"]
+    if not items:
+        return {"success": False, "message": "المستندات غير موجودة"}
+    
+    entry = {
+        "reference_number": new_reference_number(),
+        "idempotency_key": idempotency_key,
+        "phone": user["phone"],
+        "doc_type": "bulk",
+        "doc_number": None,
+        "description": "، ".join(item["description"] for item in items),
+        "method": "wallet" if use_wallet else "mada",
+        "amount": quote["total_fee"],
+        "old_expiry": None,
+        "new_expiry": None,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "items": [
+            {field: item[field] for field in ("doc_type", "doc_number", "description", "fee", "old_expiry", "new_expiry")}
+            for item in items
+        ]
+    }
+    
+    try:
+        users.apply_renewals(
+            user,
+            [(item["doc_type"], item["doc_number"], item["new_expiry"], item["status"]) for item in items],
+            quote["total_fee"] if use_wallet else 0,
+            entry
+        )
+    except InsufficientFundsError as e:
         return {
             "success": False,
-            "message": "رقم الإقامة غير موجود"
+            "message": f"رصيد المحفظة غير كافي. الرصيد الحالي: {e.balance} ريال",
+            "total_fee": quote["total_fee"]
         }
     
+    for item in items:
+        notify_expiry_change(user, item["doc_type"], item["doc_number"], item["old_expiry"], item["new_expiry"])
+    
+    return renewal_result(entry)
+
+def bulk_renewal_result(entry):
+    """نتيجة التجديد الجماعي من قيده في السجل"""
+    use_wallet = entry["method"] == "wallet"
     return {
-        "success": False,
-        "message": "نوع المستند غير معروف"
+        "success": True,
+        "documents": [
+            {
+                "document_type": item["description"],
+                "document_number": item["doc_number"],
+                "old_expiry": item["old_expiry"],
+                "new_expiry": item["new_expiry"],
+                "fee": item["fee"]
+            }
+            for item in entry["items"]
+        ],
+        "total_fee": entry["amount"],
+        "payment_method": "المحفظة العائلية" if use_wallet else "مدى",
+        "wallet_balance": entry["balance_after"] if use_wallet else None,
+        "reference_number": entry["reference_number"],
+        "message": "تم التجديد بنجاح"
     }
 
 # ==========================
@@ -362,23 +571,29 @@ def create_reminder(user, doc_info, days_before=5):
     """
     
     reminder_date = (datetime.strptime(doc_info["expiry_date"], "%Y-%m-%d") - timedelta(days=days_before)).strftime("%Y-%m-%d")
+    message = f"تذكير: {doc_info['name_ar']} رقم {doc_info['number']} سينتهي في {doc_info['expiry_date']}"
     
-    reminder = {
-        "reminder_id": f"REM{int(datetime.now().timestamp())}",
-        "document_type": doc_info["name_ar"],
-        "document_number": doc_info["number"],
-        "expiry_date": doc_info["expiry_date"],
-        "reminder_date": reminder_date,
-        "message": f"تذكير: {doc_info['name_ar']} رقم {doc_info['number']} سينتهي في {doc_info['expiry_date']}",
-        "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    }
+    # المخزن الدائم يعطي رقماً فريداً، ونفس المستند بنفس اليوم لا يُسجل مرتين
+    reminder_id, created = get_reminder_scheduler().schedule(
+        user["phone"], doc_info["name_ar"], doc_info["number"], doc_info["expiry_date"], reminder_date, message
+    )
     
-    user.setdefault("reminders", []).append(reminder)
+    if created:
+        user.setdefault("reminders", []).append({
+            "reminder_id": reminder_id,
+            "document_type": doc_info["name_ar"],
+            "document_number": doc_info["number"],
+            "expiry_date": doc_info["expiry_date"],
+            "reminder_date": reminder_date,
+            "message": message,
+            "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        })
     
     return {
         "success": True,
-        "reminder_id": reminder["reminder_id"],
+        "reminder_id": reminder_id,
         "reminder_date": reminder_date,
+        "already_set": not created,
         "message": f"تم ضبط تذكير قبل {days_before} أيام من الانتهاء"
     }
 
@@ -0,0 +1,179 @@
+"""
+فهرس الانتهاء - كل المستندات والإقامات في كل المستخدمين مرتبة حسب تاريخ الانتهاء
+لسؤال "مين ينتهي عنده شي خلال الأيام الجاية؟" بدون المرور على كل المستخدمين
+
+الترتيب على رقم اليوم (ordinal) والبحث بـ bisect، ويتحدث مع كل تجديد عبر on_expiry_change
+"""
+
+import threading
+from bisect import bisect_left, bisect_right, insort
+from datetime import date, datetime, timedelta
+
+from data import users, parse_date, calculate_days_until, describe_document, describe_worker, on_expiry_change
+
+def _ordinal(date_str):
+    """رقم اليوم للتاريخ، أو None إذا كان التاريخ غير صالح (لا يُفهرس - مثل 999 في calculate_days_until)"""
+    try:
+        return parse_date(date_str).toordinal()
+    except (TypeError, ValueError):
+        return None
+
+class ExpiryIndex:
+    """
+    فهرس تواريخ الانتهاء لكل السكان
+
+    • _entries: قائمة مرتبة من (ordinal, phone, doc_type, number)
+    • _positions: (phone, doc_type, number) -> ordinal لحذف المدخل القديم عند التجديد
+    النتائج تُبنى فقط للمدخلات داخل النطاق، فلا يُحمّل أي مستخدم آخر.
+    """
+
+    def __init__(self, repository=users):
+        self.repository = repository
+        self._entries = []
+        self._positions = {}
+        self._lock = threading.Lock()
+
+        self.updates = 0
+
+    def rebuild(self):
+        """بناء الفهرس من المستودع (مرة عند البدء، أو بعد تعديلات من عملية أخرى)"""
+        positions = {}
+        for phone, doc_type, number, expiry_date, *_ in self.repository.iter_expiry_dates():
+            ordinal = _ordinal(expiry_date)
+            if ordinal is not None:
+                positions[(phone, doc_type, number)] = ordinal
+
+        entries = sorted((ordinal, *key) for key, ordinal in positions.items())
+
+        with self._lock:
+            self._entries = entries
+            self._positions = positions
+
+        return len(entries)
+
+    def update(self, phone, doc_type, number, expiry_date):
+        """نقل مستند لتاريخ انتهائه الجديد (أو إضافته إذا لم يكن موجوداً)"""
+        key = (phone, doc_type, number)
+        ordinal = _ordinal(expiry_date)
+
+        with self._lock:
+            old_ordinal = self._positions.pop(key, None)
+            if old_ordinal is not None:
+                position = bisect_left(self._entries, (old_ordinal, *key))
+                if position < len(self._entries) and self._entries[position] == (old_ordinal, *key):
+                    del self._entries[position]
+
+            if ordinal is not None:
+                insort(self._entries, (ordinal, *key))
+                self._positions[key] = ordinal
+
+            self.updates += 1
+
+    def _on_expiry_change(self, user, doc_type, doc_number, old_expiry, new_expiry):
+        self.update(user["phone"], doc_type, doc_number, new_expiry)
+
+    def _range(self, first_ordinal, last_ordinal):
+        """المدخلات بين يومين (شامل) - نسخة من الشريحة حتى لا يمسك القفل أثناء التحميل"""
+        with self._lock:
+            start = bisect_left(self._entries, (first_ordinal,))
+            end = bisect_right(self._entries, (last_ordinal, "\uffff"))
+            return self._entries[start:end]
+
+    def _resolve(self, phone, doc_type, number):
+        """(user, record) للمدخل - record هو قاموس المستند أو العامل داخل user"""
+        if doc_type == "iqama":
+            user, worker = self.repository.find_worker(number)
+            return (user, worker) if user is not None and user["phone"] == phone else (None, None)
+
+        user = self.repository.get_by_phone(phone)
+        doc = user.get("documents", {}).get(doc_type) if user else None
+        return (user, doc) if doc is not None and doc["number"] == number else (None, None)
+
+    def between(self, start_date, end_date, now=None):
+        """
+        كل المستندات التي تنتهي بين تاريخين (شامل)
+
+        Args:
+            start_date, end_date: date أو datetime أو YYYY-MM-DD
+            now: لحساب الأيام المتبقية (الافتراضي: الآن)
+
+        Returns:
+            [(user, document), ...] مرتبة حسب تاريخ الانتهاء، والمستند بنفس شكل get_expiring_documents
+        """
+        now = now or datetime.now()
+        results = []
+
+        for _, phone, doc_type, number in self._range(_to_ordinal(start_date), _to_ordinal(end_date)):
+            user, record = self._resolve(phone, doc_type, number)
+            if record is None:
+                continue
+
+            if doc_type == "iqama":
+                document = describe_worker(record, calculate_days_until(record["iqama_expiry"], now))
+            else:
+                document = describe_document(doc_type, record, calculate_days_until(record["expiry_date"], now))
+            results.append((user, document))
+
+        return results
+
+    def expiring_within(self, days=30, include_expired=False, now=None):
+        """
+        المستندات التي تبقى لها `days` يوم أو أقل (نفس حساب calculate_days_until)
+
+        Args:
+            days: عدد الأيام
+            include_expired: يشمل المنتهية مسبقاً
+            now: الوقت الحالي (الافتراضي: الآن)
+
+        Returns:
+            [(user, document), ...]
+        """
+        now = now or datetime.now()
+        today = now.date()
+
+        # الأيام تُحسب من الآن: بعد منتصف الليل تاريخ اليوم+31 يعطي 30 يوم
+        extra_day = 1 if now != datetime.combine(today, datetime.min.time()) else 0
+        last = today + timedelta(days=days + extra_day)
+        first = date.min if include_expired else today + timedelta(days=extra_day)
+
+        return [
+            (user, document) for user, document in self.between(first, last, now)
+            if document["days_left"] <= days and (include_expired or document["days_left"] >= 0)
+        ]
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "documents": len(self._entries),
+                "first_expiry": _from_ordinal(self._entries[0][0]) if self._entries else None,
+                "last_expiry": _from_ordinal(self._entries[-1][0]) if self._entries else None,
+                "updates": self.updates
+            }
+
+def _to_ordinal(value):
+    if isinstance(value, str):
+        return parse_date(value).toordinal()
+    return value.toordinal()
+
+def _from_ordinal(ordinal):
+    return datetime.fromordinal(ordinal).strftime("%Y-%m-%d")
+
+# ==========================
+# 🗂️ الفهرس المشترك
+# ==========================
+_shared_index = None
+_shared_lock = threading.Lock()
+
+def get_expiry_index():
+    """الفهرس المشترك - يُبنى عند أول استخدام ويتحدث مع كل تجديد بعدها"""
+    global _shared_index
+    with _shared_lock:
+        if _shared_index is None:
+            index = ExpiryIndex()
+            on_expiry_change(index._on_expiry_change)
+            index.rebuild()
+            _shared_index = index
+    return _shared_index
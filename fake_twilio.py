@@ -0,0 +1,214 @@
+"""
+خادم Twilio REST وهمي - لتجربة الحملات بدون مكالمات حقيقية ولا تكلفة
+
+يدعم نفس المسارات التي تستخدمها مكتبة twilio:
+• POST /2010-04-01/Accounts/<sid>/Calls.json     إنشاء مكالمة
+• GET  /2010-04-01/Accounts/<sid>/Calls/<sid>.json  حالة المكالمة
+• POST /2010-04-01/Accounts/<sid>/Messages.json  إرسال SMS
+
+ويحاكي حد المكالمات في الثانية عند المزود (خطأ 429 / 20429)، والرنين والرد والانشغال،
+واختيارياً يطلب TwiML من رابط المكالمة (/voice) عند الرد كما يفعل Twilio.
+
+التشغيل:
+    python fake_twilio.py
+"""
+
+import time
+import uuid
+import random
+import logging
+import threading
+from collections import deque
+
+import requests
+from flask import Flask, request, jsonify
+from werkzeug.serving import make_server
+
+from config import FAKE_TWILIO_PORT
+
+# نتائج المكالمات المحتملة ونسبها
+DEFAULT_OUTCOMES = {"completed": 0.7, "no-answer": 0.15, "busy": 0.1, "failed": 0.05}
+
+class FakeTwilio:
+    """
+    حالة الخادم الوهمي
+
+    المكالمة تمر بـ queued -> ringing -> in-progress -> completed حسب الوقت،
+    أو تنتهي بـ busy / no-answer / failed بعد الرنين.
+    """
+
+    def __init__(self, cps=1, outcomes=None, ring_seconds=(0.2, 1.0), talk_seconds=(0.5, 2.0),
+                 fetch_twiml=False, seed=None):
+        """
+        Args:
+            cps: حد المكالمات والرسائل في الثانية (مثل حد الحساب عند Twilio)
+            outcomes: نسب نتائج المكالمات
+            ring_seconds, talk_seconds: مدى مدة الرنين والمكالمة
+            fetch_twiml: طلب رابط المكالمة عند الرد (للتأكد من أن /voice يعمل)
+        """
+        self.cps = cps
+        self.outcomes = outcomes or DEFAULT_OUTCOMES
+        self.ring_seconds = ring_seconds
+        self.talk_seconds = talk_seconds
+        self.fetch_twiml = fetch_twiml
+        self.random = random.Random(seed)
+
+        self.calls = {}
+        self.messages = {}
+        self._recent = deque()  # أوقات آخر الطلبات لحساب الحد
+        self._lock = threading.Lock()
+
+        self.rejected = 0
+        self.twiml_fetches = 0
+        self.twiml_errors = 0
+
+    def _allow(self, now):
+        """هل يُسمح بطلب جديد في آخر ثانية؟ - داخل القفل"""
+        while self._recent and now - self._recent[0] >= 1.0:
+            self._recent.popleft()
+        if len(self._recent) >= self.cps:
+            self.rejected += 1
+            return False
+        self._recent.append(now)
+        return True
+
+    def create_call(self, to, from_, url):
+        now = time.monotonic()
+        with self._lock:
+            if not self._allow(now):
+                return None
+
+            outcome = self.random.choices(list(self.outcomes), weights=list(self.outcomes.values()))[0]
+            ring = self.random.uniform(*self.ring_seconds)
+            call = {
+                "sid": f"CA{uuid.uuid4().hex}",
+                "to": to,
+                "from": from_,
+                "url": url,
+                "outcome": outcome,
+                "created": now,
+                "answer_at": now + ring,
+                "end_at": now + ring + (self.random.uniform(*self.talk_seconds) if outcome == "completed" else 0),
+                "answered": False
+            }
+            self.calls[call["sid"]] = call
+        return call
+
+    def call_status(self, call):
+        """حالة المكالمة الآن (وطلب TwiML عند الرد أول مرة)"""
+        now = time.monotonic()
+        if now < call["answer_at"]:
+            return "queued" if now - call["created"] < 0.05 else "ringing"
+
+        if call["outcome"] != "completed":
+            return call["outcome"]
+
+        with self._lock:
+            first_answer = not call["answered"]
+            call["answered"] = True
+        if first_answer and self.fetch_twiml and call["url"]:
+            threading.Thread(target=self._fetch_twiml, args=(call,), daemon=True).start()
+
+        return "in-progress" if now < call["end_at"] else "completed"
+
+    def _fetch_twiml(self, call):
+        """نفس طلب Twilio لرابط المكالمة الصادرة"""
+        try:
+            response = requests.post(call["url"], data={
+                "CallSid": call["sid"], "From": call["from"], "To": call["to"], "Direction": "outbound-api"
+            }, timeout=10)
+            ok = response.status_code == 200 and "<Response>" in response.text
+        except requests.RequestException:
+            ok = False
+        with self._lock:
+            self.twiml_fetches += 1
+            if not ok:
+                self.twiml_errors += 1
+
+    def create_message(self, to, from_, body):
+        with self._lock:
+            if not self._allow(time.monotonic()):
+                return None
+            message = {"sid": f"SM{uuid.uuid4().hex}", "to": to, "from": from_, "body": body, "status": "sent"}
+            self.messages[message["sid"]] = message
+        return message
+
+    def stats(self):
+        with self._lock:
+            return {
+                "calls": len(self.calls),
+                "messages": len(self.messages),
+                "rejected_429": self.rejected,
+                "twiml_fetches": self.twiml_fetches,
+                "twiml_errors": self.twiml_errors
+            }
+
+# ==========================
+# 🌐 الخادم
+# ==========================
+def _too_many_requests():
+    return jsonify({
+        "code": 20429,
+        "message": "Too Many Requests",
+        "more_info": "https://www.twilio.com/docs/errors/20429",
+        "status": 429
+    }), 429
+
+def create_fake_app(fake):
+    """تطبيق Flask بمسارات Twilio REST"""
+    app = Flask(__name__)
+
+    @app.route("/2010-04-01/Accounts/<account_sid>/Calls.json", methods=["POST"])
+    def create_call(account_sid):
+        call = fake.create_call(request.form.get("To"), request.form.get("From"), request.form.get("Url"))
+        if call is None:
+            return _too_many_requests()
+        return jsonify(_call_payload(account_sid, call, "queued")), 201
+
+    @app.route("/2010-04-01/Accounts/<account_sid>/Calls/<call_sid>.json", methods=["GET"])
+    def fetch_call(account_sid, call_sid):
+        call = fake.calls.get(call_sid)
+        if call is None:
+            return jsonify({"code": 20404, "message": "Not Found", "status": 404}), 404
+        return jsonify(_call_payload(account_sid, call, fake.call_status(call)))
+
+    @app.route("/2010-04-01/Accounts/<account_sid>/Messages.json", methods=["POST"])
+    def create_message(account_sid):
+        message = fake.create_message(request.form.get("To"), request.form.get("From"), request.form.get("Body"))
+        if message is None:
+            return _too_many_requests()
+        return jsonify({"sid": message["sid"], "account_sid": account_sid, "to": message["to"],
+                        "from": message["from"], "body": message["body"], "status": message["status"]}), 201
+
+    @app.route("/stats", methods=["GET"])
+    def stats():
+        return jsonify(fake.stats())
+
+    return app
+
+def _call_payload(account_sid, call, status):
+    return {"sid": call["sid"], "account_sid": account_sid, "to": call["to"], "from": call["from"], "status": status}
+
+class FakeTwilioServer:
+    """تشغيل الخادم الوهمي في خيط خلفي (للحملات والاختبار المحلي)"""
+
+    def __init__(self, fake=None, host="127.0.0.1", port=FAKE_TWILIO_PORT):
+        self.fake = fake or FakeTwilio()
+        self._server = make_server(host, port, create_fake_app(self.fake), threaded=True)
+        self.base_url = f"http://{host}:{self._server.server_port}"
+        self._thread = None
+
+    def start(self):
+        logging.getLogger("werkzeug").setLevel(logging.WARNING)  # بدون سطر لكل طلب
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-twilio", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        if self._thread is not None:
+            self._thread.join()
+
+if __name__ == "__main__":
+    print(f"📞 Twilio وهمي على http://127.0.0.1:{FAKE_TWILIO_PORT}")
+    create_fake_app(FakeTwilio(fetch_twiml=True)).run(host="127.0.0.1", port=FAKE_TWILIO_PORT, threaded=True)
@@ -0,0 +1,274 @@
+"""
+التعرف على النوايا - مطابقة كل الكلمات المفتاحية بمرور واحد على النص
+بعد توحيد الكتابة العربية (الهمزات، التاء المربوطة، التشكيل، التطويل)
+ومع احترام حدود الكلمات (فـ "بس" لا تُطابق داخل "بسيط")
+"""
+
+import re
+import time
+from functools import lru_cache
+
+from config import EXIT_KEYWORDS, EXIT_WEAK_KEYWORDS
+
+# ==========================
+# 🔤 توحيد النص العربي
+# ==========================
+_TASHKEEL = re.compile("[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed\u0640]")  # تشكيل + تطويل
+_LETTER_MAP = str.maketrans({
+    "أ": "ا", "إ": "ا", "آ": "ا", "ٱ": "ا",
+    "ى": "ي", "ئ": "ي",
+    "ؤ": "و",
+    "ة": "ه"
+})
+_NON_WORD = re.compile(r"[^\w]+")
+
+def normalize_arabic(text):
+    """
+    توحيد النص للمطابقة
+
+    Returns:
+        كلمات مفصولة بمسافة واحدة، بدون تشكيل وعلامات ترقيم
+    """
+    text = _TASHKEEL.sub("", text.lower()).translate(_LETTER_MAP)
+    return " ".join(_NON_WORD.sub(" ", text).split())
+
+# ==========================
+# 📋 الكلمات المفتاحية
+# ==========================
+# "*" في آخر الكلمة = تقبل أي لاحقة (جدد* تطابق جددها، جددلي...)
+INTENT_KEYWORDS = {
+    "exit": [keyword for keyword in EXIT_KEYWORDS if keyword not in EXIT_WEAK_KEYWORDS],
+    "exit_weak": EXIT_WEAK_KEYWORDS,
+    "whats_new": ["جديد", "وش عندي", "عندي من", "وش صار"],
+    "renewal": ["جدد*", "اجدد*", "تجدد*", "نجدد*", "يجدد*", "تجديد*"],
+    "wallet": ["محفظه", "محفظت*", "رصيد*", "العائليه"],
+    "reminder": ["ذكرني", "ذكرنا", "تذكير*", "نبهني"],
+    # موافقة صريحة فقط - التأكيد يخصم من المحفظة، فلا "اي" (تعني أيضاً "أي خدمة") ولا "تمام" و"طيب" و"يلا"
+    "confirm": ["نعم", "ايوه", "ايوا", "اكيد", "اوكي", "موافق", "اوافق"],
+    "negation": ["لا", "لاء", "مو", "موب", "مب", "بلاش", "ابد", "ابدا", "مابي*", "مابغ*", "ماابي*", "ماني",
+                 "ما ابي*", "ما ابغ*", "ما اريد*", "ما ودي", "ما بي*", "ما بغيت"],
+    "greeting": ["السلام", "السلام عليكم", "مرحبا", "هلا"]
+}
+
+# نوايا تعني أن المستخدم يطلب شيئاً (تمنع الإنهاء حتى لو قال "شكراً")
+ACTION_INTENTS = frozenset({"whats_new", "renewal", "wallet", "reminder"})
+
+# الإنهاء بكلمة ضعيفة (بس، تمام...) فقط إذا كان الكلام كله من هذه النوايا
+_EXIT_ONLY_INTENTS = frozenset({"exit", "exit_weak", "confirm"})
+
+# حروف تسبق الكلمة ولا تغير معناها (والمحفظة، بالمحفظة، للتجديد)
+PROCLITICS = frozenset({"و", "ف", "ب", "ل", "ال", "وال", "بال", "فال", "لل", "ولل"})
+
+# ==========================
+# 🔎 Aho-Corasick
+# ==========================
+class _Automaton:
+    """آلة Aho-Corasick على الحروف: كل الكلمات المفتاحية في مرور واحد"""
+
+    def __init__(self):
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]
+
+    def add(self, pattern, payload):
+        node = 0
+        for char in pattern:
+            next_node = self.goto[node].get(char)
+            if next_node is None:
+                next_node = len(self.goto)
+                self.goto[node][char] = next_node
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append([])
+            node = next_node
+        self.output[node].append(payload)
+
+    def build(self):
+        """حساب روابط الفشل (BFS)"""
+        queue = [0]
+        for node in queue:
+            for char, child in self.goto[node].items():
+                queue.append(child)
+                if node:
+                    fallback = self.fail[node]
+                    while fallback and char not in self.goto[fallback]:
+                        fallback = self.fail[fallback]
+                    self.fail[child] = self.goto[fallback].get(char, 0)
+                self.output[child] = self.output[child] + self.output[self.fail[child]]
+
+    def iter_matches(self, text):
+        """(موضع آخر حرف، payload) لكل تطابق"""
+        goto, fail, output = self.goto, self.fail, self.output
+        node = 0
+        for index, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            for payload in output[node]:
+                yield index, payload
+
+def _build_automaton():
+    automaton = _Automaton()
+    for intent, keywords in INTENT_KEYWORDS.items():
+        for keyword in keywords:
+            allow_suffix = keyword.endswith("*")
+            pattern = normalize_arabic(keyword.rstrip("*"))
+            if pattern:
+                automaton.add(pattern, (intent, len(pattern), allow_suffix))
+    automaton.build()
+    return automaton
+
+_AUTOMATON = _build_automaton()
+
+# ==========================
+# 🎯 المطابقة
+# ==========================
+class IntentMatch:
+    """نتيجة المطابقة: كل النوايا الموجودة في الكلام، وهل هو طلب إنهاء"""
+
+    __slots__ = ("intents", "is_exit")
+
+    def __init__(self, intents, is_exit):
+        self.intents = intents
+        self.is_exit = is_exit
+
+    def __contains__(self, intent):
+        return intent in self.intents
+
+    def __repr__(self):
+        return f"IntentMatch({sorted(self.intents)}, is_exit={self.is_exit})"
+
+@lru_cache(maxsize=4096)
+def match_intents(text):
+    """
+    كل النوايا في الكلام بمرور واحد
+
+    النتيجة محفوظة، فكل الأماكن التي تسأل عن نفس الجملة في نفس الدور
+    (الإنهاء، التوجيه، الدفع من المحفظة) تشترك في مطابقة واحدة.
+    إذا وُجد نفي ("لا لا تجدد"، "ما ابي") تُحذف نية التأكيد وتبقى "negation".
+
+    Args:
+        text: كلام المستخدم كما هو
+
+    Returns:
+        IntentMatch
+    """
+    normalized = normalize_arabic(text)
+    if not normalized:
+        return IntentMatch(frozenset(), False)
+
+    # بداية الكلمة ورقمها لكل حرف
+    word_starts = []
+    word_index = []
+    start, index = 0, 0
+    for position, char in enumerate(normalized):
+        if char == " ":
+            start, index = position + 1, index + 1
+        word_starts.append(start)
+        word_index.append(index)
+    word_count = index + 1
+
+    intents = set()
+    exit_only_words = set()
+    last = len(normalized) - 1
+
+    for end, (intent, length, allow_suffix) in _AUTOMATON.iter_matches(normalized):
+        begin = end - length + 1
+
+        # حد الكلمة من البداية (مع السماح بحروف مثل و/ب/ال قبلها)
+        prefix = normalized[word_starts[begin]:begin]
+        if prefix and prefix not in PROCLITICS:
+            continue
+
+        # حد الكلمة من النهاية
+        if not allow_suffix and end != last and normalized[end + 1] != " ":
+            continue
+
+        intents.add(intent)
+        if intent in _EXIT_ONLY_INTENTS:
+            exit_only_words.update(range(word_index[begin], word_index[end] + 1))
+
+    # النفي يلغي التأكيد ("لا نعم"، "مو اكيد")
+    if "negation" in intents:
+        intents.discard("confirm")
+
+    is_exit = False
+    if not intents & ACTION_INTENTS:
+        if "exit" in intents:
+            is_exit = True
+        elif "exit_weak" in intents:
+            # "بس" أو "تمام" وحدها = إنهاء، لكن داخل جملة عادية لا
+            is_exit = len(exit_only_words) == word_count
+
+    return IntentMatch(frozenset(intents), is_exit)
+
+# ==========================
+# ⏱️ قياس الأداء
+# ==========================
+SAMPLE_UTTERANCES = [
+    "وش عندي من جديد",
+    "نعم جددها من المحفظة",
+    "كم رصيد محفظتي العائلية؟",
+    "ذكرني قبل ما تنتهي الإقامة",
+    "شكراً مع السلامة",
+    "بس ابغى اعرف كم باقي على جوازي",
+    "تمام",
+    "السلام عليكم كيف اجدد رخصة القيادة؟",
+    "عندي سؤال بسيط عن الخدمات",
+    "خلاص",
+]
+
+def _legacy_scan(text):
+    """المطابقة القديمة: مسح منفصل لكل نية"""
+    lower = text.lower()
+    return (
+        any(keyword in lower for keyword in EXIT_KEYWORDS),
+        any(word in lower for word in ["جديد", "عندي من", "وش عندي"]),
+        any(word in lower for word in ["جدد", "تجديد", "نعم", "أيوه"]),
+        any(word in lower for word in ["محفظة", "رصيد"]),
+        any(word in lower for word in ["ذكرني", "تذكير"]),
+        any(word in lower for word in ["محفظة", "محفظتي", "العائلية", "نعم", "أيوه", "تمام"]),
+        any(word in lower for word in ["السلام", "مرحبا", "هلا"]),
+    )
+
+# عدد مرات فحص نفس الجملة في الدور الواحد (الإنهاء، التوجيه، الدفع من المحفظة)
+CHECKS_PER_TURN = 3
+
+def run_benchmark(rounds=20000):
+    """
+    مقارنة المسح القديم بالمطابقة الجديدة
+
+    المطابقة بدون كاش أبطأ من المسح القديم (التوحيد وحده يكلف أكثر منه)،
+    والمكسب صحة المطابقة (حدود الكلمات، الهمزات والتاء المربوطة، النفي) لا السرعة.
+    الكاش يفيد فقط تكرار نفس الجملة داخل الدور، فالمقارنة العادلة لكل دور كامل.
+    """
+    uncached = match_intents.__wrapped__
+
+    def timed(func, repeats=1):
+        begin = time.perf_counter()
+        for _ in range(rounds):
+            for utterance in SAMPLE_UTTERANCES:
+                for _ in range(repeats):
+                    func(utterance)
+        return (time.perf_counter() - begin) / (rounds * len(SAMPLE_UTTERANCES)) * 1e6
+
+    legacy = timed(_legacy_scan)
+    cold = timed(uncached)
+    cached = timed(match_intents)
+
+    print("لكل جملة:")
+    print(f"  legacy scans:          {legacy:6.2f} µs")
+    print(f"  normalize_arabic فقط:  {timed(normalize_arabic):6.2f} µs")
+    print(f"  match_intents (cold):  {cold:6.2f} µs")
+    print(f"  match_intents (cache): {cached:6.2f} µs")
+    # كل جملة جديدة في الدور: أول فحص بدون كاش والباقي منه
+    print(f"لكل دور ({CHECKS_PER_TURN} فحوصات لنفس الجملة):")
+    print(f"  legacy scans:          {legacy * CHECKS_PER_TURN:6.2f} µs")
+    print(f"  match_intents:         {cold + cached * (CHECKS_PER_TURN - 1):6.2f} µs")
+    print()
+    for utterance in SAMPLE_UTTERANCES:
+        legacy_exit = _legacy_scan(utterance)[0]
+        print(f"{utterance!r:45} legacy_exit={legacy_exit!s:5} -> {uncached(utterance)}")
+
+if __name__ == "__main__":
+    run_benchmark()
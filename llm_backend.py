@@ -0,0 +1,467 @@
+"""
+واجهة مزود النماذج - المحادثة، تحويل الكلام لنص، وتحويل النص لكلام
+
+ثلاثة تنفيذات بنفس الواجهة (LLM_BACKEND):
+• openai: المزود الحقيقي (OPENAI_BASE_URL لخادم متوافق)
+• stub: رد محلي ثابت لنفس السؤال، بزمن أول توكن وسرعة توكنات قابلة للضبط - بدون شبكة
+• record / replay: تسجيل ردود المزود الحقيقي في ملفات (المفتاح = hash الجزء الثابت من الطلب)
+  ثم تقديمها بدون شبكة؛ الطلب غير المسجل في replay خطأ صريح
+
+الطلب قاموس بنفس حقول OpenAI (model, messages, temperature, max_tokens, timeout)،
+والرد ChatReply(text, usage) حيث usage قاموس موحد أو None.
+"""
+
+import os
+import re
+import json
+import time
+import asyncio
+import hashlib
+import threading
+from collections import namedtuple
+from pathlib import Path
+
+from config import (
+    LLM_BACKEND, OPENAI_API_KEY, OPENAI_BASE_URL, OPENAI_TIMEOUT,
+    OPENAI_MAX_CONNECTIONS, OPENAI_MAX_KEEPALIVE, OPENAI_KEEPALIVE_EXPIRY,
+    LLM_STUB_LATENCY, LLM_STUB_TOKENS_PER_SECOND, LLM_REPLAY_DIR, STT_MODEL
+)
+
+# رد المحادثة (أو قطعة منه في البث - آخر قطعة فيها الاستخدام فقط)
+ChatReply = namedtuple("ChatReply", ["text", "usage"])
+
+# حقول لا تغير محتوى الرد (لا تدخل في مفتاح التسجيل)
+_TRANSPORT_FIELDS = frozenset({"timeout", "stream", "stream_options"})
+
+class LLMBackendError(Exception):
+    """فشل المزود أو غيابه"""
+
+class ReplayMissError(LLMBackendError):
+    """طلب غير مسجل في وضع replay"""
+
+def _user_text(request):
+    """آخر رسالة من المستخدم في الطلب"""
+    for message in reversed(request.get("messages", [])):
+        if message.get("role") == "user":
+            return message.get("content") or ""
+    return ""
+
+def _prompt_tokens(request):
+    """تقدير عدد توكنات الطلب (حرف واحد ≈ ربع توكن) للتنفيذات التي لا تحسبه"""
+    return sum(len(message.get("content") or "") for message in request.get("messages", [])) // 4
+
+# ==========================
+# 🧩 الواجهة المشتركة
+# ==========================
+class LLMBackend:
+    """
+    واجهة مزود النماذج
+
+    available = False يعني أن المساعد يستخدم الرد الاحتياطي بدل الاستدعاء.
+    """
+
+    name = "base"
+    available = True
+
+    def chat(self, request):
+        """رد كامل -> ChatReply"""
+        raise NotImplementedError
+
+    async def chat_async(self, request):
+        """نفس chat بدون حجز خيط (app_async)"""
+        raise NotImplementedError
+
+    def chat_stream(self, request):
+        """قطع الرد بالترتيب (ChatReply لكل قطعة، والاستخدام في آخر قطعة)"""
+        raise NotImplementedError
+
+    def transcribe(self, audio_path, language="ar", model=STT_MODEL):
+        """نص الملف الصوتي"""
+        raise NotImplementedError
+
+    def speech(self, text, model, voice, speed):
+        """بايتات MP3 للنص"""
+        raise NotImplementedError
+
+    def stats(self):
+        return {"backend": self.name, "available": self.available}
+
+# ==========================
+# ☁️ OpenAI
+# ==========================
+def _openai_usage(usage):
+    """استخدام OpenAI -> قاموس موحد"""
+    if usage is None:
+        return None
+    details = getattr(usage, "prompt_tokens_details", None)
+    return {
+        "prompt_tokens": usage.prompt_tokens or 0,
+        "completion_tokens": usage.completion_tokens or 0,
+        "cached_tokens": (getattr(details, "cached_tokens", 0) or 0) if details else 0
+    }
+
+class OpenAIBackend(LLMBackend):
+    """
+    المزود الحقيقي - عميل متزامن، وعميل غير متزامن مشترك لكل الطلبات (وضع app_async)
+
+    العميل غير المتزامن بمجمّع اتصالات يبقيها مفتوحة بين الطلبات بدل فتح اتصال TLS جديد لكل دور.
+    """
+
+    name = "openai"
+
+    def __init__(self, api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL):
+        self.available = bool(api_key)
+        self.client = None
+        self.async_client = None
+        if not self.available:
+            return
+
+        import httpx
+        from openai import OpenAI, AsyncOpenAI, DefaultAsyncHttpxClient
+
+        self.client = OpenAI(api_key=api_key, base_url=base_url)
+        self.async_client = AsyncOpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            http_client=DefaultAsyncHttpxClient(
+                limits=httpx.Limits(
+                    max_connections=OPENAI_MAX_CONNECTIONS,
+                    max_keepalive_connections=OPENAI_MAX_KEEPALIVE,
+                    keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY
+                ),
+                timeout=OPENAI_TIMEOUT
+            )
+        )
+
+    def _require(self):
+        if not self.available:
+            raise LLMBackendError("OPENAI_API_KEY غير موجود")
+
+    def chat(self, request):
+        self._require()
+        response = self.client.chat.completions.create(**request)
+        return ChatReply(response.choices[0].message.content or "", _openai_usage(response.usage))
+
+    async def chat_async(self, request):
+        self._require()
+        response = await self.async_client.chat.completions.create(**request)
+        return ChatReply(response.choices[0].message.content or "", _openai_usage(response.usage))
+
+    def chat_stream(self, request):
+        self._require()
+        stream = self.client.chat.completions.create(
+            **request, stream=True, stream_options={"include_usage": True}
+        )
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield ChatReply(chunk.choices[0].delta.content, None)
+            # آخر قطعة بدون choices وفيها الاستخدام
+            if getattr(chunk, "usage", None):
+                yield ChatReply("", _openai_usage(chunk.usage))
+
+    def transcribe(self, audio_path, language="ar", model=STT_MODEL):
+        self._require()
+        with open(audio_path, "rb") as audio_file:
+            transcript = self.client.audio.transcriptions.create(
+                model=model,
+                file=audio_file,
+                language=language,
+                response_format="text"
+            )
+        return str(transcript).strip()
+
+    def speech(self, text, model, voice, speed):
+        self._require()
+        response = self.client.audio.speech.create(model=model, voice=voice, input=text, speed=speed)
+        return response.read()
+
+# ==========================
+# 🧪 المزود المحلي الثابت
+# ==========================
+STUB_REPLIES = [
+    "أبشر، هذا رد تجريبي من المزود المحلي. تحتاج شي ثاني؟",
+    "تمام، تقدر تسوي هذا من تطبيق أبشر مباشرة. أساعدك بشي ثاني؟",
+    "حاضر. الخدمة متاحة في أبشر وتأخذ دقائق بس. فيه شي ثاني؟",
+    "ما عندي تفاصيل أكثر عن هذا الحين، لكن تقدر تراجع أبشر. أخدمك بشي ثاني؟"
+]
+
+# الكلام الافتراضي إذا لم يوجد ملف نص بجانب التسجيل (audio.wav -> audio.txt)
+STUB_TRANSCRIPT = "وش الجديد عندي؟"
+
+# إطار MP3 صامت (MPEG-1 Layer III، 128kbps، 44.1kHz) ≈ 26 ملي ثانية
+_SILENT_MP3_FRAME = b"\xff\xfb\x90\x00" + bytes(413)
+_SPOKEN_CHARS_PER_SECOND = 15
+
+class StubBackend(LLMBackend):
+    """
+    نفس الطلب = نفس الرد دائماً، بدون شبكة
+
+    الزمن: latency حتى أول توكن ثم توكن (كلمة) كل 1/tokens_per_second،
+    فالرد الكامل والبث يأخذان نفس الوقت الذي يأخذه مزود بهذه السرعة.
+    """
+
+    name = "stub"
+
+    def __init__(self, latency=LLM_STUB_LATENCY, tokens_per_second=LLM_STUB_TOKENS_PER_SECOND, replies=STUB_REPLIES):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.replies = replies
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def _reply(self, request):
+        """(الكلمات، الاستخدام) - الرد يُختار بـ hash سؤال المستخدم"""
+        with self._lock:
+            self.requests += 1
+
+        digest = hashlib.sha256(_user_text(request).encode("utf-8")).digest()
+        words = self.replies[digest[0] % len(self.replies)].split()
+        words = words[:request.get("max_tokens") or len(words)]
+        usage = {"prompt_tokens": _prompt_tokens(request), "completion_tokens": len(words), "cached_tokens": 0}
+        return words, usage
+
+    def _duration(self, words):
+        return self.latency + len(words) / self.tokens_per_second
+
+    def chat(self, request):
+        words, usage = self._reply(request)
+        time.sleep(self._duration(words))
+        return ChatReply(" ".join(words), usage)
+
+    async def chat_async(self, request):
+        words, usage = self._reply(request)
+        await asyncio.sleep(self._duration(words))
+        return ChatReply(" ".join(words), usage)
+
+    def chat_stream(self, request):
+        words, usage = self._reply(request)
+        time.sleep(self.latency)
+        for index, word in enumerate(words):
+            if index:
+                time.sleep(1 / self.tokens_per_second)
+            yield ChatReply(word if index == 0 else " " + word, None)
+        yield ChatReply("", usage)
+
+    def transcribe(self, audio_path, language="ar", model=STT_MODEL):
+        time.sleep(self.latency)
+        transcript = Path(audio_path).with_suffix(".txt")
+        if transcript.exists():
+            return transcript.read_text(encoding="utf-8").strip()
+        return STUB_TRANSCRIPT
+
+    def speech(self, text, model, voice, speed):
+        """صمت بطول النطق التقريبي للنص (ملف MP3 صالح للتشغيل)"""
+        time.sleep(self.latency)
+        seconds = len(text) / _SPOKEN_CHARS_PER_SECOND / (speed or 1.0)
+        return _SILENT_MP3_FRAME * max(1, int(seconds / 0.026))
+
+    def stats(self):
+        return {
+            "backend": self.name,
+            "available": True,
+            "latency": self.latency,
+            "tokens_per_second": self.tokens_per_second,
+            "requests": self.requests
+        }
+
+# ==========================
+# 📼 التسجيل وإعادة التشغيل
+# ==========================
+def request_key(kind, payload):
+    """مفتاح ثابت للطلب: hash لـ JSON مرتب (نفس الطلب بأي ترتيب حقول = نفس المفتاح)"""
+    canonical = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(f"{kind}\n{canonical}".encode("utf-8")).hexdigest()
+
+_NUMBERS = re.compile(r"\d+(?:\.\d+)?")
+
+def stable_chat_view(payload):
+    """
+    الجزء الثابت من طلب المحادثة لمفتاح التسجيل
+    
+    معلومات المستخدم في البرومت فيها الأيام المتبقية ورصيد المحفظة، فتتغير كل يوم
+    ومع كل خصم. المفتاح يأخذ البرومت الثابت كما هو، ومعلومات المستخدم بدون أرقامها
+    (الاسم والكنية والمستندات تبقى)، والمحادثة نفسها كما هي.
+    
+    الحد: الرد المسجل يُقدم كما هو، فقد يذكر رصيداً أو أياماً من يوم التسجيل.
+    ودخول مستند جديد في قائمة "تحتاج انتباه" يغير المفتاح (سياق مختلف فعلاً).
+    """
+    from prompts import STATIC_SYSTEM_PROMPT
+    
+    messages = []
+    for message in payload.get("messages", []):
+        content = message.get("content") or ""
+        if message.get("role") == "system" and content.startswith(STATIC_SYSTEM_PROMPT):
+            content = STATIC_SYSTEM_PROMPT + _NUMBERS.sub("#", content[len(STATIC_SYSTEM_PROMPT):])
+        messages.append(dict(message, content=content))
+    return dict(payload, messages=messages)
+
+class ReplayBackend(LLMBackend):
+    """
+    ملف لكل طلب في LLM_REPLAY_DIR: <hash>.json للمحادثة والنصوص، <hash>.mp3 للصوت
+
+    • record: المسجل يُقدم من الملف، وغير المسجل يُطلب من المزود الحقيقي ويُحفظ
+    • replay: من الملفات فقط، وغير المسجل ReplayMissError
+    • مفتاح المحادثة من key_view(الطلب) - الافتراضي stable_chat_view حتى تبقى
+      التسجيلات صالحة في الأيام التالية؛ None = الطلب كاملاً بالضبط
+    """
+
+    def __init__(self, inner=None, directory=LLM_REPLAY_DIR, record=True, key_view=stable_chat_view):
+        self.inner = inner
+        self.key_view = key_view
+        self.directory = Path(directory)
+        self.record = record and inner is not None
+        self.name = "record" if self.record else "replay"
+
+        self.hits = 0
+        self.misses = 0
+        self.recorded = 0
+        self._lock = threading.Lock()
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    # ==========================
+    # 💾 الملفات
+    # ==========================
+    def _path(self, key, suffix):
+        return self.directory / f"{key}{suffix}"
+
+    def _load(self, key, suffix=".json"):
+        path = self._path(key, suffix)
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            return None
+        self._count("hits")
+        return json.loads(data)["response"] if suffix == ".json" else data
+
+    def _store(self, key, data, suffix=".json"):
+        """كتابة ذرية (ملف مؤقت ثم rename) حتى لا يقرأ أحد تسجيلاً ناقصاً"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self._path(key, suffix)
+        temporary = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        temporary.write_bytes(data)
+        os.replace(temporary, path)
+        self._count("recorded")
+
+    def _store_json(self, key, kind, payload, response):
+        entry = {"kind": kind, "request": payload, "response": response, "recorded_at": time.time()}
+        self._store(key, json.dumps(entry, ensure_ascii=False, indent=1).encode("utf-8"))
+
+    def _miss(self, kind):
+        self._count("misses")
+        if not self.record:
+            raise ReplayMissError(f"طلب {kind} غير مسجل في {self.directory}")
+
+    # ==========================
+    # 💬 المحادثة
+    # ==========================
+    @staticmethod
+    def _chat_payload(request):
+        return {field: value for field, value in request.items() if field not in _TRANSPORT_FIELDS}
+
+    def _chat_key(self, payload):
+        return request_key("chat", self.key_view(payload) if self.key_view else payload)
+
+    def chat(self, request):
+        payload = self._chat_payload(request)
+        key = self._chat_key(payload)
+        recorded = self._load(key)
+        if recorded is not None:
+            return ChatReply(recorded["text"], recorded["usage"])
+
+        self._miss("chat")
+        reply = self.inner.chat(request)
+        self._store_json(key, "chat", payload, reply._asdict())
+        return reply
+
+    async def chat_async(self, request):
+        payload = self._chat_payload(request)
+        key = self._chat_key(payload)
+        recorded = self._load(key)
+        if recorded is not None:
+            return ChatReply(recorded["text"], recorded["usage"])
+
+        self._miss("chat")
+        reply = await self.inner.chat_async(request)
+        self._store_json(key, "chat", payload, reply._asdict())
+        return reply
+
+    def chat_stream(self, request):
+        """المسجل يُقدم كلمة كلمة؛ وغير المسجل يمر من المزود كما هو ويُحفظ كاملاً في النهاية"""
+        payload = self._chat_payload(request)
+        key = self._chat_key(payload)
+        recorded = self._load(key)
+        if recorded is not None:
+            for index, word in enumerate(recorded["text"].split(" ")):
+                yield ChatReply(word if index == 0 else " " + word, None)
+            yield ChatReply("", recorded["usage"])
+            return
+
+        self._miss("chat")
+        parts, usage = [], None
+        for chunk in self.inner.chat_stream(request):
+            parts.append(chunk.text)
+            usage = chunk.usage or usage
+            yield chunk
+        self._store_json(key, "chat", payload, {"text": "".join(parts), "usage": usage})
+
+    # ==========================
+    # 🎙️ الصوت
+    # ==========================
+    def transcribe(self, audio_path, language="ar", model=STT_MODEL):
+        audio_hash = hashlib.sha256(Path(audio_path).read_bytes()).hexdigest()
+        payload = {"audio": audio_hash, "language": language, "model": model}
+        key = request_key("transcription", payload)
+        recorded = self._load(key)
+        if recorded is not None:
+            return recorded["text"]
+
+        self._miss("transcription")
+        text = self.inner.transcribe(audio_path, language, model)
+        self._store_json(key, "transcription", payload, {"text": text})
+        return text
+
+    def speech(self, text, model, voice, speed):
+        key = request_key("speech", {"text": text, "model": model, "voice": voice, "speed": speed})
+        recorded = self._load(key, ".mp3")
+        if recorded is not None:
+            return recorded
+
+        self._miss("speech")
+        audio = self.inner.speech(text, model, voice, speed)
+        self._store(key, audio, ".mp3")
+        return audio
+
+    def stats(self):
+        with self._lock:
+            return {
+                "backend": self.name,
+                "available": True,
+                "directory": str(self.directory),
+                "hits": self.hits,
+                "misses": self.misses,
+                "recorded": self.recorded
+            }
+
+# ==========================
+# 🏭 اختيار المزود
+# ==========================
+LLM_BACKENDS = {
+    "openai": OpenAIBackend,
+    "stub": StubBackend,
+    "record": lambda: ReplayBackend(OpenAIBackend(), record=True),
+    "replay": lambda: ReplayBackend(record=False)
+}
+
+def create_llm_backend(name=LLM_BACKEND):
+    """
+    إنشاء مزود النماذج حسب الإعدادات
+
+    Args:
+        name: "openai" أو "stub" أو "record" أو "replay"
+    """
+    if name not in LLM_BACKENDS:
+        raise ValueError(f"مزود نماذج غير معروف: {name}")
+    return LLM_BACKENDS[name]()
@@ -0,0 +1,483 @@
+"""
+حماية استدعاءات النموذج من ذيل الزمن ومن تعطل المزود
+
+• طلب مكرر (hedge): إذا لم يصل الرد خلال p95 آخر الطلبات الناجحة نرسل نفس الطلب مرة ثانية
+  ونأخذ أول رد ناجح - بحد أقصى LLM_HEDGE_MAX_RATIO من الطلبات حتى لا نضاعف الحمل وقت البطء العام
+• قاطع الدائرة: نافذة متحركة لنسبة الأخطاء والطلبات البطيئة؛ إذا تجاوزت الحد يُفتح القاطع
+  فيرد المساعد بالرد الاحتياطي مباشرة بدل انتظار OPENAI_TIMEOUT في كل دور،
+  وبعد LLM_BREAKER_OPEN_SECONDS يمر طلب تجربة واحد: نجح = يُغلق، فشل = يُفتح من جديد
+• كل ذلك في المقاييس: absher_events_total (llm_hedge_sent، llm_hedge_won، llm_circuit_opened ...)
+  و absher_llm_circuit_state و absher_llm_hedge_delay_seconds
+
+التجربة بمزود وهمي متذبذب ثم معطل:
+    python llm_guard.py
+"""
+
+import time
+import asyncio
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from config import (
+    LLM_HEDGE_ENABLED, LLM_HEDGE_QUANTILE, LLM_HEDGE_MIN_DELAY, LLM_HEDGE_DEFAULT_DELAY,
+    LLM_HEDGE_MAX_RATIO, LLM_HEDGE_WINDOW, LLM_HEDGE_WORKERS,
+    LLM_BREAKER_WINDOW_SECONDS, LLM_BREAKER_MIN_REQUESTS, LLM_BREAKER_ERROR_RATE,
+    LLM_BREAKER_SLOW_RATE, LLM_BREAKER_SLOW_SECONDS, LLM_BREAKER_OPEN_SECONDS
+)
+from llm_backend import LLMBackendError
+from metrics import latency
+
+# أقل عدد قياسات قبل الاعتماد على p95 المرصود
+_MIN_SAMPLES = 20
+# إعادة ترتيب النافذة كل كم قياس (p95 لا يتغير كثيراً بقياس واحد)
+_QUANTILE_REFRESH = 16
+# أقصى رصيد طلبات مكررة متراكم (دفعة واحدة بعد فترة هدوء)
+_HEDGE_BURST = 5
+
+class CircuitOpenError(LLMBackendError):
+    """القاطع مفتوح - المزود معتبر معطلاً ولم يُرسل الطلب"""
+
+# ==========================
+# ⏱️ p95 المرصود
+# ==========================
+class LatencyWindow:
+    """آخر size زمن ناجح، والنسبة المئوية منها (مخزنة وتُحدث كل _QUANTILE_REFRESH قياس)"""
+
+    def __init__(self, size=LLM_HEDGE_WINDOW):
+        self._samples = deque(maxlen=size)
+        self._since_refresh = 0
+        self._cached = {}
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+            self._since_refresh += 1
+            if self._since_refresh >= _QUANTILE_REFRESH:
+                self._cached.clear()
+                self._since_refresh = 0
+
+    def __len__(self):
+        return len(self._samples)
+
+    def quantile(self, q):
+        """القيمة بالثواني، أو None قبل _MIN_SAMPLES قياس"""
+        with self._lock:
+            if len(self._samples) < _MIN_SAMPLES:
+                return None
+            if q not in self._cached:
+                ordered = sorted(self._samples)
+                self._cached[q] = ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+            return self._cached[q]
+
+# ==========================
+# 🔌 قاطع الدائرة
+# ==========================
+class CircuitBreaker:
+    """
+    closed: كل الطلبات تمر، والنتائج تُسجل في نافذة window_seconds
+    open: لا شيء يمر حتى تنقضي open_seconds
+    half_open: طلب تجربة واحد فقط؛ نتيجته تقرر الإغلاق أو الفتح من جديد
+    """
+
+    CLOSED = "closed"
+    HALF_OPEN = "half_open"
+    OPEN = "open"
+
+    # قيمة المؤشر في /metrics
+    STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+    def __init__(self, window_seconds=LLM_BREAKER_WINDOW_SECONDS, min_requests=LLM_BREAKER_MIN_REQUESTS,
+                 error_rate=LLM_BREAKER_ERROR_RATE, slow_rate=LLM_BREAKER_SLOW_RATE,
+                 slow_seconds=LLM_BREAKER_SLOW_SECONDS, open_seconds=LLM_BREAKER_OPEN_SECONDS,
+                 metrics=latency, clock=time.monotonic):
+        self.window_seconds = window_seconds
+        self.min_requests = min_requests
+        self.error_rate = error_rate
+        self.slow_rate = slow_rate
+        self.slow_seconds = slow_seconds
+        self.open_seconds = open_seconds
+        self.metrics = metrics
+        self.clock = clock
+
+        self.state = self.CLOSED
+        self._outcomes = deque()  # (الوقت، فشل، بطيء)
+        self._failures = 0
+        self._slow = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._probe_started = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """هل يُرسل الطلب؟ (في half_open يمر طلب واحد فقط حتى تصل نتيجته)"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+
+            if self.state == self.OPEN:
+                if self.clock() - self._opened_at < self.open_seconds:
+                    return False
+                self.state = self.HALF_OPEN
+                self._probing = False
+
+            # التجربة المعلقة أكثر من open_seconds تُعتبر ضائعة (احتياط لو لم تصل نتيجتها)
+            if self._probing and self.clock() - self._probe_started < self.open_seconds:
+                return False
+            self._probing = True
+            self._probe_started = self.clock()
+
+        self.metrics.increment("llm_circuit_probe")
+        return True
+
+    def release(self):
+        """طلب أُلغي بعد allow() بدون نتيجة (CancelledError): لا يُحسب نجاحاً ولا فشلاً، ويحرر التجربة"""
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._probing = False
+
+    def record(self, success, seconds):
+        """نتيجة طلب أرسل بعد allow()"""
+        slow = seconds >= self.slow_seconds
+
+        with self._lock:
+            now = self.clock()
+
+            if self.state == self.HALF_OPEN:
+                self._probing = False
+                if success and not slow:
+                    self._reset()
+                    self.state = self.CLOSED
+                    event = "llm_circuit_closed"
+                else:
+                    self._open(now)
+                    event = "llm_circuit_opened"
+
+            elif self.state == self.OPEN:
+                # نتيجة متأخرة لطلب بدأ قبل الفتح
+                return
+
+            else:
+                self._outcomes.append((now, not success, slow))
+                self._failures += not success
+                self._slow += slow
+                self._prune(now)
+
+                total = len(self._outcomes)
+                if total < self.min_requests:
+                    return
+                if self._failures / total < self.error_rate and self._slow / total < self.slow_rate:
+                    return
+                self._open(now)
+                event = "llm_circuit_opened"
+
+        self.metrics.increment(event)
+        print(f"🔌 قاطع دائرة النموذج: {self.state}")
+
+    def _open(self, now):
+        self.state = self.OPEN
+        self._opened_at = now
+        self._reset()
+
+    def _reset(self):
+        self._outcomes.clear()
+        self._failures = 0
+        self._slow = 0
+
+    def _prune(self, now):
+        oldest = now - self.window_seconds
+        while self._outcomes and self._outcomes[0][0] < oldest:
+            _, failed, slow = self._outcomes.popleft()
+            self._failures -= failed
+            self._slow -= slow
+
+    def stats(self):
+        with self._lock:
+            self._prune(self.clock())
+            total = len(self._outcomes)
+            return {
+                "state": self.state,
+                "window_requests": total,
+                "error_rate": round(self._failures / total, 3) if total else 0.0,
+                "slow_rate": round(self._slow / total, 3) if total else 0.0
+            }
+
+# ==========================
+# 🛡️ الاستدعاء المحمي
+# ==========================
+class LLMGuard:
+    """
+    نفس chat / chat_async / chat_stream لمزود النماذج، مع الطلب المكرر وقاطع الدائرة
+
+    يرفع CircuitOpenError بدون استدعاء المزود إذا كان القاطع مفتوحاً.
+    البث لا يُكرر (القطع وصلت للمتصل فعلاً)، لكن نتيجته وزمن أول قطعة فيه تُحسب للقاطع.
+    """
+
+    def __init__(self, backend, breaker=None, hedge=LLM_HEDGE_ENABLED, quantile=LLM_HEDGE_QUANTILE,
+                 min_delay=LLM_HEDGE_MIN_DELAY, default_delay=LLM_HEDGE_DEFAULT_DELAY,
+                 max_ratio=LLM_HEDGE_MAX_RATIO, workers=LLM_HEDGE_WORKERS, metrics=latency):
+        self.backend = backend
+        self.metrics = metrics
+        self.breaker = breaker or CircuitBreaker(metrics=metrics)
+        self.hedge = hedge
+        self.quantile = quantile
+        self.min_delay = min_delay
+        self.default_delay = default_delay
+        self.max_ratio = max_ratio
+        self.latencies = LatencyWindow()
+
+        self._hedge_credit = 1.0
+        self._lock = threading.Lock()
+        # الخيوط تُنشأ عند الحاجة فقط (app_async لا يستخدمها)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="llm")
+
+    @property
+    def available(self):
+        return self.backend.available
+
+    def hedge_delay(self):
+        """الانتظار قبل الطلب المكرر: p95 المرصود (ولا أقل من min_delay)"""
+        observed = self.latencies.quantile(self.quantile)
+        return max(self.min_delay, observed if observed is not None else self.default_delay)
+
+    def _earn_hedge(self):
+        """كل طلب يضيف max_ratio لرصيد الطلبات المكررة"""
+        with self._lock:
+            self._hedge_credit = min(_HEDGE_BURST, self._hedge_credit + self.max_ratio)
+
+    def _take_hedge(self):
+        """هل نرسل طلباً مكرراً الآن؟ (ليس أثناء تجربة المزود، وبحدود الرصيد)"""
+        if not self.hedge or self.breaker.state != CircuitBreaker.CLOSED:
+            return False
+        with self._lock:
+            if self._hedge_credit < 1:
+                self.metrics.increment("llm_hedge_skipped")
+                return False
+            self._hedge_credit -= 1
+        self.metrics.increment("llm_hedge_sent")
+        return True
+
+    def _admit(self):
+        if not self.breaker.allow():
+            self.metrics.increment("llm_circuit_rejected")
+            raise CircuitOpenError("قاطع الدائرة مفتوح - المزود معطل مؤقتاً")
+        self._earn_hedge()
+
+    # ---------- متزامن ----------
+    def _attempt(self, request):
+        """طلب واحد في خيط، وزمنه يدخل نافذة p95 إذا نجح (حتى لو خسر السباق)"""
+        started = time.perf_counter()
+
+        def observe(future):
+            if future.exception() is None:
+                self.latencies.observe(time.perf_counter() - started)
+
+        future = self._executor.submit(self.backend.chat, request)
+        future.add_done_callback(observe)
+        return future
+
+    def chat(self, request):
+        """رد كامل -> ChatReply (أو CircuitOpenError / خطأ المزود)"""
+        self._admit()
+
+        started = time.perf_counter()
+        success = None
+        try:
+            reply = self._hedged(request)
+            success = True
+            return reply
+        except Exception:
+            success = False
+            raise
+        finally:
+            self._settle(success, started)
+
+    def _settle(self, success, started):
+        """نتيجة الطلب للقاطع - None = أُلغي (BaseException) فتُحرر التجربة بدون نتيجة"""
+        if success is None:
+            self.breaker.release()
+        else:
+            self.breaker.record(success, time.perf_counter() - started)
+
+    def _hedged(self, request):
+        primary = self._attempt(request)
+        done, _ = wait([primary], timeout=self.hedge_delay())
+        if done or not self._take_hedge():
+            return primary.result()
+
+        # الطلب الخاسر لا يُلغى (العميل المتزامن لا يدعم ذلك) - يكمل في خيطه ونتجاهل رده
+        hedge = self._attempt(request)
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        self.metrics.increment("llm_hedge_won")
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    # ---------- غير متزامن ----------
+    async def _attempt_async(self, request):
+        started = time.perf_counter()
+        reply = await self.backend.chat_async(request)
+        self.latencies.observe(time.perf_counter() - started)
+        return reply
+
+    async def chat_async(self, request):
+        """نفس chat بدون خيوط - والطلب الخاسر يُلغى"""
+        self._admit()
+
+        started = time.perf_counter()
+        success = None
+        try:
+            reply = await self._hedged_async(request)
+            success = True
+            return reply
+        except Exception:
+            success = False
+            raise
+        finally:
+            self._settle(success, started)
+
+    async def _hedged_async(self, request):
+        primary = asyncio.ensure_future(self._attempt_async(request))
+        done, _ = await asyncio.wait({primary}, timeout=self.hedge_delay())
+        if done or not self._take_hedge():
+            return await primary
+
+        hedge = asyncio.ensure_future(self._attempt_async(request))
+        pending = {primary, hedge}
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self.metrics.increment("llm_hedge_won")
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    # ---------- البث ----------
+    def chat_stream(self, request):
+        """قطع الرد كما هي؛ البطء يُقاس بزمن أول قطعة (الباقي يشمل وقت المستهلك)"""
+        self._admit()
+
+        started = time.perf_counter()
+        first = None
+        success = False
+        try:
+            for chunk in self.backend.chat_stream(request):
+                if first is None and chunk.text:
+                    first = time.perf_counter() - started
+                yield chunk
+            success = True
+        except GeneratorExit:
+            # المستهلك توقف (المستخدم قاطع مثلاً) - المزود لم يفشل
+            success = True
+            raise
+        finally:
+            self.breaker.record(success, first if first is not None else time.perf_counter() - started)
+
+    # ---------- المقاييس ----------
+    def register_metrics(self):
+        """مؤشرات الحالة في /metrics"""
+        self.metrics.gauge(
+            "llm_circuit_state", lambda: CircuitBreaker.STATE_VALUES[self.breaker.state],
+            "LLM circuit breaker state (0 closed, 1 half-open, 2 open)."
+        )
+        self.metrics.gauge(
+            "llm_hedge_delay_seconds", self.hedge_delay,
+            "Delay before a hedged duplicate LLM request is sent (observed p95)."
+        )
+
+    def stats(self):
+        counters = self.metrics.counters()
+        return {
+            **self.breaker.stats(),
+            "hedge_enabled": self.hedge,
+            "hedge_delay_ms": round(self.hedge_delay() * 1000, 1),
+            "latency_samples": len(self.latencies),
+            **{
+                name: counters.get(name, 0)
+                for name in ("llm_hedge_sent", "llm_hedge_won", "llm_hedge_skipped", "llm_circuit_opened",
+                             "llm_circuit_closed", "llm_circuit_rejected", "llm_fallback")
+            }
+        }
+
+# ==========================
+# 🧪 التجربة
+# ==========================
+def run_benchmark(requests=400, concurrency=16):
+    """مزود بذيل زمن طويل (مع وبدون الطلب المكرر)، ثم مزود معطل لرؤية القاطع يفتح ويتعافى"""
+    import random
+    from llm_backend import ChatReply, LLMBackend
+    from metrics import LatencyMetrics
+
+    class FlakyBackend(LLMBackend):
+        """5% من الطلبات أبطأ بعشر مرات، ويمكن تعطيله بالكامل"""
+        name = "flaky"
+
+        def __init__(self):
+            self.rng = random.Random(7)
+            self.broken = False
+
+        def chat(self, request):
+            if self.broken:
+                time.sleep(0.02)
+                raise LLMBackendError("المزود لا يرد")
+            time.sleep(self.rng.uniform(0.04, 0.06) * (10 if self.rng.random() < 0.05 else 1))
+            return ChatReply("تمام", None)
+
+    def run(guard):
+        from concurrent.futures import ThreadPoolExecutor as Pool
+
+        def one(_):
+            started = time.perf_counter()
+            guard.chat({"messages": []})
+            return time.perf_counter() - started
+
+        with Pool(concurrency) as pool:
+            durations = sorted(pool.map(one, range(requests)))
+        return {q: durations[int(q * len(durations)) - 1] * 1000 for q in (0.5, 0.95, 0.99)}
+
+    for hedge in (False, True):
+        metrics = LatencyMetrics()
+        guard = LLMGuard(FlakyBackend(), hedge=hedge, min_delay=0.05, metrics=metrics)
+        result = run(guard)
+        counters = metrics.counters()
+        print(f"{'🛡️ مع' if hedge else '⏱️ بدون'} الطلب المكرر: "
+              + "، ".join(f"p{int(q * 100)} {value:.0f} ms" for q, value in result.items())
+              + f" (مكرر {counters.get('llm_hedge_sent', 0)}، فاز {counters.get('llm_hedge_won', 0)})")
+
+    metrics = LatencyMetrics()
+    backend = FlakyBackend()
+    breaker = CircuitBreaker(window_seconds=5, min_requests=5, open_seconds=0.2, metrics=metrics)
+    guard = LLMGuard(backend, breaker=breaker, hedge=False, metrics=metrics)
+    backend.broken = True
+    outcomes = []
+    for _ in range(20):
+        try:
+            guard.chat({"messages": []})
+            outcomes.append("✓")
+        except CircuitOpenError:
+            outcomes.append("⛔")
+        except LLMBackendError:
+            outcomes.append("✗")
+    print("🔌 المزود معطل: " + "".join(outcomes))
+
+    backend.broken = False
+    time.sleep(0.25)
+    guard.chat({"messages": []})
+    print(f"🔌 بعد التعافي: {breaker.state} - {metrics.counters()}")
+
+if __name__ == "__main__":
+    run_benchmark()
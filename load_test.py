@@ -0,0 +1,398 @@
+"""
+اختبار الحمل - متصلون وهميون متزامنون على webhooks التطبيق، ونموذج وهمي بزمن رد قابل للضبط
+
+• كل متصل: POST /voice ثم سيناريو أدوار /handle-speech بعبارات عربية واقعية ووقت تفكير بينها،
+  ويتبع /poll-reply بعد جملة الانتظار كما يفعل Twilio
+• الأرقام من MOCK_USERS + أرقام غير معروفة
+• النموذج الوهمي متوافق مع /v1/chat/completions، بتوزيع زمن (ثابت، منتظم، لوغاريتمي طبيعي) ونسبة أخطاء
+• التقرير JSON: الإنتاجية، p50/p95/p99 ونسبة الأخطاء لكل مسار ولكل نوع عبارة،
+  وملخص أزمنة المراحل من /status (يُلحق بملف --output لمقارنة التشغيلات)
+
+التشغيل (التطبيق داخل نفس العملية):
+    python load_test.py --callers 50 --duration 60 --llm-latency lognormal:0.8,0.5
+
+على سيرفر شغال (يجب تشغيله بـ OPENAI_BASE_URL=<رابط النموذج الوهمي المطبوع>):
+    python load_test.py --url http://127.0.0.1:5000 --callers 200
+"""
+
+import os
+import re
+import json
+import time
+import uuid
+import random
+import logging
+import argparse
+import threading
+from datetime import datetime
+
+import requests
+from flask import Flask, request, jsonify
+from werkzeug.serving import make_server
+
+# موديولات التطبيق تُستورد داخل main بعد ضبط متغيرات البيئة (config يقرؤها عند التحميل)
+
+# ==========================
+# 📜 سيناريوهات المكالمات
+# ==========================
+# (نوع العبارة، النص) - النوع يظهر في التقرير كمسار مستقل
+SCENARIOS = {
+    "wallet": [
+        ("wallet", "السلام عليكم، كم رصيد محفظتي؟"),
+        ("open_question", "طيب وكيف أشحن المحفظة العائلية من البنك؟"),
+        ("exit", "شكراً مع السلامة")
+    ],
+    "whats_new": [
+        ("whats_new", "وش الجديد عندي؟"),
+        ("reminder", "لا، ذكرني قبل الموعد"),
+        ("exit", "مشكور، مع السلامة")
+    ],
+    "renewal": [
+        ("whats_new", "وش عندي من مستندات منتهية؟"),
+        ("renewal", "أبغى أجدد الإقامة"),
+        ("confirm", "ايوه تمام"),
+        ("exit", "الله يعطيك العافية، مع السلامة")
+    ],
+    "renewal_declined": [
+        ("renewal", "أبغى أجدد الهوية"),
+        ("decline", "لا لا تجدد"),
+        ("open_question", "أي خدمة ثانية تقدمونها؟"),
+        ("exit", "شكراً مع السلامة")
+    ],
+    "questions": [
+        ("faq", "كيف أجدد رخصة القيادة؟"),
+        ("open_question", "كم تاخذ مدة إصدار الجواز بعد الدفع؟"),
+        ("open_question", "هل أقدر أحجز موعد في الأحوال المدنية يوم السبت؟"),
+        ("exit", "خلاص شكراً")
+    ],
+    "unclear": [
+        ("no_speech", ""),
+        ("open_question", "وش المخالفات اللي علي؟"),
+        ("exit", "مع السلامة")
+    ]
+}
+
+# ==========================
+# 🤖 النموذج الوهمي
+# ==========================
+def parse_latency(spec):
+    """
+    "fixed:0.5" | "uniform:0.2,1.5" | "lognormal:0.8,0.5" (الوسيط بالثواني، الانحراف)
+
+    Returns:
+        دالة تعطي زمناً بالثواني من مولد عشوائي
+    """
+    kind, _, values = spec.partition(":")
+    numbers = [float(value) for value in values.split(",") if value]
+
+    if kind == "fixed" and len(numbers) == 1:
+        return lambda rng: numbers[0]
+    if kind == "uniform" and len(numbers) == 2:
+        return lambda rng: rng.uniform(*numbers)
+    if kind == "lognormal" and len(numbers) == 2:
+        median, sigma = numbers
+        return lambda rng: median * rng.lognormvariate(0.0, sigma)
+    raise ValueError(f"توزيع غير معروف: {spec}")
+
+class FakeLLM:
+    """رد متوافق مع OpenAI بعد زمن من التوزيع المطلوب، أو خطأ 500 بالنسبة المطلوبة"""
+
+    def __init__(self, latency="lognormal:0.8,0.5", error_rate=0.0, seed=None):
+        self.latency = parse_latency(latency)
+        self.latency_spec = latency
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self._lock = threading.Lock()
+
+        self.requests = 0
+        self.errors = 0
+
+    def complete(self, payload):
+        with self._lock:
+            self.requests += 1
+            delay = self.latency(self.random)
+            failed = self.random.random() < self.error_rate
+            if failed:
+                self.errors += 1
+
+        time.sleep(delay)
+        if failed:
+            return None
+
+        prompt_chars = sum(len(message.get("content") or "") for message in payload.get("messages", []))
+        reply = "أبشر، هذا رد تجريبي من النموذج الوهمي. تحتاج شي ثاني؟"
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex[:24]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": payload.get("model", "stub"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": reply},
+                "finish_reason": "stop"
+            }],
+            "usage": {
+                "prompt_tokens": prompt_chars // 4,
+                "completion_tokens": len(reply) // 4,
+                "total_tokens": (prompt_chars + len(reply)) // 4,
+                "prompt_tokens_details": {"cached_tokens": 0}
+            }
+        }
+
+    def stats(self):
+        with self._lock:
+            return {"latency": self.latency_spec, "requests": self.requests, "errors": self.errors}
+
+def create_llm_app(fake):
+    app = Flask(__name__)
+
+    @app.route("/v1/chat/completions", methods=["POST"])
+    def chat_completions():
+        completion = fake.complete(request.get_json(force=True))
+        if completion is None:
+            return jsonify({"error": {"message": "stub failure", "type": "server_error"}}), 500
+        return jsonify(completion)
+
+    return app
+
+class ServerThread:
+    """تطبيق WSGI في خيط خلفي (النموذج الوهمي أو التطبيق نفسه)"""
+
+    def __init__(self, wsgi_app, name, host="127.0.0.1", port=0):
+        self._server = make_server(host, port, wsgi_app, threaded=True)
+        self.base_url = f"http://{host}:{self._server.server_port}"
+        self._thread = threading.Thread(target=self._server.serve_forever, name=name, daemon=True)
+
+    def start(self):
+        logging.getLogger("werkzeug").setLevel(logging.WARNING)  # بدون سطر لكل طلب
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._thread.join()
+
+# ==========================
+# 📞 المتصلون
+# ==========================
+_POLL_REDIRECT = re.compile(r"<Redirect[^>]*>(/poll-reply\?turn=[^<]+)</Redirect>")
+_PAUSE = re.compile(r'<Pause length="(\d+)"')
+
+class LoadTest:
+    """متصلون متزامنون، كل واحد يجري مكالمات متتالية حتى انتهاء الوقت أو عدد المكالمات"""
+
+    def __init__(self, base_url, known_phones, error_text, callers=10, duration=30.0, calls=None,
+                 think_time=(0.5, 2.0), unknown_ratio=0.2, timeout=20.0, seed=None):
+        """
+        Args:
+            known_phones: أرقام مسجلة (MOCK_USERS)
+            error_text: رسالة الخطأ في TwiML - الرد بها يُحسب خطأ حتى مع حالة 200
+        """
+        self.base_url = base_url.rstrip("/")
+        self.known_phones = list(known_phones)
+        self.error_text = error_text
+        self.callers = callers
+        self.duration = duration
+        self.calls = calls
+        self.think_time = think_time
+        self.unknown_ratio = unknown_ratio
+        self.timeout = timeout
+        self.random = random.Random(seed)
+
+        self._lock = threading.Lock()
+        self._samples = {}  # المسار -> [(ms, ok)]
+        self._started_calls = 0
+        self._completed_calls = 0
+        self._deadline = None
+
+    def _record(self, route, seconds, ok):
+        with self._lock:
+            self._samples.setdefault(route, []).append((seconds * 1000, ok))
+
+    def _next_call(self):
+        """حجز مكالمة جديدة، أو None إذا انتهى الاختبار"""
+        with self._lock:
+            if time.monotonic() >= self._deadline:
+                return None
+            if self.calls is not None and self._started_calls >= self.calls:
+                return None
+            self._started_calls += 1
+            unknown = self.random.random() < self.unknown_ratio
+            phone = f"+9665{self.random.randrange(10 ** 8):08d}" if unknown else self.random.choice(self.known_phones)
+            scenario = self.random.choice(list(SCENARIOS))
+            return phone, scenario, random.Random(self.random.random())
+
+    def _post(self, session, route, path, data):
+        """طلب واحد وتسجيل زمنه - الخطأ: حالة غير 200 أو رد الخطأ في TwiML"""
+        started = time.perf_counter()
+        try:
+            response = session.post(self.base_url + path, data=data, timeout=self.timeout)
+            body = response.text
+            ok = response.status_code == 200 and "<Response>" in body and self.error_text not in body
+        except requests.RequestException:
+            body, ok = "", False
+        self._record(route, time.perf_counter() - started, ok)
+        return body, ok
+
+    def _turn(self, session, call, kind, text):
+        """دور كامل كما يسمعه المتصل: /handle-speech ثم /poll-reply حتى يصل الرد"""
+        started = time.perf_counter()
+        body, ok = self._post(session, "handle_speech", "/handle-speech", dict(call, SpeechResult=text))
+
+        while ok and (redirect := _POLL_REDIRECT.search(body)):
+            pause = _PAUSE.search(body)
+            time.sleep(int(pause.group(1)) if pause else 1)
+            body, ok = self._post(session, "poll_reply", redirect.group(1).replace("&amp;", "&"), call)
+
+        self._record(f"turn:{kind}", time.perf_counter() - started, ok)
+        return ok
+
+    def _caller(self):
+        session = requests.Session()
+        while True:
+            planned = self._next_call()
+            if planned is None:
+                return
+            phone, scenario, rng = planned
+            call = {"CallSid": f"CA{uuid.uuid4().hex}", "From": phone, "To": "+966500000000", "Direction": "inbound"}
+
+            _, ok = self._post(session, "voice", "/voice", call)
+            for kind, text in SCENARIOS[scenario]:
+                if not ok:
+                    break
+                time.sleep(rng.uniform(*self.think_time))
+                ok = self._turn(session, call, kind, text)
+
+            with self._lock:
+                self._completed_calls += ok
+
+    def run(self):
+        self._deadline = time.monotonic() + self.duration
+        started = time.perf_counter()
+
+        threads = [threading.Thread(target=self._caller, name=f"caller-{index}", daemon=True)
+                   for index in range(self.callers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        return self.report(time.perf_counter() - started)
+
+    def report(self, elapsed):
+        """الإنتاجية + لكل مسار: العدد والأخطاء و p50/p95/p99"""
+        with self._lock:
+            samples = {route: list(values) for route, values in self._samples.items()}
+
+        routes = {}
+        for route, values in sorted(samples.items()):
+            latencies = sorted(ms for ms, _ in values)
+            errors = sum(1 for _, ok in values if not ok)
+            routes[route] = {
+                "count": len(values),
+                "errors": errors,
+                "error_rate": round(errors / len(values), 4),
+                **{f"p{q}_ms": round(percentile(latencies, q / 100), 2) for q in (50, 95, 99)},
+                "max_ms": round(latencies[-1], 2)
+            }
+
+        webhook_requests = sum(routes[route]["count"] for route in routes if not route.startswith("turn:"))
+        turns = sum(routes[route]["count"] for route in routes if route.startswith("turn:"))
+        return {
+            "elapsed_s": round(elapsed, 2),
+            "calls_started": self._started_calls,
+            "calls_completed": self._completed_calls,
+            "requests": webhook_requests,
+            "requests_per_second": round(webhook_requests / elapsed, 2),
+            "turns_per_second": round(turns / elapsed, 2),
+            "routes": routes
+        }
+
+def percentile(sorted_values, q):
+    """النسبة المئوية (أقرب ترتيب) من قائمة مرتبة"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(q * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+# ==========================
+# 🚀 التشغيل
+# ==========================
+def start_local_app(llm_url):
+    """
+    تشغيل app.py داخل نفس العملية موجهاً للنموذج الوهمي
+
+    المتغيرات تُضبط قبل الاستيراد (config يقرؤها عند التحميل، و .env لا يغطي عليها).
+    """
+    os.environ["OPENAI_API_KEY"] = "stub-key"
+    os.environ["OPENAI_BASE_URL"] = f"{llm_url}/v1"
+    os.environ.setdefault("CONSOLE_VERBOSITY", "0")
+
+    import app as voice_app
+    return ServerThread(voice_app.app, "voice-app").start()
+
+def fetch_server_latency(base_url):
+    """ملخص أزمنة المراحل من /status (إن وُجد)"""
+    try:
+        return requests.get(f"{base_url}/status", timeout=5).json().get("latency")
+    except (requests.RequestException, ValueError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description="اختبار حمل webhooks مساعد أبشر بمتصلين وهميين")
+    parser.add_argument("--url", help="سيرفر شغال بدل تشغيل app.py داخل العملية")
+    parser.add_argument("--callers", type=int, default=20, help="متصلون متزامنون")
+    parser.add_argument("--duration", type=float, default=30, help="مدة الاختبار بالثواني")
+    parser.add_argument("--calls", type=int, help="عدد المكالمات الكلي (بدل المدة)")
+    parser.add_argument("--think-time", type=float, nargs=2, default=(0.5, 2.0), metavar=("MIN", "MAX"))
+    parser.add_argument("--unknown-ratio", type=float, default=0.2, help="نسبة الأرقام غير المسجلة")
+    parser.add_argument("--llm-latency", default="lognormal:0.8,0.5",
+                        help="fixed:S | uniform:MIN,MAX | lognormal:MEDIAN,SIGMA")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--output", help="إلحاق التقرير كسطر JSON بهذا الملف")
+    args = parser.parse_args()
+
+    llm = FakeLLM(args.llm_latency, args.llm_error_rate, seed=args.seed)
+    llm_server = ServerThread(create_llm_app(llm), "fake-llm").start()
+
+    app_server = None
+    if args.url:
+        base_url = args.url
+        print(f"🤖 النموذج الوهمي: {llm_server.base_url}/v1 (شغّل السيرفر بـ OPENAI_BASE_URL عليه)")
+    else:
+        app_server = start_local_app(llm_server.base_url)
+        base_url = app_server.base_url
+
+    from data import MOCK_USERS
+    from config import ERROR_MESSAGE
+
+    duration = args.duration if args.calls is None else float("inf")
+    print(f"📞 {args.callers} متصل على {base_url} ...")
+    test = LoadTest(base_url, MOCK_USERS, ERROR_MESSAGE, args.callers, duration, args.calls,
+                    tuple(args.think_time), args.unknown_ratio, seed=args.seed)
+    report = test.run()
+
+    report = {
+        "timestamp": datetime.now().isoformat(),
+        "target": args.url or "in-process app.py",
+        "config": {
+            "callers": args.callers, "duration_s": args.duration, "calls": args.calls,
+            "think_time_s": list(args.think_time), "unknown_ratio": args.unknown_ratio, "seed": args.seed
+        },
+        **report,
+        "llm_stub": llm.stats(),
+        "server_latency": fetch_server_latency(base_url)
+    }
+
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.output:
+        with open(args.output, "a", encoding="utf-8") as output:
+            output.write(json.dumps(report, ensure_ascii=False) + "\n")
+
+    if app_server is not None:
+        app_server.stop()
+    llm_server.stop()
+
+if __name__ == "__main__":
+    main()
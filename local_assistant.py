@@ -8,6 +8,9 @@ import os
 import sys
 import platform
 import tempfile
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
 
@@ -25,10 +28,13 @@ except ImportError:
 # Import local modules
 try:
     from config import *
-    from assistant import SmartAssistant, generate_response
+    from assistant import SmartAssistant, generate_response, generate_response_stream, split_sentences, llm
     from data import get_user_by_phone, get_expiring_documents, MOCK_USERS
     from prompts import get_greeting
-    from openai import OpenAI
+    from tts_cache import TTSCache
+    from intents import match_intents
+    from metrics import latency
+    import prompts
 except ImportError as e:
     print(f"ERROR: Import failed: {e}")
     print("Make sure all required files exist")
@@ -44,12 +50,29 @@ AUDIO_FOLDER = "audio_files"
 # Create audio folder
 Path(AUDIO_FOLDER).mkdir(exist_ok=True)
 
-# Initialize OpenAI
-if not OPENAI_API_KEY:
-    print("ERROR: OPENAI_API_KEY not found in .env file")
+# Model backend (LLM_BACKEND): chat, speech-to-text and text-to-speech all go through it
+if not llm.available:
+    print("ERROR: OPENAI_API_KEY not found in .env file (or set LLM_BACKEND=stub / replay to run offline)")
     sys.exit(1)
 
-openai_client = OpenAI(api_key=OPENAI_API_KEY)
+# TTS cache (content-addressed, shared by every call to synthesize_speech)
+tts_cache = TTSCache()
+
+RETRY_MESSAGE = "I didn't hear anything clear. Can you repeat louder?"
+
+# Fixed phrases rendered once at startup
+SYSTEM_PHRASES = [
+    GREETING_MESSAGE,
+    FAREWELL_MESSAGE,
+    NO_SPEECH_MESSAGE,
+    TIMEOUT_MESSAGE,
+    ERROR_MESSAGE,
+    prompts.FAREWELL_MESSAGE,
+    prompts.NO_SPEECH_MESSAGE,
+    prompts.TIMEOUT_MESSAGE,
+    prompts.ERROR_MESSAGE,
+    RETRY_MESSAGE,
+]
 
 # ==========================
 # Colors
@@ -104,6 +127,7 @@ def print_status(message, status="info"):
 # ==========================
 # Audio Recording
 # ==========================
+@latency.timed("record")
 def record_audio(duration=RECORDING_DURATION, show_countdown=True):
     """Record audio from microphone"""
     
@@ -142,8 +166,9 @@ def record_audio(duration=RECORDING_DURATION, show_countdown=True):
 # ==========================
 # Speech to Text
 # ==========================
+@latency.timed("stt")
 def speech_to_text(audio_path):
-    """Convert audio file to text using Whisper"""
+    """Convert audio file to text (Whisper through the model backend)"""
     
     if not audio_path or not os.path.exists(audio_path):
         return ""
@@ -151,15 +176,7 @@ def speech_to_text(audio_path):
     try:
         print_status("Converting speech to text...", "info")
         
-        with open(audio_path, "rb") as audio_file:
-            transcript = openai_client.audio.transcriptions.create(
-                model="whisper-1",
-                file=audio_file,
-                language="ar",
-                response_format="text"
-            )
-        
-        text = transcript.strip()
+        text = llm.transcribe(audio_path, language="ar", model=STT_MODEL)
         
         if text:
             print_colored(f"\n👤 You said: \"{text}\"", Colors.GREEN)
@@ -176,27 +193,53 @@ def speech_to_text(audio_path):
 # ==========================
 # Text to Speech
 # ==========================
+def _render_speech(text):
+    """Render the text through the model backend's TTS and return the MP3 bytes"""
+    
+    return llm.speech(text, model=TTS_MODEL, voice=TTS_VOICE, speed=TTS_SPEED)
+
+@latency.timed("tts")
+def synthesize_speech(text):
+    """Convert text to an MP3 file (served from the TTS cache when possible)"""
+    
+    return tts_cache.get_file(text, TTS_MODEL, TTS_VOICE, TTS_SPEED, _render_speech)
+
+def prewarm_tts_cache():
+    """Render every fixed system phrase so it never hits the network mid-call"""
+    
+    try:
+        rendered = tts_cache.prewarm(SYSTEM_PHRASES, TTS_MODEL, TTS_VOICE, TTS_SPEED, _render_speech)
+        if rendered:
+            print_status(f"TTS cache warmed ({rendered} new phrases)", "success")
+    except Exception as e:
+        print_status(f"TTS cache warm-up error: {e}", "error")
+
+def print_tts_cache_stats():
+    """Print TTS cache hit/miss counters"""
+    
+    stats = tts_cache.stats()
+    print_colored(
+        f"🗄️  TTS cache: {stats['disk_hits']} hits, "
+        f"{stats['misses']} misses (hit rate {stats['hit_rate']:.0%}), {stats['entries']} files",
+        Colors.CYAN
+    )
+
+def print_latency_stats():
+    """Print p50/p95 latency of each stage of the conversation"""
+    
+    for stage, stats in latency.summary().items():
+        print_colored(
+            f"⏱️  {stage}: p50 {stats['p50_ms']:.0f} ms, p95 {stats['p95_ms']:.0f} ms ({stats['count']} samples)",
+            Colors.CYAN
+        )
+
 def text_to_speech(text, play=True):
-    """Convert text to speech using OpenAI TTS"""
+    """Convert text to speech through the model backend"""
     
     try:
         print_status("Converting text to speech...", "info")
         
-        # Convert text to speech
-        response = openai_client.audio.speech.create(
-            model="tts-1-hd",
-            voice="nova",  # Natural female voice
-            input=text,
-            speed=0.95  # Slightly slower for elderly
-        )
-        
-        # Save file
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = os.path.join(AUDIO_FOLDER, f"assistant_{timestamp}.mp3")
-        
-        audio_data = response.read()
-        with open(filename, "wb") as f:
-            f.write(audio_data)
+        filename = synthesize_speech(text)
         
         print_status("Conversion successful", "success")
         
@@ -210,9 +253,56 @@ def text_to_speech(text, play=True):
         print_status(f"Text conversion error: {e}", "error")
         return None
 
+# ==========================
+# Streaming Speech
+# ==========================
+def _playback_worker(playback_queue):
+    """Play synthesized sentences in order as soon as each one is ready"""
+    
+    while True:
+        future = playback_queue.get()
+        if future is None:
+            break
+        
+        try:
+            play_audio(future.result())
+        except Exception as e:
+            print_status(f"Text conversion error: {e}", "error")
+
+def speak_streamed_reply(chunks):
+    """
+    Speak an LLM reply while it is still being generated.
+    
+    The reply is cut into sentences; each sentence is synthesized in the
+    background and queued for playback, so the first sentence plays while
+    the rest are still generating.
+    
+    Returns the full reply text.
+    """
+    
+    playback_queue = queue.Queue()
+    player = threading.Thread(target=_playback_worker, args=(playback_queue,), daemon=True)
+    player.start()
+    
+    spoken = []
+    print_colored(f"\n🤖 Sam:", Colors.BLUE)
+    
+    with ThreadPoolExecutor(max_workers=TTS_STREAM_WORKERS) as synthesizer:
+        for sentence in split_sentences(chunks):
+            print(f"  {sentence}")
+            spoken.append(sentence)
+            playback_queue.put(synthesizer.submit(synthesize_speech, sentence))
+    
+    print()
+    playback_queue.put(None)
+    player.join()
+    
+    return " ".join(spoken)
+
 # ==========================
 # Play Audio
 # ==========================
+@latency.timed("playback")
 def play_audio(audio_path):
     """Play audio file"""
     
@@ -331,42 +421,43 @@ def voice_chat_loop():
             
             if not user_text:
                 print_status("Could not understand, please repeat", "warning")
-                text_to_speech("I didn't hear anything clear. Can you repeat louder?")
+                text_to_speech(RETRY_MESSAGE)
                 continue
             
-            # Check exit keywords
-            if any(keyword in user_text.lower() for keyword in EXIT_KEYWORDS):
+            # Match every intent in one pass
+            intents = match_intents(user_text)
+            
+            # Check exit keywords ("ايوه تمام" while a renewal awaits confirmation is consent, not goodbye)
+            if intents.is_exit and not ("confirm" in intents and assistant.current_renewal):
                 print_colored(f"\n🤖 Sam:", Colors.BLUE)
                 from prompts import FAREWELL_MESSAGE
                 print(f"  {FAREWELL_MESSAGE}\n")
                 text_to_speech(FAREWELL_MESSAGE)
                 
                 print_colored(f"\n✅ Conversation ended after {turn_count} turns", Colors.GREEN)
+                print_tts_cache_stats()
+                print_latency_stats()
                 print_colored("👋 Goodbye!\n", Colors.YELLOW)
                 break
             
-            # Handle requests
-            if any(word in user_text.lower() for word in ["جديد", "عندي من", "وش عندي"]):
-                print_status("Checking documents...", "info")
-                reply = assistant.handle_whats_new()
-            elif any(word in user_text.lower() for word in ["جدد", "تجديد", "نعم", "أيوه"]):
-                print_status("Processing renewal...", "info")
-                reply = assistant.handle_renewal_request(user_text)
-            elif any(word in user_text.lower() for word in ["محفظة", "رصيد"]):
-                reply = assistant.handle_wallet_inquiry()
-            elif any(word in user_text.lower() for word in ["ذكرني", "تذكير"]):
-                print_status("Setting reminder...", "info")
-                reply = assistant.handle_reminder_request()
+            # Known requests (and renewal confirmation) are answered locally by the assistant
+            reply_spoken = False
+            reply = assistant.route(user_text)
+            if reply is not None:
+                print_status("Handled locally", "info")
+            elif STREAM_RESPONSES:
+                print_status("Sam is thinking...", "info")
+                reply = speak_streamed_reply(generate_response_stream(user_text, phone_number, history))
+                reply_spoken = True
             else:
                 print_status("Sam is thinking...", "info")
                 reply = generate_response(user_text, phone_number, history)
             
-            # Display response
-            print_colored(f"\n🤖 Sam:", Colors.BLUE)
-            print(f"  {reply}\n")
-            
-            # Convert and play response
-            text_to_speech(reply)
+            # Display and play response (streamed replies were already spoken)
+            if not reply_spoken:
+                print_colored(f"\n🤖 Sam:", Colors.BLUE)
+                print(f"  {reply}\n")
+                text_to_speech(reply)
             
             # Save history
             history.append({"role": "user", "content": user_text})
@@ -431,6 +522,9 @@ def main():
         if choice != 'y':
             sys.exit(0)
     
+    # Render fixed phrases in the background while the menu is shown
+    threading.Thread(target=prewarm_tts_cache, daemon=True).start()
+    
     # Show menu
     print_colored("\n🎯 Select Mode:", Colors.CYAN)
     print("   1. Start Voice Conversation")
@@ -0,0 +1,312 @@
+"""
+قياس زمن كل مرحلة في الدور - هيستوغرام لكل مرحلة بتكلفة أجزاء من الميكروثانية
+
+• المراحل: البحث عن المستخدم، التوجيه المحلي، بناء البرومت، النموذج (أول توكن والإجمالي)،
+  تنسيق الأرقام، بناء TwiML، والدور كامل (وفي الوضع المحلي: التسجيل، STT، TTS، التشغيل)
+• /metrics: بصيغة Prometheus النصية
+• /status: p50 / p95 / p99 لكل مرحلة
+• capture(): أزمنة مراحل الدور الحالي فقط (لسجل المكالمات)
+• عدادات أحداث (طلبات النموذج المكررة، فتح قاطع الدائرة، الردود الاحتياطية) ومؤشرات حالة
+
+حدود الخانات ثابتة (متتالية هندسية)، فالتسجيل = bisect + زيادة عداد تحت قفل.
+
+قياس التكلفة:
+    python metrics.py
+"""
+
+import inspect
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from time import perf_counter
+
+# حدود الخانات بالثواني: من 25 ميكروثانية إلى دقيقتين، كل خانة أكبر بـ 1.5 مرة
+BUCKET_START = 25e-6
+BUCKET_FACTOR = 1.5
+BUCKET_END = 120.0
+
+def _bucket_bounds():
+    bounds = []
+    bound = BUCKET_START
+    while bound < BUCKET_END:
+        bounds.append(float(f"{bound:.6g}"))
+        bound *= BUCKET_FACTOR
+    bounds.append(BUCKET_END)
+    return tuple(bounds)
+
+BUCKET_BOUNDS = _bucket_bounds()
+
+# أزمنة مراحل الدور الجاري (None خارج capture) - ContextVar حتى تعمل مع async
+# وتنتقل لخيط التوليد عبر contextvars.copy_context()
+_turn_timings = ContextVar("turn_timings", default=None)
+
+class Histogram:
+    """عدد القياسات في كل خانة + المجموع (مثل هيستوغرام Prometheus)"""
+
+    __slots__ = ("stage", "bounds", "counts", "total", "count", "low", "high", "_lock")
+
+    def __init__(self, stage="", bounds=BUCKET_BOUNDS):
+        self.stage = stage
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # الأخيرة: أكبر من آخر حد (+Inf)
+        self.total = 0.0
+        self.count = 0
+        self.low = float("inf")  # أصغر وأكبر قياس - حدود التقدير داخل الخانة
+        self.high = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.total += value
+            self.count += 1
+            if value < self.low:
+                self.low = value
+            if value > self.high:
+                self.high = value
+
+        timings = _turn_timings.get()
+        if timings is not None:
+            timings[self.stage] = timings.get(self.stage, 0.0) + value
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.counts), self.total, self.count, self.low, self.high
+
+    def quantile(self, q, snapshot=None):
+        """
+        تقدير النسبة المئوية من الخانات (توزيع منتظم داخل الخانة)
+
+        Returns:
+            القيمة بالثواني، أو None إذا لم يُسجل شيء
+        """
+        counts, _, count, low, high = snapshot or self.snapshot()
+        if not count:
+            return None
+
+        rank = q * count
+        seen = 0
+        for index, bucket_count in enumerate(counts):
+            if seen + bucket_count >= rank and bucket_count:
+                lower = max(self.bounds[index - 1] if index else 0.0, low)
+                upper = min(self.bounds[index] if index < len(self.bounds) else high, high)
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return high
+
+class _Timer:
+    """with latency.time("stage"): ... - يسجل الزمن عند الخروج (حتى مع الاستثناءات)"""
+
+    __slots__ = ("histogram", "started")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.started = perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(perf_counter() - self.started)
+        return False
+
+class LatencyMetrics:
+    """هيستوغرام لكل مرحلة تُنشأ عند أول قياس، وعدادات أحداث ومؤشرات حالة"""
+
+    def __init__(self, namespace="absher"):
+        self.namespace = namespace
+        self._histograms = {}
+        self._counters = {}
+        self._gauges = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, stage):
+        histogram = self._histograms.get(stage)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(stage, Histogram(stage))
+        return histogram
+
+    def observe(self, stage, seconds):
+        """تسجيل زمن مرحلة بالثواني"""
+        self.histogram(stage).observe(seconds)
+
+    def time(self, stage):
+        """قياس كتلة: with latency.time("llm_total"): ..."""
+        return _Timer(self.histogram(stage))
+
+    def timed(self, stage):
+        """قياس دالة كاملة (decorator) - تعمل مع الدوال العادية و async"""
+        def decorator(function):
+            histogram = self.histogram(stage)
+
+            if inspect.iscoroutinefunction(function):
+                @wraps(function)
+                async def async_wrapper(*args, **kwargs):
+                    started = perf_counter()
+                    try:
+                        return await function(*args, **kwargs)
+                    finally:
+                        histogram.observe(perf_counter() - started)
+                return async_wrapper
+
+            @wraps(function)
+            def wrapper(*args, **kwargs):
+                started = perf_counter()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    histogram.observe(perf_counter() - started)
+            return wrapper
+        return decorator
+
+    def increment(self, event, amount=1):
+        """زيادة عداد حدث: latency.increment("llm_hedge_sent")"""
+        with self._lock:
+            self._counters[event] = self._counters.get(event, 0) + amount
+
+    def counters(self):
+        """نسخة من كل العدادات"""
+        with self._lock:
+            return dict(sorted(self._counters.items()))
+
+    def gauge(self, name, read, description):
+        """
+        مؤشر حالة يُقرأ عند كل عرض لـ /metrics
+
+        Args:
+            name: الاسم بدون البادئة (llm_circuit_state)
+            read: دالة بدون معاملات ترجع رقماً
+            description: سطر HELP
+        """
+        with self._lock:
+            self._gauges[name] = (read, description)
+
+    @contextmanager
+    def capture(self):
+        """
+        جمع أزمنة المراحل داخل الكتلة (وما تطلقه من مهام async أو خيوط بسياق منسوخ)
+
+        with latency.capture() as timings:
+            ...
+        # timings = {"intent_routing": 0.00002, "llm_total": 0.84, ...} بالثواني
+        """
+        timings = {}
+        token = _turn_timings.set(timings)
+        try:
+            yield timings
+        finally:
+            _turn_timings.reset(token)
+
+    def summary(self):
+        """لكل مرحلة: العدد والمتوسط و p50 / p95 / p99 بالملي ثانية"""
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+
+        summary = {}
+        for stage, histogram in histograms:
+            snapshot = histogram.snapshot()
+            _, total, count, _, _ = snapshot
+            if not count:
+                continue
+            summary[stage] = {
+                "count": count,
+                "mean_ms": round(total / count * 1000, 3),
+                **{
+                    f"p{int(q * 100)}_ms": round(histogram.quantile(q, snapshot) * 1000, 3)
+                    for q in (0.5, 0.95, 0.99)
+                }
+            }
+        return summary
+
+    def render_prometheus(self):
+        """كل الهيستوغرامات والعدادات والمؤشرات بصيغة Prometheus النصية (text/plain; version=0.0.4)"""
+        name = f"{self.namespace}_stage_seconds"
+        lines = [
+            f"# HELP {name} Latency of each stage of a call turn in seconds.",
+            f"# TYPE {name} histogram"
+        ]
+
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+
+        for stage, histogram in histograms:
+            counts, total, count, _, _ = histogram.snapshot()
+            cumulative = 0
+            for bound, bucket_count in zip(histogram.bounds, counts):
+                cumulative += bucket_count
+                lines.append(f'{name}_bucket{{stage="{stage}",le="{bound:g}"}} {cumulative}')
+            lines.append(f'{name}_bucket{{stage="{stage}",le="+Inf"}} {count}')
+            lines.append(f'{name}_sum{{stage="{stage}"}} {total:.6f}')
+            lines.append(f'{name}_count{{stage="{stage}"}} {count}')
+
+        counters = self.counters()
+        if counters:
+            name = f"{self.namespace}_events_total"
+            lines.append(f"# HELP {name} Count of notable events (hedged requests, circuit breaker, fallbacks).")
+            lines.append(f"# TYPE {name} counter")
+            for event, count in counters.items():
+                lines.append(f'{name}{{event="{event}"}} {count}')
+
+        with self._lock:
+            gauges = sorted(self._gauges.items())
+
+        for gauge, (read, description) in gauges:
+            name = f"{self.namespace}_{gauge}"
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {read():g}")
+
+        return "\n".join(lines) + "\n"
+
+# المقاييس المشتركة لكل العمليات داخل نفس العملية
+latency = LatencyMetrics()
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# ==========================
+# 🧪 قياس التكلفة
+# ==========================
+def run_benchmark(rounds=200000):
+    """تكلفة القياس لكل استدعاء، ودقة النسب المئوية مقابل الترتيب الفعلي"""
+    import random
+
+    metrics = LatencyMetrics()
+
+    def bare():
+        return None
+
+    @metrics.timed("decorated")
+    def decorated():
+        return None
+
+    def measure(function):
+        started = perf_counter()
+        for _ in range(rounds):
+            function()
+        return (perf_counter() - started) / rounds * 1e6
+
+    def with_block():
+        with metrics.time("block"):
+            pass
+
+    baseline = measure(bare)
+    print(f"⏱️ decorator: {measure(decorated) - baseline:.2f} ميكروثانية/استدعاء")
+    print(f"⏱️ with latency.time(): {measure(with_block) - baseline:.2f} ميكروثانية/استدعاء")
+
+    rng = random.Random(1)
+    samples = [rng.lognormvariate(-1.5, 0.8) for _ in range(100000)]  # مثل أزمنة النموذج
+    for sample in samples:
+        metrics.observe("llm_total", sample)
+    samples.sort()
+    for q in (0.5, 0.95, 0.99):
+        exact = samples[int(q * len(samples)) - 1]
+        estimate = metrics.histogram("llm_total").quantile(q)
+        print(f"📊 p{int(q * 100)}: فعلي {exact * 1000:.1f} ms، تقدير {estimate * 1000:.1f} ms "
+              f"({abs(estimate - exact) / exact * 100:.1f}%)")
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,315 @@
+"""
+تحويل الأرقام للنطق - مرور واحد على النص
+
+• المبالغ والأعداد: "300 ريال" -> "ثلاثمية ريال"، "3 أيام" -> "ثلاثة أيام"، "2 سنة" -> "سنتين"
+  (تذكير وتأنيث العدد حسب المعدود، والمعدود مفرد/مثنى/جمع حسب العدد)
+• التواريخ: "2036-10-15" -> "خمسة عشر أكتوبر ألفين وستة وثلاثين"
+• أرقام الهوية والإقامة والعمليات (5 أرقام فأكثر بدون فاصلة آلاف): رقمين رقمين
+• كل تحويل محفوظ (lru_cache) لأن نفس الردود والمبالغ تتكرر
+
+التجربة والمقارنة مع القراءة رقماً رقماً:
+    python number_converter.py
+"""
+
+import re
+from functools import lru_cache
+
+# ==========================
+# 🔢 الأعداد
+# ==========================
+# (مع معدود مذكر، مع معدود مؤنث) - من 3 إلى 10 العدد يخالف المعدود
+_UNITS = {
+    0: ("صفر", "صفر"),
+    1: ("واحد", "واحدة"),
+    2: ("اثنين", "اثنتين"),
+    3: ("ثلاثة", "ثلاث"),
+    4: ("أربعة", "أربع"),
+    5: ("خمسة", "خمس"),
+    6: ("ستة", "ست"),
+    7: ("سبعة", "سبع"),
+    8: ("ثمانية", "ثمان"),
+    9: ("تسعة", "تسع"),
+    10: ("عشرة", "عشر")
+}
+
+_TEENS = {
+    11: ("أحد عشر", "إحدى عشرة"),
+    12: ("اثنا عشر", "اثنتا عشرة")
+}
+
+_TENS = {2: "عشرين", 3: "ثلاثين", 4: "أربعين", 5: "خمسين", 6: "ستين", 7: "سبعين", 8: "ثمانين", 9: "تسعين"}
+
+_HUNDREDS = {
+    1: "مية", 2: "ميتين", 3: "ثلاثمية", 4: "أربعمية", 5: "خمسمية",
+    6: "ستمية", 7: "سبعمية", 8: "ثمانمية", 9: "تسعمية"
+}
+
+# (مفرد، مثنى، جمع) للآلاف والملايين والمليارات والتريليونات
+_SCALES = (
+    (1_000_000_000_000, ("تريليون", "تريليونين", "تريليونات")),
+    (1_000_000_000, ("مليار", "مليارين", "مليارات")),
+    (1_000_000, ("مليون", "مليونين", "ملايين")),
+    (1_000, ("ألف", "ألفين", "آلاف"))
+)
+
+def _below_hundred(number, feminine):
+    if number <= 10:
+        return _UNITS[number][feminine]
+    if number in _TEENS:
+        return _TEENS[number][feminine]
+    if number < 20:
+        return f"{_UNITS[number - 10][feminine]} {'عشرة' if feminine else 'عشر'}"
+    tens, unit = divmod(number, 10)
+    if not unit:
+        return _TENS[tens]
+    return f"{_UNITS[unit][feminine]} و{_TENS[tens]}"
+
+def _below_thousand(number, feminine):
+    hundreds, rest = divmod(number, 100)
+    parts = []
+    if hundreds:
+        parts.append(_HUNDREDS[hundreds])
+    if rest:
+        parts.append(_below_hundred(rest, feminine))
+    return " و".join(parts)
+
+@lru_cache(maxsize=4096)
+def cardinal(number, feminine=False):
+    """
+    العدد بالكلمات
+
+    Args:
+        number: عدد صحيح غير سالب
+        feminine: المعدود مؤنث (ثلاث سنوات) - الافتراضي مذكر (ثلاثة أيام)
+    """
+    if number == 0:
+        return _UNITS[0][0]
+    # أكبر من آخر مرتبة (ألف تريليون فأكثر) ليس مبلغاً حقيقياً - يُقرأ رقمين رقمين
+    if number >= _SCALES[0][0] * 1000:
+        return speak_digits(str(number))
+
+    parts = []
+    for scale, (singular, dual, plural) in _SCALES:
+        count, number = divmod(number, scale)
+        if not count:
+            continue
+        if count == 1:
+            parts.append(singular)
+        elif count == 2:
+            parts.append(dual)
+        elif count <= 10:
+            parts.append(f"{_UNITS[count][0]} {plural}")
+        else:
+            parts.append(f"{_below_thousand(count, False)} {singular}")
+
+    if number:
+        parts.append(_below_thousand(number, feminine))
+
+    return " و".join(parts)
+
+# ==========================
+# 📦 المعدود
+# ==========================
+# (مفرد، مثنى، جمع، مؤنث)
+COUNTED_NOUNS = {
+    "ريال": ("ريال", "ريالين", "ريالات", False),
+    "هللة": ("هللة", "هللتين", "هللات", True),
+    "يوم": ("يوم", "يومين", "أيام", False),
+    "أسبوع": ("أسبوع", "أسبوعين", "أسابيع", False),
+    "شهر": ("شهر", "شهرين", "شهور", False),
+    "سنة": ("سنة", "سنتين", "سنوات", True),
+    "ساعة": ("ساعة", "ساعتين", "ساعات", True),
+    "دقيقة": ("دقيقة", "دقيقتين", "دقائق", True),
+    "ثانية": ("ثانية", "ثانيتين", "ثواني", True),
+    "مستند": ("مستند", "مستندين", "مستندات", False),
+    "مخالفة": ("مخالفة", "مخالفتين", "مخالفات", True)
+}
+
+# كل صيغة مكتوبة بعد الرقم -> المعدود (الجمع والمثنى يُكتبان أيضاً بعد الرقم: "3 أيام"، "2 سنتين")
+_NOUN_FORMS = {}
+for _noun, (_singular, _dual, _plural, _) in COUNTED_NOUNS.items():
+    for _form in (_singular, _dual, _plural):
+        _NOUN_FORMS[_form] = _noun
+_NOUN_FORMS.update({"ايام": "يوم", "سنين": "سنة", "دقايق": "دقيقة", "شهور": "شهر", "أشهر": "شهر", "ريالاً": "ريال"})
+
+@lru_cache(maxsize=4096)
+def count_phrase(number, noun):
+    """
+    العدد مع المعدود بالتطابق الصحيح
+
+    1 -> "يوم واحد"، 2 -> "يومين"، 3..10 -> "ثلاثة أيام"، 11 فأكثر -> "أحد عشر يوم"
+    (وفي الأعداد الكبيرة الحكم لآخر جزئين: 103 -> "مية وثلاثة أيام")
+    """
+    singular, dual, plural, feminine = COUNTED_NOUNS[noun]
+
+    if number == 1:
+        return f"{singular} {_UNITS[1][feminine]}"
+    if number == 2:
+        return dual
+
+    rest = number % 100
+    noun_form = plural if 3 <= rest <= 10 else singular
+    return f"{cardinal(number, feminine)} {noun_form}"
+
+# ==========================
+# 📅 التواريخ والأرقام الطويلة
+# ==========================
+MONTHS = ("يناير", "فبراير", "مارس", "أبريل", "مايو", "يونيو",
+          "يوليو", "أغسطس", "سبتمبر", "أكتوبر", "نوفمبر", "ديسمبر")
+
+@lru_cache(maxsize=4096)
+def speak_date(year, month, day):
+    """YYYY-MM-DD -> "خمسة عشر أكتوبر ألفين وستة وثلاثين" """
+    if not 1 <= month <= 12 or not 1 <= day <= 31:
+        return f"{speak_digits(str(year))} {speak_digits(str(month))} {speak_digits(str(day))}"
+    return f"{cardinal(day)} {MONTHS[month - 1]} {cardinal(year)}"
+
+@lru_cache(maxsize=4096)
+def speak_digits(digits):
+    """
+    رقم هوية أو إقامة أو عملية: رقمين رقمين ("1010101010" -> "عشرة عشرة عشرة عشرة عشرة")
+
+    الصفر في أول الزوج يُقرأ ("05" -> "صفر خمسة")، والعدد الفردي يبدأ برقم واحد.
+    """
+    groups = []
+    start = len(digits) % 2
+    if start:
+        groups.append(_UNITS[int(digits[0])][0])
+    for index in range(start, len(digits), 2):
+        pair = digits[index:index + 2]
+        if pair[0] == "0":
+            groups.append(f"صفر {_UNITS[int(pair[1])][0]}")
+        else:
+            groups.append(cardinal(int(pair)))
+    return " ".join(groups)
+
+# ==========================
+# 🗣️ تحويل النص
+# ==========================
+# الأرقام الأطول من هذا (بدون معدود) تُقرأ رقمين رقمين: هوية، إقامة، جوال، رقم عملية
+LONG_NUMBER_DIGITS = 5
+
+_TOKEN = re.compile(
+    r"(?P<date>(?<!\d)(?P<year>\d{4})-(?P<month>\d{1,2})-(?P<day>\d{1,2})(?!\d))"
+    r"|(?P<number>(?P<integer>\d{1,3}(?:[,٬]\d{3})+|\d+)(?:[.٫](?P<fraction>\d+))?)"
+    r"(?:(?P<space>\s*)(?P<noun>" + "|".join(sorted(map(re.escape, _NOUN_FORMS), key=len, reverse=True)) + r")(?!\w))?"
+)
+
+# الأرقام الهندية والفارسية -> 0-9، وحذف فواصل الآلاف (1,200)
+_DIGITS = str.maketrans({**{chr(0x0660 + digit): str(digit) for digit in range(10)},
+                         **{chr(0x06F0 + digit): str(digit) for digit in range(10)},
+                         ",": None, "٬": None})
+
+def _fraction(fraction, noun):
+    """الكسر العشري: هللات للريال، وإلا "فاصلة" ثم الأرقام"""
+    if noun == "ريال":
+        halalas = int(fraction[:2].ljust(2, "0"))
+        return f" و{count_phrase(halalas, 'هللة')}" if halalas else ""
+    if not fraction.strip("0"):
+        return ""
+    return f" فاصلة {speak_digits(fraction.rstrip('0'))}"
+
+def _speak(match):
+    spoken = _speak_token(match)
+    # "REF1480..." -> "REF أربعة عشر..." (الكلمات لا تلتصق بالحروف قبلها وبعدها)
+    start, end, text = match.start(), match.end(), match.string
+    if start and text[start - 1].isalpha():
+        spoken = " " + spoken
+    if end < len(text) and text[end].isalpha():
+        spoken += " "
+    return spoken
+
+def _speak_token(match):
+    if match.group("date"):
+        return speak_date(*(int(match.group(part).translate(_DIGITS)) for part in ("year", "month", "day")))
+
+    written = match.group("integer")
+    integer = written.translate(_DIGITS)
+    fraction = match.group("fraction")
+    if fraction:
+        fraction = fraction.translate(_DIGITS)
+    noun_text = match.group("noun")
+    noun = _NOUN_FORMS.get(noun_text) if noun_text else None
+
+    if noun is None:
+        # فاصلة الآلاف (12,345) تعني مبلغاً لا رقم هوية
+        grouped = "," in written or "٬" in written
+        if len(integer) >= LONG_NUMBER_DIGITS and not fraction and not grouped:
+            return speak_digits(integer)
+        return cardinal(int(integer)) + (_fraction(fraction, None) if fraction else "")
+
+    number = int(integer)
+    if fraction and noun != "ريال" and fraction.strip("0"):
+        # "2.5 ساعة": الكسر قبل المعدود
+        return f"{cardinal(number, COUNTED_NOUNS[noun][3])}{_fraction(fraction, None)} {COUNTED_NOUNS[noun][0]}"
+    return count_phrase(number, noun) + (_fraction(fraction, noun) if fraction else "")
+
+@lru_cache(maxsize=4096)
+def convert_text_numbers(text):
+    """
+    كل الأرقام في النص بصيغة منطوقة - مرور واحد بتعبير منتظم واحد
+
+    Args:
+        text: الرد كما سيُنطق
+
+    Returns:
+        النص بعد تحويل الأرقام
+    """
+    return _TOKEN.sub(_speak, text)
+
+# ==========================
+# 🧪 المقارنة
+# ==========================
+def format_numbers_digit_by_digit(text):
+    """الطريقة السابقة (رقماً رقماً بعشرة استبدالات) - للمقارنة فقط"""
+    numbers_map = {
+        '0': 'صفر', '1': 'واحد', '2': 'اثنين', '3': 'ثلاثة', '4': 'أربعة',
+        '5': 'خمسة', '6': 'ستة', '7': 'سبعة', '8': 'ثمانية', '9': 'تسعة'
+    }
+    result = text
+    for num, word in numbers_map.items():
+        result = result.replace(num, f" {word} ")
+    return result
+
+SAMPLE_REPLIES = [
+    "رسوم التجديد 300 ريال.",
+    "عندك إقامة محمد خان رقم 2456789012 منتهي من 171 يوم! رسوم التجديد: 650 ريال.",
+    "تم بحمد الله! جددت لك الهوية الوطنية.\n• رقم المستند: 1010101010\n• تاريخ الانتهاء الجديد: 2036-10-15\n"
+    "• المبلغ المدفوع: 300 ريال\n• رقم العملية: REF1480357447925760\nرصيدك الحالي: 1200.0 ريال.",
+    "رصيد محفظتك العائلية: 850.5 ريال.",
+    "عندك جواز السفر بينتهي بعد 3 أيام! وعندك 2 مستند ثاني يحتاج انتباه.",
+    "تمام، ضبطت لك تذكير. بذكرك قبل 5 أيام من انتهاء رخصة القيادة.",
+    "الإقامة تتجدد لمدة 1 سنة، والهوية لمدة 10 سنوات.",
+    "المخالفة رقم 987654 بتاريخ 2024-03-11 قيمتها 150 ريال."
+]
+
+def run_benchmark(rounds=20000):
+    """مقارنة السرعة وطول النص المنطوق مع القراءة رقماً رقماً"""
+    import time
+
+    def measure(function, samples):
+        started = time.perf_counter()
+        for index in range(rounds):
+            function(samples[index % len(samples)])
+        return (time.perf_counter() - started) / rounds * 1e6
+
+    for reply in SAMPLE_REPLIES[:3]:
+        print(f"📝 {reply}\n   ❌ {' '.join(format_numbers_digit_by_digit(reply).split())}\n   ✅ {convert_text_numbers(reply)}\n")
+
+    old_chars = sum(len(" ".join(format_numbers_digit_by_digit(reply).split())) for reply in SAMPLE_REPLIES)
+    new_chars = sum(len(convert_text_numbers(reply)) for reply in SAMPLE_REPLIES)
+
+    # ردود جديدة في كل مرة (بدون كاش النص الكامل) وردود متكررة (الحالة الشائعة)
+    unique = [f"{reply} ({index})" for index in range(rounds) for reply in SAMPLE_REPLIES[:1]]
+    old_us = measure(format_numbers_digit_by_digit, SAMPLE_REPLIES)
+    convert_text_numbers.cache_clear()
+    cold_us = measure(lambda text: convert_text_numbers.__wrapped__(text), SAMPLE_REPLIES)
+    warm_us = measure(convert_text_numbers, SAMPLE_REPLIES)
+    unique_us = measure(convert_text_numbers, unique)
+
+    print(f"⏱️ رقماً رقماً: {old_us:.2f} ميكروثانية/رد")
+    print(f"⏱️ المحوّل بدون كاش: {cold_us:.2f} | ردود جديدة: {unique_us:.2f} | ردود متكررة: {warm_us:.2f}")
+    print(f"🗣️ طول النص المنطوق: {old_chars} -> {new_chars} حرف ({(1 - new_chars / old_chars) * 100:.0f}% أقصر)")
+
+if __name__ == "__main__":
+    run_benchmark()
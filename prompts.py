@@ -3,6 +3,12 @@
 يحتوي على جميع النصوص والتعليمات للمساعد الذكي
 """
 
+import threading
+from collections import OrderedDict
+from datetime import date
+
+from data import SERVICES_DESCRIPTION
+
 # ==========================
 # 🎭 شخصية المساعد
 # ==========================
@@ -68,13 +74,18 @@ def get_whats_new_message(user, expiring_docs):
     # إضافة باقي المستندات إذا كان هناك أكثر من واحد
     if len(expiring_docs) > 1:
         message_parts.append(f"\nوعندك {len(expiring_docs) - 1} مستند ثاني يحتاج انتباه.")
+        total_fee = sum(doc["renewal_fee"] for doc in expiring_docs)
+        message_parts.append(f"تجديدها كلها: {total_fee} ريال.")
     
     # رصيد المحفظة
     wallet_balance = user.get("family_wallet", {}).get("balance", 0)
     message_parts.append(f"\nرصيد محفظتك العائلية: {wallet_balance} ريال.")
     
-    # سؤال التجديد
-    message_parts.append("\nتبغاني أجدده لك الحين؟ ولا تذكرك قبل الموعد؟")
+    # سؤال التجديد (أكثر من مستند: كلها بعملية وحدة)
+    if len(expiring_docs) > 1:
+        message_parts.append("\nتبغاني أجددها كلها لك الحين بعملية وحدة؟ ولا تذكرك قبل الموعد؟")
+    else:
+        message_parts.append("\nتبغاني أجدده لك الحين؟ ولا تذكرك قبل الموعد؟")
     
     return " ".join(message_parts)
 
@@ -87,6 +98,8 @@ RENEWAL_CONFIRMATION = """تمام، راح أجدد لك {document_type}.
 
 تبغى تدفع من محفظتك العائلية؟ فيها {wallet_balance} ريال."""
 
+RENEWAL_DECLINED = "تمام، ما جددت شي ولا خصمت من المحفظة. تبغى شي ثاني؟"
+
 RENEWAL_SUCCESS = """تم بحمد الله! جددت لك {document_type}.
 
 التفاصيل:
@@ -99,6 +112,30 @@ RENEWAL_SUCCESS = """تم بحمد الله! جددت لك {document_type}.
 
 تبغى شي ثاني؟"""
 
+PARTIAL_RENEWAL_NOTE = """رصيد المحفظة ({wallet_balance} ريال) ما يكفي لتجديدها كلها ({total_fee} ريال)، فبدأت بالأهم.
+يبقى بعدها: {remaining}.
+
+"""
+
+DOCUMENT_NOT_DUE = "تجديد {document_type} مو مطلوب الحين. إذا تبغى تجدد المستندات القريبة الانتهاء قل: جددها كلها."
+
+BULK_RENEWAL_CONFIRMATION = """تمام، راح أجدد لك {count} مستندات بعملية وحدة:
+{documents}
+
+المجموع: {total_fee} ريال.
+
+تبغى تدفع من محفظتك العائلية؟ فيها {wallet_balance} ريال."""
+
+BULK_RENEWAL_SUCCESS = """تم بحمد الله! جددت لك المستندات:
+{documents}
+
+• المبلغ المدفوع: {total_fee} ريال
+• رقم العملية: {reference_number}
+
+{wallet_message}
+
+تبغى شي ثاني؟"""
+
 REMINDER_SET = """تمام، ضبطت لك تذكير.
 
 بذكرك قبل {days_before} أيام من انتهاء {document_type}.
@@ -111,60 +148,24 @@ INSUFFICIENT_FUNDS = """رصيد المحفظة ما يكفي للتجديد.
 المطلوب: {required_amount} ريال
 الناقص: {shortage} ريال
 
-تبغى تشحن المحفظة؟ ولا تدفع بطريقة ثانية؟"""
+ما خصمت شي. اشحن المحفظة من تطبيق أبشر، وبعدها قل "جدد" وأكمل لك."""
 
 # ==========================
 # 🎯 البرومت الرئيسي للـ AI
 # ==========================
-def build_system_prompt(user, expiring_docs=None):
-    """
-    بناء البرومت الرئيسي للمساعد
-    
-    Args:
-        user: بيانات المستخدم
-        expiring_docs: المستندات القريبة من الانتهاء
-    
-    Returns:
-        البرومت الكامل
-    """
-    
-    import json
-    from data import SERVICES_DESCRIPTION
-    
-    nickname = user.get("nickname", "")
-    name = user.get("name", "")
-    children_names = ", ".join([child["name"] for child in user.get("children", [])])
-    wallet_balance = user.get("family_wallet", {}).get("balance", 0)
-    
-    # معلومات المستندات المنتهية
-    expiring_info = ""
-    if expiring_docs:
-        expiring_info = "\n\n📌 مستندات تحتاج انتباه:\n"
-        for doc in expiring_docs[:3]:  # أول 3 فقط
-            days_text = f"منتهي من {abs(doc['days_left'])} يوم" if doc['days_left'] < 0 else f"بينتهي بعد {doc['days_left']} يوم"
-            expiring_info += f"• {doc['name_ar']}: {days_text} - رسوم التجديد: {doc['renewal_fee']} ريال\n"
-    
-    user_info = f"""
-👤 معلومات المستخدم:
-• الاسم: {name}
-• الكنية: {nickname}
-• أولاده: {children_names if children_names else "لا يوجد"}
-• رصيد المحفظة العائلية: {wallet_balance} ريال
-{expiring_info}
-"""
-
-    prompt = f"""أنت {ASSISTANT_NAME} - {ASSISTANT_ROLE}.
+# الجزء الثابت يُبنى مرة واحدة ويبقى نفس البايتات في كل طلب،
+# فيستفيد من كاش البادئة (prompt caching) عند مزود النموذج.
+# معلومات المستخدم في الجزء الأخير فقط.
+STATIC_SYSTEM_PROMPT = f"""أنت {ASSISTANT_NAME} - {ASSISTANT_ROLE}.
 
 🎭 شخصيتك:
 {ASSISTANT_PERSONALITY}
 
-{user_info}
-
 📋 خدمات أبشر:
 {SERVICES_DESCRIPTION}
 
 🎤 أسلوب التحدث:
-• ناديه بكنيته: "{nickname}" (مهم جداً!)
+• ناديه بكنيته المذكورة في معلومات المستخدم (مهم جداً!)
 • ردود قصيرة ومباشرة: 20-40 كلمة كحد أقصى
 • لهجة سعودية فصيحة: "هلا"، "تمام"، "حاضر"، "أكيد"
 • استباقي: اعرض المساعدة قبل ما يطلبها
@@ -183,10 +184,10 @@ def build_system_prompt(user, expiring_docs=None):
 
 ✅ أمثلة صحيحة:
 سؤال: "وش عندي من جديد؟"
-رد: "هلا {nickname}، عندك هويتك الوطنية بتنتهي بعد 20 يوم، رسوم التجديد 300 ريال. تبغى أجددها لك الحين؟"
+رد: "هلا [الكنية]، عندك هويتك الوطنية بتنتهي بعد 20 يوم، رسوم التجديد 300 ريال. تبغى أجددها لك الحين؟"
 
 سؤال: "نعم جددها"
-رد: "تمام، المبلغ 300 ريال. تبغى تدفع من محفظتك؟ فيها {wallet_balance} ريال."
+رد: "تمام، المبلغ 300 ريال. تبغى تدفع من محفظتك؟ فيها [رصيد المحفظة] ريال."
 
 سؤال: "نعم من المحفظة"
 رد: "تم بحمد الله! جددت لك الهوية، تنتهي بتاريخ... رصيدك صار ... ريال. تبغى شي ثاني؟"
@@ -200,7 +201,76 @@ def build_system_prompt(user, expiring_docs=None):
 🎯 مهمتك: كن مساعداً شخصياً يعرف المستخدم ويتوقع احتياجاته قبل ما يطلبها.
 """
 
-    return prompt
+# كاش الجزء الخاص بكل مستخدم: (رقم الجوال، نسخة البيانات، اليوم) -> النص
+# يُستخدم من خيوط الطلبات والتوليد وتجهيز السياق معاً، فكل قراءة وكتابة تحت القفل
+USER_PROMPT_CACHE_SIZE = 1024
+_user_prompt_cache = OrderedDict()
+_user_prompt_lock = threading.Lock()
+
+def build_user_context(user, expiring_docs=None):
+    """
+    الجزء الخاص بالمستخدم في البرومت (يأتي بعد الجزء الثابت)
+    
+    يُحفظ حسب نسخة بيانات المستخدم (تزيد مع كل تجديد أو خصم من المحفظة)
+    واليوم الحالي (لأن الأيام المتبقية تتغير يومياً)
+    
+    Args:
+        user: بيانات المستخدم
+        expiring_docs: المستندات القريبة من الانتهاء
+    
+    Returns:
+        نص معلومات المستخدم
+    """
+    
+    cache_key = (user.get("phone"), user.get("version", 0), date.today())
+    with _user_prompt_lock:
+        cached = _user_prompt_cache.get(cache_key)
+        if cached is not None:
+            _user_prompt_cache.move_to_end(cache_key)
+            return cached
+    
+    nickname = user.get("nickname", "")
+    name = user.get("name", "")
+    children_names = ", ".join([child["name"] for child in user.get("children", [])])
+    wallet_balance = user.get("family_wallet", {}).get("balance", 0)
+    
+    # معلومات المستندات المنتهية
+    expiring_info = ""
+    if expiring_docs:
+        expiring_info = "\n\n📌 مستندات تحتاج انتباه:\n"
+        for doc in expiring_docs[:3]:  # أول 3 فقط
+            days_text = f"منتهي من {abs(doc['days_left'])} يوم" if doc['days_left'] < 0 else f"بينتهي بعد {doc['days_left']} يوم"
+            expiring_info += f"• {doc['name_ar']}: {days_text} - رسوم التجديد: {doc['renewal_fee']} ريال\n"
+    
+    user_info = f"""
+👤 معلومات المستخدم:
+• الاسم: {name}
+• الكنية: {nickname}
+• أولاده: {children_names if children_names else "لا يوجد"}
+• رصيد المحفظة العائلية: {wallet_balance} ريال
+{expiring_info}
+"""
+    
+    with _user_prompt_lock:
+        _user_prompt_cache[cache_key] = user_info
+        while len(_user_prompt_cache) > USER_PROMPT_CACHE_SIZE:
+            _user_prompt_cache.popitem(last=False)
+    
+    return user_info
+
+def build_system_prompt(user, expiring_docs=None):
+    """
+    بناء البرومت الرئيسي للمساعد
+    
+    Args:
+        user: بيانات المستخدم
+        expiring_docs: المستندات القريبة من الانتهاء
+    
+    Returns:
+        البرومت الكامل (الجزء الثابت + معلومات المستخدم)
+    """
+    
+    return STATIC_SYSTEM_PROMPT + build_user_context(user, expiring_docs)
 
 # ==========================
 # 📝 رسائل النظام
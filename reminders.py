@@ -0,0 +1,548 @@
+"""
+التذكيرات - مخزن دائم وعامل يرسل كل تذكير في موعده
+
+• المخزن: SQLite بفهرس (status, available_at)، فأقرب تذكير يُقرأ بدون المرور على الباقي
+• العامل: heap لأقرب التذكيرات، ينام حتى أول موعد (أو حتى يُضاف تذكير أقرب)
+• الإرسال: دفعات عبر Notifier قابل للتبديل (طرفية محلية بدل Twilio أثناء التطوير)
+• التسليم: التذكير يُحجز لمدة محددة قبل الإرسال، وإذا لم يتأكد الإرسال (خطأ أو توقف
+  العملية) يرجع تلقائياً. قبل كل رسالة يُسجل في المخزن أن إرسالها بدأ (ويُمدد حجز باقي
+  الدفعة)، وبعدها رقمها عند المزود؛ فالتذكير المحجوز من جديد بعد انقطاع أثناء الإرسال
+  يُسأل عنه المزود (find_sent) قبل إعادته. dedupe_key يمنع تسجيل نفس التذكير مرتين
+"""
+
+import os
+import time
+import uuid
+import heapq
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+from config import (
+    REMINDER_DB_PATH, REMINDER_NOTIFIER, REMINDER_SEND_HOUR, REMINDER_BATCH_SIZE, REMINDER_WINDOW,
+    REMINDER_LEASE_SECONDS, REMINDER_RETRY_SECONDS, REMINDER_MAX_ATTEMPTS, REMINDER_IDLE_SECONDS,
+    TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, TWILIO_PHONE_NUMBER
+)
+
+# حالات التذكير
+PENDING = "pending"
+SENT = "sent"
+FAILED = "failed"
+
+def new_reminder_id():
+    """رقم تذكير فريد (بدل الطابع الزمني بالثواني الذي يتكرر)"""
+    return f"REM{uuid.uuid4().hex[:20].upper()}"
+
+def reminder_due_at(reminder_date, hour=REMINDER_SEND_HOUR):
+    """وقت الإرسال (epoch) - الساعة المحددة من يوم التذكير"""
+    return (datetime.strptime(reminder_date, "%Y-%m-%d") + timedelta(hours=hour)).timestamp()
+
+# ==========================
+# 🗄️ المخزن
+# ==========================
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS reminders (
+    reminder_id TEXT PRIMARY KEY,
+    dedupe_key TEXT NOT NULL UNIQUE,
+    phone TEXT NOT NULL,
+    document_type TEXT NOT NULL,
+    document_number TEXT NOT NULL,
+    expiry_date TEXT NOT NULL,
+    reminder_date TEXT NOT NULL,
+    message TEXT NOT NULL,
+    status TEXT NOT NULL,
+    available_at REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    claim_token TEXT,
+    last_error TEXT,
+    created_at TEXT NOT NULL,
+    sent_at TEXT,
+    send_started_at REAL,
+    provider_sid TEXT
+);
+CREATE INDEX IF NOT EXISTS reminders_due ON reminders (status, available_at);
+CREATE INDEX IF NOT EXISTS reminders_phone ON reminders (phone);
+"""
+
+_COLUMNS = ("reminder_id", "phone", "document_type", "document_number", "expiry_date", "reminder_date",
+            "message", "attempts", "send_started_at")
+
+# أعمدة أُضيفت بعد إنشاء الجدول (تُضاف للملفات القديمة عند الفتح)
+_ADDED_COLUMNS = {"send_started_at": "REAL", "provider_sid": "TEXT"}
+
+class ReminderStore:
+    """
+    مخزن التذكيرات في ملف SQLite بوضع WAL
+
+    available_at هو موعد الإرسال للتذكير الجديد، وعند الحجز يصبح نهاية مدة الحجز،
+    فالتذكير المحجوز من عامل توقف يظهر من جديد بدون أي تنظيف.
+    """
+
+    def __init__(self, path=REMINDER_DB_PATH, lease_seconds=REMINDER_LEASE_SECONDS):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self._local = threading.local()
+        conn = self._connection()
+        conn.executescript(SQLITE_SCHEMA)
+        existing = {row[1] for row in conn.execute("PRAGMA table_info(reminders)")}
+        for column, kind in _ADDED_COLUMNS.items():
+            if column not in existing:
+                conn.execute(f"ALTER TABLE reminders ADD COLUMN {column} {kind}")
+
+    def _connection(self):
+        """اتصال خاص بالخيط الحالي (ويُعاد إنشاؤه بعد fork)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        else:
+            conn.execute("COMMIT")
+
+    def add(self, phone, document_type, document_number, expiry_date, reminder_date, message, due_at=None):
+        """
+        تسجيل تذكير (مرة واحدة لكل جوال + مستند + يوم تذكير)
+
+        Returns:
+            (reminder_id, due_at, created) - created = False إذا كان مسجلاً من قبل
+        """
+        dedupe_key = f"{phone}:{document_number}:{reminder_date}"
+        due_at = reminder_due_at(reminder_date) if due_at is None else due_at
+        reminder_id = new_reminder_id()
+
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO reminders (reminder_id, dedupe_key, phone, document_type, document_number, "
+                "expiry_date, reminder_date, message, status, available_at, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (reminder_id, dedupe_key, phone, document_type, document_number, expiry_date, reminder_date,
+                 message, PENDING, due_at, datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+            )
+            if cursor.rowcount:
+                return reminder_id, due_at, True
+
+            existing_id, existing_due = conn.execute(
+                "SELECT reminder_id, available_at FROM reminders WHERE dedupe_key = ?", (dedupe_key,)
+            ).fetchone()
+            return existing_id, existing_due, False
+
+    def upcoming(self, until, limit):
+        """
+        أقرب التذكيرات غير المرسلة حتى وقت معين (عبر الفهرس فقط)
+
+        Returns:
+            [(available_at, reminder_id), ...] مرتبة
+        """
+        return self._connection().execute(
+            "SELECT available_at, reminder_id FROM reminders WHERE status = ? AND available_at <= ? "
+            "ORDER BY available_at LIMIT ?", (PENDING, until, limit)
+        ).fetchall()
+
+    def next_due(self):
+        """موعد أقرب تذكير غير مرسل أو None"""
+        return self._connection().execute(
+            "SELECT MIN(available_at) FROM reminders WHERE status = ?", (PENDING,)
+        ).fetchone()[0]
+
+    def claim(self, reminder_ids, now):
+        """
+        حجز التذكيرات المستحقة للإرسال (ما حجزه عامل آخر أو لم يحن موعده يُتجاهل)
+
+        Returns:
+            (token, [reminder, ...])
+        """
+        token = uuid.uuid4().hex
+        with self._transaction() as conn:
+            conn.executemany(
+                "UPDATE reminders SET available_at = ?, claim_token = ?, attempts = attempts + 1 "
+                "WHERE reminder_id = ? AND status = ? AND available_at <= ?",
+                [(now + self.lease_seconds, token, reminder_id, PENDING, now) for reminder_id in reminder_ids]
+            )
+            placeholders = ", ".join("?" * len(reminder_ids))
+            rows = conn.execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM reminders WHERE reminder_id IN ({placeholders}) AND claim_token = ?",
+                (*reminder_ids, token)
+            ).fetchall()
+        return token, [dict(zip(_COLUMNS, row)) for row in rows]
+
+    def mark_sending(self, token, reminder_id, now):
+        """
+        قبل إرسال رسالة: تسجيل بداية إرسالها وتمديد حجز كل الدفعة (الدفعة الطويلة لا يحجزها عامل آخر)
+
+        Returns:
+            False إذا لم يعد الحجز لنفس العامل (انتهت مدته) - لا تُرسل
+        """
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE reminders SET available_at = ? WHERE claim_token = ? AND status = ?",
+                (now + self.lease_seconds, token, PENDING)
+            )
+            return bool(conn.execute(
+                "UPDATE reminders SET send_started_at = ? WHERE reminder_id = ? AND claim_token = ?",
+                (now, reminder_id, token)
+            ).rowcount)
+
+    def mark_sent(self, token, reminder_ids, provider_sid=None):
+        """تأكيد الإرسال ورقم الرسالة عند المزود (فقط إذا كان الحجز ما زال لنفس العامل)"""
+        sent_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with self._transaction() as conn:
+            conn.executemany(
+                "UPDATE reminders SET status = ?, sent_at = ?, provider_sid = COALESCE(?, provider_sid), claim_token = NULL "
+                "WHERE reminder_id = ? AND claim_token = ?",
+                [(SENT, sent_at, provider_sid, reminder_id, token) for reminder_id in reminder_ids]
+            )
+
+    def release(self, token, reminders, error, now, retry_seconds=REMINDER_RETRY_SECONDS, max_attempts=REMINDER_MAX_ATTEMPTS):
+        """
+        إرجاع تذكيرات فشل إرسالها بانتظار متضاعف، أو إيقافها بعد آخر محاولة
+
+        Returns:
+            [(available_at, reminder_id), ...] للتذكيرات التي ستُعاد
+        """
+        retries = []
+        with self._transaction() as conn:
+            for reminder in reminders:
+                if reminder["attempts"] >= max_attempts:
+                    conn.execute(
+                        "UPDATE reminders SET status = ?, last_error = ?, claim_token = NULL WHERE reminder_id = ? AND claim_token = ?",
+                        (FAILED, error, reminder["reminder_id"], token)
+                    )
+                    continue
+
+                available_at = now + retry_seconds * 2 ** (reminder["attempts"] - 1)
+                # الحجز انتهى وأخذه عامل آخر: ليس لنا إعادة جدولته
+                if conn.execute(
+                    "UPDATE reminders SET available_at = ?, last_error = ?, claim_token = NULL WHERE reminder_id = ? AND claim_token = ?",
+                    (available_at, error, reminder["reminder_id"], token)
+                ).rowcount:
+                    retries.append((available_at, reminder["reminder_id"]))
+        return retries
+
+    def for_phone(self, phone):
+        """تذكيرات مستخدم (للعرض)"""
+        rows = self._connection().execute(
+            "SELECT reminder_id, document_type, document_number, reminder_date, status FROM reminders "
+            "WHERE phone = ? ORDER BY available_at", (phone,)
+        ).fetchall()
+        return [dict(zip(("reminder_id", "document_type", "document_number", "reminder_date", "status"), row)) for row in rows]
+
+    def counts(self):
+        return dict(self._connection().execute("SELECT status, COUNT(*) FROM reminders GROUP BY status").fetchall())
+
+# ==========================
+# 📨 المرسلون
+# ==========================
+class SendJournal:
+    """ما يسجله المرسل في المخزن حول كل رسالة في الدفعة (بنفس حجز العامل)"""
+
+    def __init__(self, store, token):
+        self.store = store
+        self.token = token
+
+    def begin(self, reminder):
+        """قبل الإرسال - False: الحجز انتهى ولا يجوز الإرسال"""
+        return self.store.mark_sending(self.token, reminder["reminder_id"], time.time())
+
+    def done(self, reminder, provider_sid):
+        """بعد الإرسال مباشرة - التذكير مرسل حتى لو توقفت العملية قبل نهاية الدفعة"""
+        self.store.mark_sent(self.token, [reminder["reminder_id"]], provider_sid)
+
+class Notifier:
+    """
+    واجهة الإرسال
+
+    send_batch يستقبل دفعة تذكيرات ويرجع أرقام ما وصل منها، ويستدعي journal.begin قبل
+    كل رسالة و journal.done بعدها. find_sent يسأل المزود عن تذكير انقطع إرساله
+    (send_started_at بدون تأكيد) قبل إعادته - None يعني إعادة الإرسال.
+    """
+
+    name = "base"
+
+    def send_batch(self, reminders, journal):
+        raise NotImplementedError
+
+    def find_sent(self, reminder, since):
+        """رقم الرسالة إذا كانت وصلت المزود بعد since، وإلا None"""
+        return None
+
+class ConsoleNotifier(Notifier):
+    """مرسل محلي يطبع الرسائل بدل Twilio - ويتجاهل التذكير إذا وصل من قبل"""
+
+    name = "console"
+
+    def __init__(self):
+        self.delivered = set()
+        self.duplicates = 0
+        self._lock = threading.Lock()
+
+    def send_batch(self, reminders, journal):
+        delivered = []
+        for reminder in reminders:
+            if not journal.begin(reminder):
+                continue
+
+            with self._lock:
+                if reminder["reminder_id"] in self.delivered:
+                    self.duplicates += 1
+                else:
+                    self.delivered.add(reminder["reminder_id"])
+                    print(f"🔔 [{reminder['reminder_id']}] إلى {reminder['phone']}: {reminder['message']}")
+
+            journal.done(reminder, reminder["reminder_id"])
+            delivered.append(reminder["reminder_id"])
+        return delivered
+
+    def find_sent(self, reminder, since):
+        with self._lock:
+            return reminder["reminder_id"] if reminder["reminder_id"] in self.delivered else None
+
+class TwilioSMSNotifier(Notifier):
+    """إرسال التذكير كرسالة SMS عبر Twilio"""
+
+    name = "twilio_sms"
+
+    def __init__(self, client=None, from_number=TWILIO_PHONE_NUMBER):
+        if client is None:
+            from twilio.rest import Client
+            client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
+        self.client = client
+        self.from_number = from_number
+
+    def send_batch(self, reminders, journal):
+        delivered = []
+        for reminder in reminders:
+            if not journal.begin(reminder):
+                continue
+            try:
+                message = self.client.messages.create(to=reminder["phone"], from_=self.from_number, body=reminder["message"])
+            except Exception as e:
+                print(f"❌ فشل إرسال التذكير {reminder['reminder_id']}: {e}")
+                continue
+            journal.done(reminder, message.sid)
+            delivered.append(reminder["reminder_id"])
+        return delivered
+
+    def find_sent(self, reminder, since):
+        """نفس النص لنفس الرقم من نفس المرسل بعد بداية الإرسال المنقطع"""
+        messages = self.client.messages.list(
+            to=reminder["phone"], from_=self.from_number,
+            date_sent_after=datetime.fromtimestamp(since, tz=timezone.utc), limit=20
+        )
+        for message in messages:
+            if message.body == reminder["message"]:
+                return message.sid
+        return None
+
+NOTIFIERS = {
+    ConsoleNotifier.name: ConsoleNotifier,
+    TwilioSMSNotifier.name: TwilioSMSNotifier
+}
+
+# ==========================
+# ⏰ الجدولة
+# ==========================
+class ReminderScheduler:
+    """
+    العامل: heap لأقرب REMINDER_WINDOW تذكير من المخزن
+
+    ينام حتى أول موعد في الـ heap (أو REMINDER_IDLE_SECONDS كحد أقصى)، ويستيقظ فوراً
+    إذا أُضيف تذكير أقرب. عند فراغ الـ heap أو انتهاء نافذته يُعاد تحميله من الفهرس.
+    """
+
+    def __init__(self, store=None, notifier=None, batch_size=REMINDER_BATCH_SIZE, window=REMINDER_WINDOW,
+                 idle_seconds=REMINDER_IDLE_SECONDS):
+        self.store = store or ReminderStore()
+        self.notifier = notifier or NOTIFIERS[REMINDER_NOTIFIER]()
+        self.batch_size = batch_size
+        self.window = window
+        self.idle_seconds = idle_seconds
+
+        self._heap = []
+        self._horizon = 0.0  # كل التذكيرات قبل هذا الوقت محملة في الـ heap
+        self._wakeup = threading.Condition()
+        self._thread = None
+        self._stopping = False
+
+        self.sent = 0
+        self.retried = 0
+        self.recovered = 0
+        self.batches = 0
+
+    def schedule(self, phone, document_type, document_number, expiry_date, reminder_date, message, due_at=None):
+        """
+        تسجيل تذكير وإيقاظ العامل إذا كان أقرب من كل ما عنده
+
+        Returns:
+            (reminder_id, created)
+        """
+        reminder_id, due_at, created = self.store.add(
+            phone, document_type, document_number, expiry_date, reminder_date, message, due_at
+        )
+
+        if created:
+            with self._wakeup:
+                if due_at <= self._horizon:
+                    heapq.heappush(self._heap, (due_at, reminder_id))
+                    if self._heap[0][1] == reminder_id:
+                        self._wakeup.notify()
+
+        return reminder_id, created
+
+    def _refill(self, now):
+        """تحميل أقرب التذكيرات من الفهرس - داخل القفل"""
+        upcoming = self.store.upcoming(now + self.idle_seconds, self.window)
+        self._heap = list(upcoming)
+        heapq.heapify(self._heap)
+        # إذا امتلأت النافذة فالـ heap يغطي فقط حتى آخر تذكير فيها
+        self._horizon = upcoming[-1][0] if len(upcoming) == self.window else now + self.idle_seconds
+
+    def _take_due(self, now):
+        """أرقام التذكيرات المستحقة (دفعة واحدة كحد أقصى) - داخل القفل"""
+        due = []
+        while self._heap and self._heap[0][0] <= now and len(due) < self.batch_size:
+            due.append(heapq.heappop(self._heap)[1])
+        return due
+
+    def run_once(self, now=None):
+        """
+        إرسال كل ما استحق الآن على دفعات
+
+        Returns:
+            عدد التذكيرات المرسلة
+        """
+        now = time.time() if now is None else now
+        sent = 0
+
+        while True:
+            with self._wakeup:
+                if not self._heap or now >= self._horizon:
+                    self._refill(now)
+                due = self._take_due(now)
+
+            if not due:
+                return sent
+
+            token, reminders = self.store.claim(due, now)
+            if reminders:
+                sent += self._dispatch(token, reminders, now)
+
+    def _recover(self, token, reminders):
+        """
+        تذكيرات انقطع إرسالها (بدأ ولم يتأكد): ما وصل المزود يُؤكد بدون إعادة
+
+        Returns:
+            التذكيرات التي تحتاج إرسالاً
+        """
+        pending = []
+        for reminder in reminders:
+            provider_sid = None
+            if reminder["send_started_at"] is not None:
+                try:
+                    provider_sid = self.notifier.find_sent(reminder, reminder["send_started_at"])
+                except Exception as e:
+                    print(f"❌ تعذر التحقق من إرسال التذكير {reminder['reminder_id']}: {e}")
+            if provider_sid:
+                self.store.mark_sent(token, [reminder["reminder_id"]], provider_sid)
+                self.recovered += 1
+            else:
+                pending.append(reminder)
+        return pending
+
+    def _dispatch(self, token, reminders, now):
+        to_send = reminders
+        try:
+            to_send = self._recover(token, reminders)
+            delivered = set(self.notifier.send_batch(to_send, SendJournal(self.store, token))) if to_send else set()
+            error = "not delivered"
+        except Exception as e:
+            delivered = set()
+            error = str(e)
+
+        self.batches += 1
+        if delivered:
+            # كل رسالة تأكدت عند إرسالها (journal.done) - هذا احتياط لمرسل لا يستدعيه
+            self.store.mark_sent(token, delivered)
+            self.sent += len(delivered)
+
+        failed = [reminder for reminder in to_send if reminder["reminder_id"] not in delivered]
+        if failed:
+            retries = self.store.release(token, failed, error, now)
+            self.retried += len(retries)
+            with self._wakeup:
+                for entry in retries:
+                    if entry[0] <= self._horizon:
+                        heapq.heappush(self._heap, entry)
+
+        return len(delivered)
+
+    def _run(self):
+        while not self._stopping:
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"❌ خطأ في إرسال التذكيرات: {e}")
+
+            with self._wakeup:
+                if self._stopping:
+                    break
+                next_due = self._heap[0][0] if self._heap else self._horizon
+                self._wakeup.wait(timeout=max(0.0, min(next_due, self._horizon) - time.time()))
+
+    def start(self):
+        """تشغيل العامل في الخلفية (مرة واحدة)"""
+        if self._thread is not None:
+            return
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="reminder-worker", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5):
+        with self._wakeup:
+            self._stopping = True
+            self._wakeup.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def stats(self):
+        with self._wakeup:
+            loaded = len(self._heap)
+            next_due = self._heap[0][0] if self._heap else None
+        return {
+            "notifier": self.notifier.name,
+            "loaded": loaded,
+            "next_due": datetime.fromtimestamp(next_due).isoformat() if next_due else None,
+            "sent": self.sent,
+            "retried": self.retried,
+            "recovered": self.recovered,
+            "batches": self.batches,
+            "stored": self.store.counts()
+        }
+
+# ==========================
+# 🗂️ المجدول المشترك
+# ==========================
+_shared_scheduler = None
+_shared_lock = threading.Lock()
+
+def get_reminder_scheduler():
+    """المجدول المشترك (المخزن يُفتح عند أول استخدام)"""
+    global _shared_scheduler
+    with _shared_lock:
+        if _shared_scheduler is None:
+            _shared_scheduler = ReminderScheduler()
+    return _shared_scheduler
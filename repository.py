@@ -0,0 +1,657 @@
+"""
+مستودع المستخدمين - البحث برقم الجوال أو الهوية أو رقم الإقامة بدون المرور على كل المستخدمين
+
+يوجد تنفيذان بنفس الواجهة:
+• memory: القاموس MOCK_USERS مع فهارس ثانوية (الهوية، الإقامة)
+• sqlite: جداول للمستخدمين والمستندات والعمالة والمخالفات والمحفظة مع فهارس،
+  فالبحث O(log n) حتى مع ملايين المواطنين
+"""
+
+import os
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from config import USER_REPOSITORY, USERS_DB_PATH, USERS_IDENTITY_MAP_SIZE
+from transactions import TransactionError, StaleUserError, InsufficientFundsError
+
+# المستندات الشخصية (الهوية، الجواز، الرخصة) - الإقامات في جدول العمالة
+PERSONAL_DOCUMENT_TYPES = ("national_id", "passport", "drivers_license")
+
+# حقول قيد سجل المحفظة
+LEDGER_FIELDS = ("reference_number", "idempotency_key", "phone", "doc_type", "doc_number", "description",
+                 "method", "amount", "balance_after", "old_expiry", "new_expiry", "created_at", "items")
+
+def renewal_record(user, doc_type, doc_number):
+    """
+    المستند أو العامل المطلوب تجديده داخل قاموس المستخدم
+
+    Returns:
+        (record, اسم حقل تاريخ الانتهاء) أو (None, None)
+    """
+    if doc_type == "iqama":
+        for worker in user.get("workers", []):
+            if worker["iqama_number"] == doc_number:
+                return worker, "iqama_expiry"
+        return None, None
+
+    doc = user.get("documents", {}).get(doc_type)
+    if doc is None or doc["number"] != doc_number:
+        return None, None
+    return doc, "expiry_date"
+
+def _renewal_records(user, renewals):
+    """
+    المستندات المطلوبة كلها أو لا شيء
+
+    Returns:
+        [(record, اسم حقل تاريخ الانتهاء, new_expiry, status), ...]
+    """
+    records = []
+    for doc_type, doc_number, new_expiry, status in renewals:
+        record, expiry_field = renewal_record(user, doc_type, doc_number)
+        if record is None:
+            raise TransactionError(f"المستند غير موجود: {doc_number}")
+        records.append((record, expiry_field, new_expiry, status))
+    return records
+
+def _apply_to_user(user, records, balance):
+    """نفس التعديل على قاموس المستخدم المحمّل (بعد نجاحه في المخزن)"""
+    for record, expiry_field, new_expiry, status in records:
+        record[expiry_field] = new_expiry
+        record["status"] = status
+    user["family_wallet"]["balance"] = balance
+    user["version"] = user.get("version", 0) + 1
+
+# ==========================
+# 🧩 الواجهة المشتركة
+# ==========================
+class UserRepository:
+    """
+    واجهة مستودع المستخدمين
+
+    المستخدم يُرجع كقاموس بنفس شكل MOCK_USERS، وأي تعديل عليه
+    (تجديد، خصم من المحفظة) يتم عبر apply_renewals كعملية واحدة مع قيد في سجل المحفظة.
+    """
+
+    name = "base"
+
+    def get_by_phone(self, phone):
+        """المستخدم برقم الجوال (بعد التنظيف) أو None"""
+        raise NotImplementedError
+
+    def get_by_national_id(self, national_id):
+        """المستخدم برقم الهوية أو None"""
+        raise NotImplementedError
+
+    def find_worker(self, iqama_number):
+        """
+        صاحب العمل والعامل برقم الإقامة
+
+        Returns:
+            (user, worker) أو (None, None)
+        """
+        raise NotImplementedError
+
+    def expiring_candidates(self, user, until):
+        """
+        مستندات المستخدم التي تنتهي في تاريخ <= until
+
+        Args:
+            until: آخر تاريخ (YYYY-MM-DD)
+
+        Returns:
+            ([(doc_type, doc), ...], [worker, ...]) - نفس القواميس الموجودة داخل user
+        """
+        raise NotImplementedError
+
+    def apply_renewals(self, user, renewals, debit, entry):
+        """
+        تجديد مستند أو أكثر كعملية واحدة: تواريخ الانتهاء + خصم واحد من المحفظة + قيد واحد في السجل
+        + زيادة النسخة. إما أن تنجح كلها أو لا يتغير شيء.
+
+        Args:
+            user: المستخدم كما حُمّل (نسخته هي المتوقعة في المخزن)
+            renewals: [(doc_type, doc_number, new_expiry, status), ...]
+            debit: المبلغ المخصوم من المحفظة (0 للدفع بمدى)
+            entry: قيد السجل (LEDGER_FIELDS، و items قائمة لتجديد أكثر من مستند) - يُكمل فيه balance_after
+
+        Raises:
+            StaleUserError: المستخدم تغير منذ تحميله
+            InsufficientFundsError: الرصيد لا يكفي وقت الخصم
+            TransactionError: المستند غير موجود أو المفتاح مستخدم من قبل
+        """
+        raise NotImplementedError
+
+    def find_ledger_entry(self, idempotency_key):
+        """قيد السجل لمفتاح منع التكرار (عملية نُفذت من قبل) أو None"""
+        raise NotImplementedError
+
+    def ledger(self, phone=None):
+        """قيود سجل المحفظة بالترتيب (لمستخدم واحد أو للكل)"""
+        raise NotImplementedError
+
+    def iter_expiry_dates(self):
+        """
+        كل المستندات والإقامات في كل المستخدمين بدون تحميل المستخدمين
+
+        Yields:
+            (phone, doc_type, number, expiry_date, renewal_fee, worker_name)
+            doc_type = "iqama" للعمالة، و worker_name = None للمستندات الشخصية
+        """
+        raise NotImplementedError
+
+    def __len__(self):
+        raise NotImplementedError
+
+    def stats(self):
+        return {"backend": self.name, "users": len(self)}
+
+# ==========================
+# 💾 داخل العملية
+# ==========================
+class DictUserRepository(UserRepository):
+    """
+    القاموس الحالي (رقم الجوال -> المستخدم) مع فهارس للهوية ورقم الإقامة
+
+    التعديلات تتم على نفس القواميس، والسجل قائمة في الذاكرة.
+    التسلسل لكل مستخدم مسؤولية المستدعي (transactions.run_once).
+    """
+
+    name = "memory"
+
+    def __init__(self, users):
+        """
+        Args:
+            users: قاموس رقم الجوال -> بيانات المستخدم (يُستخدم كما هو بدون نسخ)
+        """
+        self._users = users
+        self._by_national_id = {}
+        self._by_iqama = {}
+        self._ledger = []
+        self._ledger_keys = {}
+        self._ledger_lock = threading.Lock()
+
+        for user in users.values():
+            self._index(user)
+
+    def _index(self, user):
+        self._by_national_id[user["national_id"]] = user
+        for worker in user.get("workers", []):
+            self._by_iqama[worker["iqama_number"]] = (user, worker)
+
+    def add(self, user):
+        """إضافة مستخدم جديد وفهرسته"""
+        self._users[user["phone"]] = user
+        self._index(user)
+
+    def get_by_phone(self, phone):
+        return self._users.get(phone)
+
+    def get_by_national_id(self, national_id):
+        return self._by_national_id.get(national_id)
+
+    def find_worker(self, iqama_number):
+        return self._by_iqama.get(iqama_number, (None, None))
+
+    def expiring_candidates(self, user, until):
+        documents = [
+            (doc_type, doc) for doc_type, doc in user.get("documents", {}).items()
+            if doc["expiry_date"] <= until
+        ]
+        workers = [worker for worker in user.get("workers", []) if worker["iqama_expiry"] <= until]
+        return documents, workers
+
+    def apply_renewals(self, user, renewals, debit, entry):
+        records = _renewal_records(user, renewals)
+
+        balance = user["family_wallet"]["balance"]
+        if debit and balance < debit:
+            raise InsufficientFundsError(balance)
+
+        with self._ledger_lock:
+            key = entry.get("idempotency_key")
+            if key and key in self._ledger_keys:
+                raise TransactionError(f"العملية منفذة من قبل: {key}")
+            entry["balance_after"] = balance - debit if entry["method"] == "wallet" else None
+            _apply_to_user(user, records, balance - debit)
+            self._ledger.append(dict(entry))
+            if key:
+                self._ledger_keys[key] = self._ledger[-1]
+
+    def find_ledger_entry(self, idempotency_key):
+        with self._ledger_lock:
+            entry = self._ledger_keys.get(idempotency_key)
+            return dict(entry) if entry else None
+
+    def ledger(self, phone=None):
+        with self._ledger_lock:
+            return [dict(entry) for entry in self._ledger if phone is None or entry["phone"] == phone]
+
+    def iter_expiry_dates(self):
+        for phone, user in self._users.items():
+            for doc_type, doc in user.get("documents", {}).items():
+                yield phone, doc_type, doc["number"], doc["expiry_date"], doc.get("renewal_fee", 0), None
+            for worker in user.get("workers", []):
+                yield (phone, "iqama", worker["iqama_number"], worker["iqama_expiry"],
+                       worker.get("renewal_fee", 650), worker["name"])
+
+    def __len__(self):
+        return len(self._users)
+
+# ==========================
+# 🗄️ SQLite
+# ==========================
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY,
+    phone TEXT NOT NULL UNIQUE,
+    national_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    nickname TEXT,
+    version INTEGER NOT NULL DEFAULT 0,
+    extra TEXT NOT NULL DEFAULT '{}'
+);
+CREATE UNIQUE INDEX IF NOT EXISTS users_national_id ON users (national_id);
+
+CREATE TABLE IF NOT EXISTS documents (
+    user_id INTEGER NOT NULL REFERENCES users (id),
+    doc_type TEXT NOT NULL,
+    number TEXT NOT NULL,
+    issue_date TEXT,
+    expiry_date TEXT NOT NULL,
+    status TEXT,
+    renewal_fee REAL,
+    PRIMARY KEY (user_id, doc_type)
+);
+CREATE INDEX IF NOT EXISTS documents_expiry ON documents (expiry_date);
+CREATE INDEX IF NOT EXISTS documents_user_expiry ON documents (user_id, expiry_date);
+
+CREATE TABLE IF NOT EXISTS workers (
+    iqama_number TEXT PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users (id),
+    position INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    nationality TEXT,
+    profession TEXT,
+    iqama_issue_date TEXT,
+    iqama_expiry TEXT NOT NULL,
+    status TEXT,
+    renewal_fee REAL
+);
+CREATE INDEX IF NOT EXISTS workers_user ON workers (user_id, position);
+CREATE INDEX IF NOT EXISTS workers_expiry ON workers (iqama_expiry);
+CREATE INDEX IF NOT EXISTS workers_user_expiry ON workers (user_id, iqama_expiry);
+
+CREATE TABLE IF NOT EXISTS violations (
+    number TEXT PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users (id),
+    date TEXT,
+    description TEXT,
+    amount REAL,
+    status TEXT
+);
+CREATE INDEX IF NOT EXISTS violations_user ON violations (user_id);
+
+CREATE TABLE IF NOT EXISTS wallets (
+    user_id INTEGER PRIMARY KEY REFERENCES users (id),
+    balance REAL NOT NULL,
+    currency TEXT NOT NULL
+);
+
+-- سجل المحفظة: إضافة فقط (لا تعديل ولا حذف)
+CREATE TABLE IF NOT EXISTS wallet_ledger (
+    entry_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    reference_number TEXT NOT NULL UNIQUE,
+    idempotency_key TEXT UNIQUE,
+    phone TEXT NOT NULL,
+    doc_type TEXT,
+    doc_number TEXT,
+    description TEXT,
+    method TEXT NOT NULL,
+    amount REAL NOT NULL,
+    balance_after REAL,
+    old_expiry TEXT,
+    new_expiry TEXT,
+    created_at TEXT NOT NULL,
+    items TEXT  -- JSON: مستندات التجديد الجماعي (قيد واحد وخصم واحد)
+);
+CREATE INDEX IF NOT EXISTS wallet_ledger_phone ON wallet_ledger (phone, entry_id);
+CREATE TRIGGER IF NOT EXISTS wallet_ledger_no_update BEFORE UPDATE ON wallet_ledger
+BEGIN SELECT RAISE(ABORT, 'wallet_ledger is append-only'); END;
+CREATE TRIGGER IF NOT EXISTS wallet_ledger_no_delete BEFORE DELETE ON wallet_ledger
+BEGIN SELECT RAISE(ABORT, 'wallet_ledger is append-only'); END;
+"""
+
+# حقول المستخدم التي لها جداول أو أعمدة خاصة - الباقي (الأبناء، الإشعارات...) يُحفظ كـ JSON
+_USER_COLUMNS = {"phone", "national_id", "name", "nickname", "version", "documents", "workers",
+                 "traffic_violations", "family_wallet"}
+
+_WORKER_FIELDS = ("iqama_number", "name", "nationality", "profession", "iqama_issue_date",
+                  "iqama_expiry", "status", "renewal_fee")
+
+class SQLiteUserRepository(UserRepository):
+    """
+    مستودع المستخدمين في ملف SQLite بوضع WAL
+
+    • كل بحث عبر فهرس (الجوال، الهوية، رقم الإقامة، تاريخ الانتهاء)
+    • المستخدمون المحمّلون يُحفظون في خريطة هوية (LRU) فيرجع نفس القاموس لكل
+      الأجزاء داخل العملية، ويُعاد تحميله إذا تغيرت نسخته في القاعدة (عملية أخرى جددت مثلاً)
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path=USERS_DB_PATH, identity_map_size=USERS_IDENTITY_MAP_SIZE):
+        """
+        Args:
+            path: مسار ملف قاعدة البيانات
+            identity_map_size: عدد المستخدمين المحمّلين المحفوظين في الذاكرة
+        """
+        self.path = path
+        self.identity_map_size = identity_map_size
+
+        self._local = threading.local()
+        self._loaded = OrderedDict()  # phone -> user
+        self._loaded_lock = threading.Lock()
+
+        self.loads = 0
+        self.reuses = 0
+
+        self._connection().executescript(SQLITE_SCHEMA)
+
+    def _connection(self):
+        """اتصال خاص بالخيط الحالي (ويُعاد إنشاؤه بعد fork)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        else:
+            conn.execute("COMMIT")
+
+    # ---------- الاستيراد ----------
+    def import_users(self, users):
+        """
+        إضافة مستخدمين بشكل MOCK_USERS (يتجاهل الموجود مسبقاً بنفس رقم الجوال)
+
+        Returns:
+            عدد المستخدمين المضافين
+        """
+        added = 0
+        with self._transaction() as conn:
+            for user in users:
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO users (phone, national_id, name, nickname, version, extra) VALUES (?, ?, ?, ?, ?, ?)",
+                    (user["phone"], user["national_id"], user["name"], user.get("nickname"), user.get("version", 0),
+                     json.dumps({key: value for key, value in user.items() if key not in _USER_COLUMNS}, ensure_ascii=False))
+                )
+                if not cursor.rowcount:
+                    continue
+                user_id = cursor.lastrowid
+                added += 1
+
+                conn.executemany(
+                    "INSERT INTO documents (user_id, doc_type, number, issue_date, expiry_date, status, renewal_fee) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [(user_id, doc_type, doc["number"], doc.get("issue_date"), doc["expiry_date"], doc.get("status"),
+                      doc.get("renewal_fee")) for doc_type, doc in user.get("documents", {}).items()]
+                )
+                conn.executemany(
+                    "INSERT INTO workers (user_id, position, iqama_number, name, nationality, profession, "
+                    "iqama_issue_date, iqama_expiry, status, renewal_fee) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    [(user_id, position, *(worker.get(field) for field in _WORKER_FIELDS))
+                     for position, worker in enumerate(user.get("workers", []))]
+                )
+                conn.executemany(
+                    "INSERT INTO violations (user_id, number, date, description, amount, status) VALUES (?, ?, ?, ?, ?, ?)",
+                    [(user_id, violation["number"], violation.get("date"), violation.get("description"),
+                      violation.get("amount"), violation.get("status")) for violation in user.get("traffic_violations", [])]
+                )
+                wallet = user.get("family_wallet", {})
+                conn.execute(
+                    "INSERT INTO wallets (user_id, balance, currency) VALUES (?, ?, ?)",
+                    (user_id, wallet.get("balance", 0), wallet.get("currency", "ريال"))
+                )
+        return added
+
+    # ---------- التحميل ----------
+    def _load(self, conn, row):
+        """بناء قاموس المستخدم من صفه في users"""
+        user_id, phone, national_id, name, nickname, version, extra = row
+
+        user = {"phone": phone, "national_id": national_id, "name": name, "nickname": nickname}
+        user.update(json.loads(extra))
+        user["version"] = version
+
+        user["family_wallet"] = dict(zip(
+            ("balance", "currency"),
+            conn.execute("SELECT balance, currency FROM wallets WHERE user_id = ?", (user_id,)).fetchone() or (0, "ريال")
+        ))
+        user["documents"] = {
+            doc_type: {"number": number, "issue_date": issue_date, "expiry_date": expiry_date,
+                       "status": status, "renewal_fee": renewal_fee}
+            for doc_type, number, issue_date, expiry_date, status, renewal_fee in conn.execute(
+                "SELECT doc_type, number, issue_date, expiry_date, status, renewal_fee FROM documents WHERE user_id = ?",
+                (user_id,)
+            )
+        }
+        user["workers"] = [
+            dict(zip(_WORKER_FIELDS, worker)) for worker in conn.execute(
+                f"SELECT {', '.join(_WORKER_FIELDS)} FROM workers WHERE user_id = ? ORDER BY position", (user_id,)
+            )
+        ]
+        user["traffic_violations"] = [
+            {"number": number, "date": date, "description": description, "amount": amount, "status": status}
+            for number, date, description, amount, status in conn.execute(
+                "SELECT number, date, description, amount, status FROM violations WHERE user_id = ?", (user_id,)
+            )
+        ]
+
+        self.loads += 1
+        return user
+
+    def _get(self, where, value):
+        """
+        المستخدم من خريطة الهوية إذا كانت نسخته هي نفسها في القاعدة، وإلا يُحمّل من جديد
+        """
+        conn = self._connection()
+        row = conn.execute(
+            f"SELECT id, phone, national_id, name, nickname, version, extra FROM users WHERE {where} = ?", (value,)
+        ).fetchone()
+        if row is None:
+            return None
+
+        phone, version = row[1], row[5]
+        with self._loaded_lock:
+            user = self._loaded.get(phone)
+            if user is not None and user.get("version", 0) == version:
+                self._loaded.move_to_end(phone)
+                self.reuses += 1
+                return user
+
+        user = self._load(conn, row)
+
+        with self._loaded_lock:
+            self._loaded[phone] = user
+            self._loaded.move_to_end(phone)
+            while len(self._loaded) > self.identity_map_size:
+                self._loaded.popitem(last=False)
+
+        return user
+
+    def get_by_phone(self, phone):
+        return self._get("phone", phone)
+
+    def get_by_national_id(self, national_id):
+        return self._get("national_id", national_id)
+
+    def find_worker(self, iqama_number):
+        row = self._connection().execute(
+            "SELECT users.phone FROM workers JOIN users ON users.id = workers.user_id WHERE workers.iqama_number = ?",
+            (iqama_number,)
+        ).fetchone()
+        if row is None:
+            return None, None
+
+        user = self.get_by_phone(row[0])
+        for worker in user.get("workers", []):
+            if worker["iqama_number"] == iqama_number:
+                return user, worker
+        return None, None
+
+    def expiring_candidates(self, user, until):
+        conn = self._connection()
+        documents = user.get("documents", {})
+        workers = {worker["iqama_number"]: worker for worker in user.get("workers", [])}
+
+        expiring_types = {
+            doc_type for (doc_type,) in conn.execute(
+                "SELECT doc_type FROM documents WHERE user_id = (SELECT id FROM users WHERE phone = ?) "
+                "AND expiry_date <= ?", (user["phone"], until)
+            )
+        }
+        expiring_documents = [(doc_type, doc) for doc_type, doc in documents.items() if doc_type in expiring_types]
+        expiring_workers = [
+            workers[iqama_number] for (iqama_number,) in conn.execute(
+                "SELECT iqama_number FROM workers WHERE user_id = (SELECT id FROM users WHERE phone = ?) "
+                "AND iqama_expiry <= ? ORDER BY position", (user["phone"], until)
+            ) if iqama_number in workers
+        ]
+        return expiring_documents, expiring_workers
+
+    def apply_renewals(self, user, renewals, debit, entry):
+        records = _renewal_records(user, renewals)
+
+        expected_version = user.get("version", 0)
+        try:
+            with self._transaction() as conn:
+                # فحص النسخة: إذا عدّلت عملية أخرى المستخدم بعد تحميله لا نكتب فوق تعديلها
+                row = conn.execute(
+                    "SELECT id FROM users WHERE phone = ? AND version = ?", (user["phone"], expected_version)
+                ).fetchone()
+                if row is None:
+                    raise StaleUserError(user["phone"])
+                user_id = row[0]
+
+                # الخصم مشروط بالرصيد في نفس الجملة (لا يصبح سالباً مهما تداخلت العمليات)
+                if debit and not conn.execute(
+                    "UPDATE wallets SET balance = balance - ? WHERE user_id = ? AND balance >= ?",
+                    (debit, user_id, debit)
+                ).rowcount:
+                    raise InsufficientFundsError(
+                        conn.execute("SELECT balance FROM wallets WHERE user_id = ?", (user_id,)).fetchone()[0]
+                    )
+                balance = conn.execute("SELECT balance FROM wallets WHERE user_id = ?", (user_id,)).fetchone()[0]
+
+                for doc_type, doc_number, new_expiry, status in renewals:
+                    if doc_type == "iqama":
+                        conn.execute(
+                            "UPDATE workers SET iqama_expiry = ?, status = ? WHERE iqama_number = ? AND user_id = ?",
+                            (new_expiry, status, doc_number, user_id)
+                        )
+                    else:
+                        conn.execute(
+                            "UPDATE documents SET expiry_date = ?, status = ? WHERE user_id = ? AND doc_type = ?",
+                            (new_expiry, status, user_id, doc_type)
+                        )
+                conn.execute("UPDATE users SET version = version + 1 WHERE id = ?", (user_id,))
+
+                entry["balance_after"] = balance if entry["method"] == "wallet" else None
+                conn.execute(
+                    f"INSERT INTO wallet_ledger ({', '.join(LEDGER_FIELDS)}) VALUES ({', '.join('?' * len(LEDGER_FIELDS))})",
+                    tuple(_ledger_value(entry, field) for field in LEDGER_FIELDS)
+                )
+        except sqlite3.IntegrityError as e:
+            raise TransactionError(f"قيد مكرر في السجل: {e}") from e
+
+        _apply_to_user(user, records, balance)
+
+    def find_ledger_entry(self, idempotency_key):
+        row = self._connection().execute(
+            f"SELECT {', '.join(LEDGER_FIELDS)} FROM wallet_ledger WHERE idempotency_key = ?", (idempotency_key,)
+        ).fetchone()
+        return _ledger_entry(row) if row else None
+
+    def ledger(self, phone=None):
+        query = f"SELECT {', '.join(LEDGER_FIELDS)} FROM wallet_ledger"
+        if phone is None:
+            rows = self._connection().execute(f"{query} ORDER BY entry_id")
+        else:
+            rows = self._connection().execute(f"{query} WHERE phone = ? ORDER BY entry_id", (phone,))
+        return [_ledger_entry(row) for row in rows]
+
+    def iter_expiry_dates(self):
+        # اتصال مستقل حتى لا يتعارض المرور الطويل مع استعلامات الخيط نفسه
+        conn = sqlite3.connect(self.path)
+        try:
+            # نفس ترتيب المستندات داخل قاموس المستخدم (نوع المستند، ثم العمالة بترتيبهم)
+            yield from conn.execute(
+                "SELECT users.phone, documents.doc_type, documents.number, documents.expiry_date, "
+                "documents.renewal_fee, NULL "
+                "FROM documents JOIN users ON users.id = documents.user_id ORDER BY documents.user_id, documents.doc_type"
+            )
+            yield from conn.execute(
+                "SELECT users.phone, 'iqama', workers.iqama_number, workers.iqama_expiry, workers.renewal_fee, workers.name "
+                "FROM workers JOIN users ON users.id = workers.user_id ORDER BY workers.user_id, workers.position"
+            )
+        finally:
+            conn.close()
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM users").fetchone()[0]
+
+    def stats(self):
+        stats = super().stats()
+        with self._loaded_lock:
+            stats["loaded"] = len(self._loaded)
+        stats["loads"] = self.loads
+        stats["reuses"] = self.reuses
+        return stats
+
+def _ledger_value(entry, field):
+    value = entry.get(field)
+    return json.dumps(value, ensure_ascii=False) if field == "items" and value is not None else value
+
+def _ledger_entry(row):
+    entry = dict(zip(LEDGER_FIELDS, row))
+    if entry["items"] is not None:
+        entry["items"] = json.loads(entry["items"])
+    return entry
+
+# ==========================
+# 🏭 الإنشاء
+# ==========================
+def create_user_repository(name=USER_REPOSITORY, seed_users=None):
+    """
+    إنشاء مستودع المستخدمين حسب الإعدادات
+
+    Args:
+        name: "memory" أو "sqlite"
+        seed_users: قاموس رقم الجوال -> المستخدم (MOCK_USERS) - يُستخدم مباشرة في memory
+                    ويُستورد في sqlite إذا لم يكن موجوداً
+    """
+    if name == "memory":
+        return DictUserRepository(seed_users if seed_users is not None else {})
+
+    if name == "sqlite":
+        repository = SQLiteUserRepository()
+        if seed_users:
+            repository.import_users(seed_users.values())
+        return repository
+
+    raise ValueError(f"مستودع مستخدمين غير معروف: {name}")
@@ -0,0 +1,505 @@
+"""
+مخزن الجلسات - تاريخ المحادثات وحالة كل مكالمة
+محدود الحجم (LRU) وكل جلسة تنتهي صلاحيتها بعد فترة خمول (TTL)
+
+يوجد تنفيذان بنفس الواجهة:
+• memory: داخل العملية نفسها (عامل واحد)
+• sqlite: ملف مشترك بوضع WAL، يسمح بتشغيل التطبيق بعدة عمليات
+"""
+
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+from config import (
+    MAX_CONVERSATION_HISTORY, SESSION_TTL_SECONDS, SESSION_MAX_ENTRIES, SESSION_SWEEP_INTERVAL,
+    SESSION_BACKEND, SESSION_DB_PATH, SESSION_LOCK_TIMEOUT, SESSION_LOCK_LEASE
+)
+
+# تخزين الأدوار كأرقام بدل تكرار النص في كل رسالة
+ROLE_CODES = {"user": 0, "assistant": 1, "system": 2}
+ROLE_NAMES = {code: role for role, code in ROLE_CODES.items()}
+
+def expand_messages(messages):
+    """تحويل (رمز الدور، النص) إلى رسائل OpenAI"""
+    return [{"role": ROLE_NAMES[code], "content": content} for code, content in messages]
+
+# ==========================
+# 🧩 الواجهة المشتركة
+# ==========================
+class SessionBackend:
+    """
+    واجهة مخزن الجلسات
+
+    كل جلسة فيها:
+    • history: آخر MAX_CONVERSATION_HISTORY رسالة
+    • state: قاموس JSON حر (حالة المساعد، بيانات المكالمة...)
+    """
+
+    name = "base"
+
+    def get_history(self, call_sid):
+        """تاريخ المحادثة كقائمة {"role", "content"} (ينشئ الجلسة إن لم توجد)"""
+        raise NotImplementedError
+
+    def append_turn(self, call_sid, user_message, assistant_message):
+        """إضافة سؤال ورد للجلسة"""
+        raise NotImplementedError
+
+    def get_state(self, call_sid):
+        """حالة الجلسة (قاموس، فارغ إن لم توجد)"""
+        raise NotImplementedError
+
+    def set_state(self, call_sid, state):
+        """استبدال حالة الجلسة"""
+        raise NotImplementedError
+
+    def clear(self, call_sid):
+        """حذف جلسة"""
+        raise NotImplementedError
+
+    def lock(self, call_sid):
+        """
+        قفل خاص بالمكالمة (context manager)
+        يمنع طلبين متداخلين لنفس المكالمة من إفساد التاريخ
+        """
+        raise NotImplementedError
+
+    def sweep(self):
+        """حذف الجلسات المنتهية، ويُرجع عددها"""
+        raise NotImplementedError
+
+    def stats(self):
+        """إحصائيات المخزن"""
+        raise NotImplementedError
+
+    def __len__(self):
+        raise NotImplementedError
+
+    def start_sweeper(self, interval=SESSION_SWEEP_INTERVAL):
+        """تشغيل خيط خلفي يحذف الجلسات المنتهية كل interval ثانية"""
+        if getattr(self, "_sweeper", None) is not None:
+            return
+
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.sweep()
+                except Exception as e:
+                    print(f"❌ خطأ في تنظيف الجلسات: {e}")
+
+        self._sweeper = threading.Thread(target=run, name="session-sweeper", daemon=True)
+        self._sweeper.start()
+
+class _CallLocks:
+    """أقفال لكل مكالمة داخل العملية - تُحذف عندما لا يستخدمها أحد"""
+
+    def __init__(self):
+        self._guard = threading.Lock()
+        self._locks = {}  # call_sid -> [lock, عدد المنتظرين]
+
+    @contextmanager
+    def hold(self, call_sid):
+        with self._guard:
+            entry = self._locks.setdefault(call_sid, [threading.Lock(), 0])
+            entry[1] += 1
+
+        entry[0].acquire()
+        try:
+            yield
+        finally:
+            entry[0].release()
+            with self._guard:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._locks[call_sid]
+
+# ==========================
+# 💾 داخل العملية
+# ==========================
+class _Session:
+    """جلسة واحدة - رسائل مضغوطة كـ (رمز الدور، النص)"""
+
+    __slots__ = ("messages", "state", "expires_at")
+
+    def __init__(self, expires_at):
+        self.messages = deque(maxlen=MAX_CONVERSATION_HISTORY)
+        self.state = {}
+        self.expires_at = expires_at
+
+class MemorySessionBackend(SessionBackend):
+    """
+    مخزن جلسات في الذاكرة
+
+    • الترتيب داخل OrderedDict هو ترتيب آخر استخدام، وبما أن الصلاحية
+      تتجدد مع كل استخدام فالجلسات المنتهية دائماً في أول القائمة
+    • الحذف عند امتلاء الحجم يبدأ من الأقدم استخداماً
+    """
+
+    name = "memory"
+
+    def __init__(self, ttl=SESSION_TTL_SECONDS, max_entries=SESSION_MAX_ENTRIES):
+        """
+        Args:
+            ttl: مدة الخمول بالثواني قبل حذف الجلسة
+            max_entries: الحد الأقصى لعدد الجلسات
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self._call_locks = _CallLocks()
+        self._sweeper = None
+
+        self.created = 0
+        self.expired = 0
+        self.evicted = 0
+        self.cleared = 0
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def _touch(self, call_sid, now):
+        """الحصول على الجلسة (أو إنشاؤها) وتجديد صلاحيتها - يُستدعى داخل القفل"""
+        session = self._sessions.get(call_sid)
+
+        if session is None or session.expires_at <= now:
+            if session is not None:
+                self.expired += 1
+            session = _Session(now + self.ttl)
+            self._sessions[call_sid] = session
+            self.created += 1
+
+            while len(self._sessions) > self.max_entries:
+                self._sessions.popitem(last=False)
+                self.evicted += 1
+        else:
+            session.expires_at = now + self.ttl
+
+        self._sessions.move_to_end(call_sid)
+        return session
+
+    def get_history(self, call_sid):
+        with self._lock:
+            session = self._touch(call_sid, time.monotonic())
+            return expand_messages(session.messages)
+
+    def append_turn(self, call_sid, user_message, assistant_message):
+        with self._lock:
+            session = self._touch(call_sid, time.monotonic())
+            session.messages.append((ROLE_CODES["user"], user_message))
+            session.messages.append((ROLE_CODES["assistant"], assistant_message))
+
+    def get_state(self, call_sid):
+        with self._lock:
+            return dict(self._touch(call_sid, time.monotonic()).state)
+
+    def set_state(self, call_sid, state):
+        with self._lock:
+            self._touch(call_sid, time.monotonic()).state = dict(state)
+
+    def clear(self, call_sid):
+        with self._lock:
+            if self._sessions.pop(call_sid, None) is not None:
+                self.cleared += 1
+
+    def lock(self, call_sid):
+        return self._call_locks.hold(call_sid)
+
+    def sweep(self):
+        now = time.monotonic()
+        removed = 0
+
+        with self._lock:
+            while self._sessions:
+                call_sid, session = next(iter(self._sessions.items()))
+                if session.expires_at > now:
+                    break
+                del self._sessions[call_sid]
+                removed += 1
+            self.expired += removed
+
+        return removed
+
+    def stats(self):
+        with self._lock:
+            return {
+                "backend": self.name,
+                "size": len(self._sessions),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "created": self.created,
+                "expired": self.expired,
+                "evicted": self.evicted,
+                "cleared": self.cleared
+            }
+
+# ==========================
+# 🗄️ مشترك بين العمليات (SQLite)
+# ==========================
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    call_sid   TEXT PRIMARY KEY,
+    history    TEXT NOT NULL DEFAULT '[]',
+    state      TEXT NOT NULL DEFAULT '{}',
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions (expires_at);
+
+CREATE TABLE IF NOT EXISTS call_locks (
+    call_sid   TEXT PRIMARY KEY,
+    owner      TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+"""
+
+class SQLiteSessionBackend(SessionBackend):
+    """
+    مخزن جلسات في ملف SQLite بوضع WAL
+
+    • كل عملية وكل خيط له اتصال خاص (آمن مع gunicorn --workers N)
+    • كل تعديل داخل BEGIN IMMEDIATE فلا يضيع تحديث بين عمليتين
+    • القفل لكل مكالمة عبارة عن صف في call_locks بمدة صلاحية (lease) يجددها
+      خيط خلفي ما دام القفل ممسوكاً، فإذا ماتت العملية الماسكة يتحرر تلقائياً
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path=SESSION_DB_PATH, ttl=SESSION_TTL_SECONDS, max_entries=SESSION_MAX_ENTRIES,
+                 lock_timeout=SESSION_LOCK_TIMEOUT, lock_lease=SESSION_LOCK_LEASE):
+        """
+        Args:
+            path: مسار ملف قاعدة البيانات
+            ttl: مدة الخمول بالثواني قبل حذف الجلسة
+            max_entries: الحد الأقصى لعدد الجلسات (يُطبّق عند التنظيف)
+            lock_timeout: أقصى مدة انتظار لقفل المكالمة
+            lock_lease: مدة صلاحية صف القفل، تتجدد كل ثلثها طوال مدة الإمساك
+        """
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.lock_timeout = lock_timeout
+        self.lock_lease = lock_lease
+
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self._call_locks = _CallLocks()
+        self._sweeper = None
+
+        self.expired = 0
+        self.evicted = 0
+        self.cleared = 0
+        self.lock_waits = 0
+        self.lock_lost = 0
+
+        self._connection().executescript(SQLITE_SCHEMA)
+
+    def _connection(self):
+        """اتصال خاص بالخيط الحالي (ويُعاد إنشاؤه بعد fork)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=self.lock_timeout, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        else:
+            conn.execute("COMMIT")
+
+    def _count(self, counter, amount=1):
+        """زيادة عداد إحصائيات (الخيوط تتشارك نفس الكائن)"""
+        if amount:
+            with self._stats_lock:
+                setattr(self, counter, getattr(self, counter) + amount)
+
+    def _touch(self, conn, call_sid, now):
+        """
+        الحصول على الجلسة (أو إنشاؤها) وتجديد صلاحيتها - داخل معاملة
+
+        Returns:
+            (history, state) بعد فك JSON
+        """
+        row = conn.execute(
+            "SELECT history, state, expires_at FROM sessions WHERE call_sid = ?", (call_sid,)
+        ).fetchone()
+
+        if row is None or row[2] <= now:
+            if row is not None:
+                self._count("expired")
+            conn.execute(
+                "INSERT OR REPLACE INTO sessions (call_sid, history, state, expires_at) VALUES (?, '[]', '{}', ?)",
+                (call_sid, now + self.ttl)
+            )
+            return [], {}
+
+        conn.execute("UPDATE sessions SET expires_at = ? WHERE call_sid = ?", (now + self.ttl, call_sid))
+        return json.loads(row[0]), json.loads(row[1])
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def get_history(self, call_sid):
+        with self._transaction() as conn:
+            history, _ = self._touch(conn, call_sid, time.time())
+        return expand_messages(history)
+
+    def append_turn(self, call_sid, user_message, assistant_message):
+        with self._transaction() as conn:
+            history, _ = self._touch(conn, call_sid, time.time())
+            history.append((ROLE_CODES["user"], user_message))
+            history.append((ROLE_CODES["assistant"], assistant_message))
+            history = history[-MAX_CONVERSATION_HISTORY:]
+            conn.execute(
+                "UPDATE sessions SET history = ? WHERE call_sid = ?",
+                (json.dumps(history, ensure_ascii=False, separators=(",", ":")), call_sid)
+            )
+
+    def get_state(self, call_sid):
+        with self._transaction() as conn:
+            _, state = self._touch(conn, call_sid, time.time())
+        return state
+
+    def set_state(self, call_sid, state):
+        with self._transaction() as conn:
+            self._touch(conn, call_sid, time.time())
+            conn.execute(
+                "UPDATE sessions SET state = ? WHERE call_sid = ?",
+                (json.dumps(state, ensure_ascii=False, separators=(",", ":")), call_sid)
+            )
+
+    def clear(self, call_sid):
+        with self._transaction() as conn:
+            if conn.execute("DELETE FROM sessions WHERE call_sid = ?", (call_sid,)).rowcount:
+                self._count("cleared")
+
+    @contextmanager
+    def lock(self, call_sid):
+        # الخيوط داخل نفس العملية تنتظر على قفل عادي بدل ضرب قاعدة البيانات
+        with self._call_locks.hold(call_sid):
+            owner = uuid.uuid4().hex
+            self._acquire_row_lock(call_sid, owner)
+            stop = threading.Event()
+            heartbeat = threading.Thread(
+                target=self._renew_row_lock, args=(call_sid, owner, stop), name="session-lock-lease", daemon=True
+            )
+            heartbeat.start()
+            try:
+                yield
+            finally:
+                stop.set()
+                heartbeat.join()
+                with self._transaction() as conn:
+                    conn.execute("DELETE FROM call_locks WHERE call_sid = ? AND owner = ?", (call_sid, owner))
+
+    def _acquire_row_lock(self, call_sid, owner):
+        """محاولة حجز صف القفل مع انتظار متزايد حتى lock_timeout"""
+        deadline = time.time() + self.lock_timeout
+        delay = 0.005
+
+        while True:
+            now = time.time()
+            with self._transaction() as conn:
+                conn.execute("DELETE FROM call_locks WHERE call_sid = ? AND expires_at <= ?", (call_sid, now))
+                acquired = conn.execute(
+                    "INSERT OR IGNORE INTO call_locks (call_sid, owner, expires_at) VALUES (?, ?, ?)",
+                    (call_sid, owner, now + self.lock_lease)
+                ).rowcount
+            if acquired:
+                return
+
+            self._count("lock_waits")
+            if now >= deadline:
+                raise TimeoutError(f"قفل المكالمة {call_sid} مشغول")
+            time.sleep(delay)
+            delay = min(delay * 2, 0.1)
+
+    def _renew_row_lock(self, call_sid, owner, stop):
+        """تجديد صلاحية صف القفل كل ثلث lock_lease حتى يُطلب التوقف"""
+        while not stop.wait(self.lock_lease / 3):
+            try:
+                with self._transaction() as conn:
+                    renewed = conn.execute(
+                        "UPDATE call_locks SET expires_at = ? WHERE call_sid = ? AND owner = ?",
+                        (time.time() + self.lock_lease, call_sid, owner)
+                    ).rowcount
+            except sqlite3.Error as e:
+                print(f"❌ خطأ في تجديد قفل المكالمة {call_sid}: {e}")
+                continue
+            if not renewed:
+                # انتهت الصلاحية قبل التجديد وأخذه غيرنا - لا فائدة من الاستمرار
+                self._count("lock_lost")
+                print(f"⚠️ فقدنا قفل المكالمة {call_sid} قبل انتهاء الدور")
+                return
+
+    def sweep(self):
+        now = time.time()
+        with self._transaction() as conn:
+            expired = conn.execute("DELETE FROM sessions WHERE expires_at <= ?", (now,)).rowcount
+            conn.execute("DELETE FROM call_locks WHERE expires_at <= ?", (now,))
+
+            # تطبيق الحد الأقصى: حذف الأقرب انتهاءً = الأقدم استخداماً
+            size = conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+            evicted = 0
+            if size > self.max_entries:
+                evicted = conn.execute(
+                    "DELETE FROM sessions WHERE call_sid IN "
+                    "(SELECT call_sid FROM sessions ORDER BY expires_at LIMIT ?)",
+                    (size - self.max_entries,)
+                ).rowcount
+
+        self._count("expired", expired)
+        self._count("evicted", evicted)
+        return expired + evicted
+
+    def stats(self):
+        size = len(self)
+        with self._stats_lock:
+            return {
+                "backend": self.name,
+                "size": size,
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "expired": self.expired,
+                "evicted": self.evicted,
+                "cleared": self.cleared,
+                "lock_waits": self.lock_waits,
+                "lock_lost": self.lock_lost,
+                "pid": os.getpid()
+            }
+
+# ==========================
+# 🏭 اختيار المخزن
+# ==========================
+SESSION_BACKENDS = {
+    "memory": MemorySessionBackend,
+    "sqlite": SQLiteSessionBackend
+}
+
+def create_session_backend(name=SESSION_BACKEND):
+    """
+    إنشاء مخزن الجلسات حسب الإعدادات
+
+    Args:
+        name: "memory" (عملية واحدة) أو "sqlite" (عدة عمليات)
+    """
+    if name not in SESSION_BACKENDS:
+        raise ValueError(f"مخزن جلسات غير معروف: {name}")
+    return SESSION_BACKENDS[name]()
@@ -0,0 +1,335 @@
+"""
+طبقة العمليات المالية - التجديد والخصم من المحفظة بأمان تحت التزامن
+
+• قفل لكل مستخدم: طلبان متداخلان لنفس المستخدم (webhook مكرر، مكالمتان) ينفذان بالترتيب،
+  ومستخدمون مختلفون لا ينتظرون بعض
+• أرقام مرجعية فريدة: الوقت + رقم العملية + تسلسل (لا تتكرر في نفس الثانية)
+• مفاتيح منع التكرار من رقم المكالمة والدور: إعادة إرسال Twilio ترجع نفس النتيجة بدون خصم ثاني
+• سجل المحفظة (append-only) وفحص النسخة في المستودع نفسه (repository.apply_renewals)
+
+التجربة تحت الضغط:
+    python transactions.py
+"""
+
+import os
+import time
+import socket
+import threading
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from config import TRANSACTION_IDEMPOTENCY_TTL, TRANSACTION_IDEMPOTENCY_MAX_ENTRIES
+
+class TransactionError(Exception):
+    """فشل عملية في المستودع (تُلغى بالكامل)"""
+
+class StaleUserError(TransactionError):
+    """نسخة المستخدم تغيرت منذ تحميله (عملية أخرى عدّلته) - يُعاد التحميل والمحاولة"""
+
+class InsufficientFundsError(TransactionError):
+    """رصيد المحفظة لا يكفي وقت الخصم"""
+
+    def __init__(self, balance):
+        super().__init__(f"رصيد غير كافي: {balance}")
+        self.balance = balance
+
+# ==========================
+# 🔒 قفل لكل مستخدم
+# ==========================
+class UserLocks:
+    """
+    أقفال لكل مستخدم (رقم الجوال) داخل العملية - تُحذف عندما لا يستخدمها أحد
+
+    بين العمليات المختلفة يحمي فحص النسخة في المستودع بدل القفل.
+    """
+
+    def __init__(self):
+        self._guard = threading.Lock()
+        self._locks = {}  # phone -> [lock, عدد المنتظرين]
+
+        self.acquired = 0
+        self.contended = 0  # مرات انتظر فيها طلب طلباً آخر لنفس المستخدم
+
+    @contextmanager
+    def hold(self, phone):
+        with self._guard:
+            entry = self._locks.setdefault(phone, [threading.Lock(), 0])
+            entry[1] += 1
+
+        if not entry[0].acquire(blocking=False):
+            with self._guard:
+                self.contended += 1
+            entry[0].acquire()
+        try:
+            with self._guard:
+                self.acquired += 1
+            yield
+        finally:
+            entry[0].release()
+            with self._guard:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._locks[phone]
+
+    def stats(self):
+        with self._guard:
+            return {"held": len(self._locks), "acquired": self.acquired, "contended": self.contended}
+
+# ==========================
+# 🔢 الأرقام المرجعية
+# ==========================
+_REFERENCE_EPOCH = 1704067200  # 2024-01-01
+
+class ReferenceGenerator:
+    """
+    أرقام مرجعية فريدة بدون تنسيق مع أحد
+
+    الرقم = (ثواني منذ 2024 << 24) | (رقم العقدة 10 بت << 14) | (تسلسل 14 بت)
+    • نفس العملية: التسلسل يمنع التكرار داخل نفس الثانية (16384 رقم)، وينتظر الثانية التالية بعدها
+    • عمليات مختلفة: رقم العقدة من اسم الجهاز ورقم العملية
+    والسجل يرفض أي رقم مكرر (UNIQUE) كضمان أخير. حوالي 16 رقم فقط لأنه يُنطق للمتصل.
+    """
+
+    def __init__(self, node_id=None):
+        if node_id is None:
+            node_id = zlib.crc32(f"{socket.gethostname()}:{os.getpid()}".encode())
+        self.node_id = node_id & 0x3FF
+        self._pid = os.getpid()
+        self._last_second = 0
+        self._sequence = 0
+        self._lock = threading.Lock()
+
+    def next(self):
+        with self._lock:
+            if self._pid != os.getpid():  # بعد fork: عقدة جديدة
+                self.__init__()
+            second = int(time.time()) - _REFERENCE_EPOCH
+            if second <= self._last_second:
+                second = self._last_second
+                self._sequence = (self._sequence + 1) & 0x3FFF
+                if self._sequence == 0:
+                    while second <= self._last_second:
+                        time.sleep(0.001)
+                        second = int(time.time()) - _REFERENCE_EPOCH
+            else:
+                self._sequence = 0
+            self._last_second = second
+            return f"REF{(second << 24) | (self.node_id << 14) | self._sequence}"
+
+_references = ReferenceGenerator()
+
+def new_reference_number():
+    """رقم مرجعي فريد للعملية (REF + أرقام فقط، سهل النطق رقماً رقماً)"""
+    return _references.next()
+
+# ==========================
+# 🔁 منع التكرار
+# ==========================
+def idempotency_key(call_sid, turn, *parts):
+    """
+    مفتاح العملية من رقم المكالمة ورقم الدور (وأي تفاصيل إضافية مثل رقم المستند)
+
+    إعادة Twilio لنفس الطلب تحمل نفس CallSid وتُقرأ بنفس رقم الدور، فتحصل على نفس المفتاح.
+    """
+    if not call_sid:
+        return None
+    return ":".join(str(part) for part in (call_sid, turn, *parts))
+
+class IdempotencyCache:
+    """
+    نتائج العمليات الناجحة حسب مفتاحها (LRU + TTL) داخل العملية
+
+    بين العمليات يكفي السجل في المستودع (idempotency_key UNIQUE).
+    """
+
+    def __init__(self, ttl=TRANSACTION_IDEMPOTENCY_TTL, max_entries=TRANSACTION_IDEMPOTENCY_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._results = OrderedDict()  # key -> (expires_at, result)
+        self._lock = threading.Lock()
+
+        self.replays = 0
+
+    def get(self, key):
+        if not key:
+            return None
+        with self._lock:
+            entry = self._results.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._results[key]
+                return None
+            self._results.move_to_end(key)
+            self.replays += 1
+            return dict(entry[1])
+
+    def put(self, key, result):
+        if not key:
+            return
+        with self._lock:
+            self._results[key] = (time.monotonic() + self.ttl, dict(result))
+            self._results.move_to_end(key)
+            while len(self._results) > self.max_entries:
+                self._results.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._results), "replays": self.replays}
+
+user_locks = UserLocks()
+idempotency_cache = IdempotencyCache()
+
+def run_once(phone, key, operation, find_applied=None):
+    """
+    تنفيذ عملية مالية مرة واحدة فقط لكل مفتاح، تحت قفل المستخدم
+
+    Args:
+        phone: رقم جوال المستخدم (القفل)
+        key: مفتاح منع التكرار (None = بدون حماية من التكرار)
+        operation: دالة بدون معاملات ترجع نتيجة فيها "success"
+        find_applied: دالة (key) ترجع نتيجة محفوظة من عملية أخرى إن وجدت (السجل الدائم)
+
+    Returns:
+        نتيجة العملية، أو النتيجة الأولى مع replayed=True إذا نُفذت من قبل
+    """
+    with user_locks.hold(phone):
+        result = idempotency_cache.get(key)
+        if result is None and key and find_applied is not None:
+            result = find_applied(key)
+            if result is not None:
+                idempotency_cache.put(key, result)
+        if result is not None:
+            result["replayed"] = True
+            return result
+
+        result = operation()
+        if result.get("success"):
+            idempotency_cache.put(key, result)
+        return result
+
+def get_transaction_stats():
+    """إحصائيات الأقفال ومنع التكرار"""
+    return {"locks": user_locks.stats(), "idempotency": idempotency_cache.stats()}
+
+# ==========================
+# 🧪 تجربة تحت الضغط
+# ==========================
+def run_stress_test(users_count=8, threads_per_user=8, renewals_per_thread=25, duplicate_every=3, io_delay=0.002,
+                    balance=50000):
+    """
+    خيوط كثيرة تجدد وتخصم من محافظ نفس المستخدمين في نفس الوقت، مع تكرار طلبات بنفس المفتاح
+
+    يتحقق من:
+    • لا رصيد سالب، والرصيد النهائي = الأولي - مجموع السجل
+    • لا خصم مكرر لنفس المفتاح، ولا رقم مرجعي مكرر
+    • مستخدمون مختلفون لا يُسلسلون: نفس العدد من العمليات لمستخدم واحد أبطأ بكثير
+    """
+    import copy
+    import random
+    from concurrent.futures import ThreadPoolExecutor
+
+    import data
+    from repository import DictUserRepository
+
+    class SlowRepository(DictUserRepository):
+        """زمن كتابة صناعي (مثل قاعدة بيانات) حتى يظهر أثر التسلسل"""
+
+        def apply_renewals(self, *args, **kwargs):
+            time.sleep(io_delay)
+            return super().apply_renewals(*args, **kwargs)
+
+    template = next(iter(data.MOCK_USERS.values()))
+    seed = {}
+    for index in range(users_count):
+        user = copy.deepcopy(template)
+        user["phone"] = f"+9665{index:08d}"
+        user["national_id"] = f"1{index:09d}"
+        for worker in user.get("workers", []):
+            worker["iqama_number"] = f"2{index:04d}{worker['iqama_number'][-5:]}"
+        user["family_wallet"]["balance"] = balance  # يكفي لبعض التجديدات فقط: الباقي يُرفض
+        seed[user["phone"]] = user
+
+    def run(phones):
+        repository = SlowRepository(copy.deepcopy(seed))
+        original = data.users
+        data.users = repository
+        user_locks.__init__()
+        idempotency_cache.__init__()
+        initial = {phone: repository.get_by_phone(phone)["family_wallet"]["balance"] for phone in phones}
+        attempts = [0]
+
+        def worker(thread_number, phone):
+            rng = random.Random(thread_number)
+            results = []
+            for turn in range(renewals_per_thread):
+                user = repository.get_by_phone(phone)
+                choices = [(doc_type, doc["number"]) for doc_type, doc in user["documents"].items()]
+                choices += [("iqama", worker["iqama_number"]) for worker in user.get("workers", [])]
+                doc_type, number = rng.choice(choices)
+                key = idempotency_key(f"CA{thread_number}", turn, number)
+                repeats = 2 if turn % duplicate_every == 0 else 1  # إعادة إرسال بنفس المفتاح
+                for _ in range(repeats):
+                    attempts[0] += 1
+                    results.append((key, data.renew_document(user, doc_type, number, use_wallet=True,
+                                                             idempotency_key=key)))
+            return results
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=len(phones) * threads_per_user) as executor:
+            futures = [
+                executor.submit(worker, user_number * threads_per_user + thread, phone)
+                for user_number, phone in enumerate(phones) for thread in range(threads_per_user)
+            ]
+            results = [item for future in futures for item in future.result()]
+        elapsed = time.perf_counter() - started
+        data.users = original
+
+        ledger = repository.ledger()
+        references = [entry["reference_number"] for entry in ledger]
+        keys = [entry["idempotency_key"] for entry in ledger]
+        for phone in phones:
+            balance = repository.get_by_phone(phone)["family_wallet"]["balance"]
+            debits = sum(entry["amount"] for entry in ledger if entry["phone"] == phone and entry["method"] == "wallet")
+            assert balance >= 0, f"رصيد سالب: {phone} {balance}"
+            assert balance == initial[phone] - debits, f"الرصيد لا يطابق السجل: {phone}"
+
+        assert len(set(references)) == len(references), "رقم مرجعي مكرر"
+        assert len(set(keys)) == len(keys), "خصم مكرر لنفس المفتاح"
+
+        by_key = {}
+        for key, result in results:
+            if result["success"]:
+                first = by_key.setdefault(key, result["reference_number"])
+                assert first == result["reference_number"], "إعادة الطلب أرجعت عملية مختلفة"
+
+        return {
+            "elapsed": elapsed,
+            "attempts": attempts[0],
+            "applied": len(ledger),
+            "replayed": sum(1 for _, result in results if result.get("replayed")),
+            "declined": sum(1 for _, result in results if not result["success"]),
+            "locks": user_locks.stats()
+        }
+
+    phones = list(seed)
+    parallel = run(phones)
+    print(f"👥 {users_count} مستخدمين × {threads_per_user} خيوط: {parallel['attempts']} طلب، "
+          f"{parallel['applied']} خصم، {parallel['replayed']} مكرر أُعيدت نتيجته، "
+          f"{parallel['declined']} رُفض (رصيد غير كافي) - {parallel['elapsed']:.2f} ث")
+
+    # نفس العدد من العمليات لكن كلها على مستخدم واحد (تسلسل كامل)
+    seed_one = {phones[0]: seed[phones[0]]}
+    seed_one[phones[0]]["family_wallet"]["balance"] = balance * users_count
+    seed.clear()
+    seed.update(seed_one)
+    threads_per_user *= users_count
+    serial = run(phones[:1])
+    print(f"👤 مستخدم واحد × {threads_per_user} خيوط: {serial['attempts']} طلب - {serial['elapsed']:.2f} ث")
+
+    print(f"⚡ مستخدمون مختلفون أسرع بـ {serial['elapsed'] / parallel['elapsed']:.1f}x (لا ينتظرون بعض)")
+    print("✅ لا رصيد سالب، الرصيد يطابق السجل، لا خصم مكرر، لا رقم مرجعي مكرر")
+
+if __name__ == "__main__":
+    run_stress_test()
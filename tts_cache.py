@@ -0,0 +1,168 @@
+"""
+كاش الصوت - تخزين ملفات TTS حسب محتواها
+نفس النص بنفس الإعدادات لا يُرسل للشبكة مرتين
+"""
+
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+
+from config import TTS_CACHE_DIR, TTS_CACHE_MAX_BYTES
+
+AUDIO_EXTENSION = ".mp3"
+
+# ==========================
+# 🔑 مفتاح الكاش
+# ==========================
+def make_cache_key(text, model, voice, speed):
+    """
+    مفتاح الكاش: بصمة (النص، النموذج، الصوت، السرعة)
+
+    Returns:
+        سلسلة hex ثابتة الطول تصلح اسماً للملف
+    """
+    payload = json.dumps([text, model, voice, float(speed)], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+# ==========================
+# 💾 كاش القرص
+# ==========================
+class TTSCache:
+    """
+    كاش صوت على القرص: ملف لكل مفتاح، بحد أقصى للحجم ويُحذف الأقدم استخداماً
+    (المشغّل يقرأ من مسار ملف، فلا فائدة من نسخة ثانية في الذاكرة)
+    """
+
+    def __init__(self, cache_dir=TTS_CACHE_DIR, max_bytes=TTS_CACHE_MAX_BYTES):
+        """
+        Args:
+            cache_dir: مجلد ملفات الكاش
+            max_bytes: الحد الأقصى لحجم الكاش على القرص
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+        self._lock = threading.Lock()
+        self._disk = OrderedDict()  # key -> الحجم، بترتيب آخر استخدام
+        self._disk_bytes = 0
+
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load_disk_index()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + AUDIO_EXTENSION)
+
+    def _load_disk_index(self):
+        """قراءة الملفات الموجودة مرتبة حسب آخر استخدام (mtime)"""
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_file() and entry.name.endswith(AUDIO_EXTENSION):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, entry.name[:-len(AUDIO_EXTENSION)], stat.st_size))
+
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_bytes += size
+
+    # --------------------------
+    # القرص
+    # --------------------------
+    def _touch(self, key):
+        """تحديث ترتيب الاستخدام (يبقى بعد إعادة التشغيل عبر mtime)"""
+        self._disk.move_to_end(key)
+        try:
+            os.utime(self._path(key))
+        except OSError:
+            pass
+
+    def _store(self, key, data):
+        """كتابة الملف بشكل ذري ثم الحذف حتى نرجع تحت الحد"""
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        self._disk_bytes += len(data) - self._disk.get(key, 0)
+        self._disk[key] = len(data)
+        self._disk.move_to_end(key)
+
+        # لا نحذف الملف الذي كتبناه للتو حتى لو كان أكبر من الحد
+        while self._disk_bytes > self.max_bytes and len(self._disk) > 1:
+            old_key, old_size = self._disk.popitem(last=False)
+            self._disk_bytes -= old_size
+            self.evictions += 1
+            try:
+                os.remove(self._path(old_key))
+            except OSError:
+                pass
+
+    # --------------------------
+    # الواجهة
+    # --------------------------
+    def get_file(self, text, model, voice, speed, render):
+        """
+        مسار ملف الصوت للنص - من الكاش إن وجد، وإلا يُولّد ويُحفظ
+
+        Args:
+            text, model, voice, speed: إعدادات التحويل
+            render: دالة (text) -> bytes تستدعي خدمة TTS عند عدم وجوده
+
+        Returns:
+            مسار الملف على القرص
+        """
+        key = make_cache_key(text, model, voice, speed)
+
+        with self._lock:
+            if key in self._disk:
+                self.disk_hits += 1
+                self._touch(key)
+                return self._path(key)
+
+            self.misses += 1
+
+        # التوليد خارج القفل حتى لا نوقف بقية الطلبات أثناء الشبكة
+        data = render(text)
+
+        with self._lock:
+            self._store(key, data)
+
+        return self._path(key)
+
+    def prewarm(self, texts, model, voice, speed, render):
+        """
+        تجهيز العبارات الثابتة مسبقاً عند بدء التشغيل
+
+        Returns:
+            عدد العبارات التي تم توليدها فعلاً (غير الموجودة مسبقاً)
+        """
+        rendered = 0
+        for text in dict.fromkeys(texts):  # بدون تكرار مع الحفاظ على الترتيب
+            if not text:
+                continue
+            key = make_cache_key(text, model, voice, speed)
+            with self._lock:
+                cached = key in self._disk
+            if not cached:
+                self.get_file(text, model, voice, speed, render)
+                rendered += 1
+        return rendered
+
+    def stats(self):
+        """إحصائيات الكاش"""
+        with self._lock:
+            lookups = self.disk_hits + self.misses
+            return {
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round(self.disk_hits / lookups, 3) if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self._disk),
+                "disk_bytes": self._disk_bytes
+            }
@@ -0,0 +1,150 @@
+"""
+قوالب TwiML جاهزة - بدل بناء شجرة VoiceResponse/Gather وتحويلها لنص في كل طلب
+
+• الردود الثابتة (الخطأ، الإعادة، الوداع، الاختبار) بايتات جاهزة من بداية التشغيل
+• الردود التي فيها نص (الكلام، جمل الانتظار) هيكل مقسوم عند مكان النص،
+  فالرد = بداية + النص بعد تهريب XML + نهاية (ضم واحد)
+
+الهياكل نفسها تُبنى بمكتبة twilio مرة واحدة، فالناتج مطابق حرفياً لما كانت تنتجه.
+
+المقارنة مع مكتبة twilio:
+    python twiml_templates.py
+"""
+
+import random
+from xml.sax.saxutils import escape
+
+from twilio.twiml.voice_response import VoiceResponse, Gather
+
+from config import (
+    VOICE_LANGUAGE, VOICE_NAME, SPEECH_TIMEOUT, SPEECH_HINTS, TURN_POLL_PAUSE,
+    ERROR_MESSAGE, NO_SPEECH_MESSAGE, FAREWELL_MESSAGE, TIMEOUT_MESSAGE, FILLER_MESSAGES
+)
+
+# نص مؤقت مكان الجزء المتغير (لا يتغير بالتهريب ولا يظهر في أي رد حقيقي)
+_SLOT = "⁣SLOT⁣"
+
+TEST_MESSAGE = "اختبار. السيرفر يعمل بنجاح!"
+
+# ==========================
+# 🏗️ البناء بمكتبة twilio (مرة واحدة، وللمقارنة)
+# ==========================
+def build_speech_response(text):
+    """رد يقول النص ثم ينتظر كلام المستخدم، وينهي المكالمة إذا لم يرد"""
+    response = VoiceResponse()
+
+    gather = Gather(
+        input='speech',
+        language=VOICE_LANGUAGE,
+        timeout=SPEECH_TIMEOUT,
+        speech_timeout='auto',
+        action='/handle-speech',
+        method='POST',
+        hints=SPEECH_HINTS
+    )
+
+    gather.say(text, language=VOICE_LANGUAGE, voice=VOICE_NAME)
+    response.append(gather)
+
+    # إذا لم يرد المستخدم
+    response.say(TIMEOUT_MESSAGE, language=VOICE_LANGUAGE, voice=VOICE_NAME)
+    response.hangup()
+
+    return str(response)
+
+def build_filler_response(message, turn_id):
+    """جملة انتظار قصيرة ثم إعادة توجيه لـ /poll-reply"""
+    response = VoiceResponse()
+    response.say(message, language=VOICE_LANGUAGE, voice=VOICE_NAME)
+    response.pause(length=TURN_POLL_PAUSE)
+    response.redirect(f'/poll-reply?turn={turn_id}', method='POST')
+    return str(response)
+
+def build_hold_response(turn_id):
+    """انتظار صامت ثم إعادة المحاولة"""
+    response = VoiceResponse()
+    response.pause(length=TURN_POLL_PAUSE)
+    response.redirect(f'/poll-reply?turn={turn_id}', method='POST')
+    return str(response)
+
+def build_say_response(text, hangup=False, redirect=None):
+    """جملة واحدة ثم إنهاء المكالمة أو إعادة التوجيه"""
+    response = VoiceResponse()
+    response.say(text, language=VOICE_LANGUAGE, voice=VOICE_NAME)
+    if hangup:
+        response.hangup()
+    if redirect:
+        response.redirect(redirect, method='POST')
+    return str(response)
+
+# ==========================
+# 📄 القوالب
+# ==========================
+def _skeleton(rendered):
+    """(بداية، نهاية) كبايتات حول مكان النص"""
+    before, after = rendered.split(_SLOT)
+    return before.encode("utf-8"), after.encode("utf-8")
+
+ERROR_TWIML = build_say_response(ERROR_MESSAGE, hangup=True).encode("utf-8")
+REPEAT_TWIML = build_say_response(NO_SPEECH_MESSAGE, redirect='/voice').encode("utf-8")
+FAREWELL_TWIML = build_say_response(FAREWELL_MESSAGE, hangup=True).encode("utf-8")
+TEST_TWIML = build_say_response(TEST_MESSAGE).encode("utf-8")
+
+_SPEECH = _skeleton(build_speech_response(_SLOT))
+_HOLD = _skeleton(build_hold_response(_SLOT))
+_FILLERS = [_skeleton(build_filler_response(message, _SLOT)) for message in FILLER_MESSAGES]
+
+def speech_twiml(text):
+    """TwiML رد الكلام: النص بعد التهريب داخل الهيكل الجاهز"""
+    before, after = _SPEECH
+    return b"".join((before, escape(text).encode("utf-8"), after))
+
+def filler_twiml(turn_id):
+    """TwiML جملة انتظار عشوائية ثم /poll-reply لنفس الدور"""
+    before, after = random.choice(_FILLERS)
+    return b"".join((before, escape(turn_id).encode("utf-8"), after))
+
+def hold_twiml(turn_id):
+    """TwiML انتظار صامت ثم /poll-reply لنفس الدور"""
+    before, after = _HOLD
+    return b"".join((before, escape(turn_id).encode("utf-8"), after))
+
+# ==========================
+# 🧪 المقارنة
+# ==========================
+def run_benchmark(rounds=20000):
+    """التأكد من التطابق مع مكتبة twilio ومقارنة زمن بناء الرد"""
+    import time
+
+    samples = [
+        "أهلاً أبو محمد! عندك إقامة محمد خان منتهية. تبغاني أجددها لك؟",
+        "رصيد محفظتك العائلية: ألف وميتين ريال.",
+        "الرسوم <تقريباً> ثلاثمية ريال & تُدفع من \"المحفظة\"."
+    ]
+
+    for text in samples:
+        assert speech_twiml(text) == build_speech_response(text).encode("utf-8"), text
+    assert hold_twiml("ab12cd34ef56") == build_hold_response("ab12cd34ef56").encode("utf-8")
+    for index, message in enumerate(FILLER_MESSAGES):
+        before, after = _FILLERS[index]
+        assert before + b"ab12" + after == build_filler_response(message, "ab12").encode("utf-8")
+    print("✅ القوالب مطابقة حرفياً لمكتبة twilio")
+
+    def measure(function):
+        started = time.perf_counter()
+        for index in range(rounds):
+            function(samples[index % len(samples)])
+        return (time.perf_counter() - started) / rounds * 1e6
+
+    builder_speech = measure(lambda text: build_speech_response(text).encode("utf-8"))
+    template_speech = measure(speech_twiml)
+    builder_static = measure(lambda _: build_say_response(ERROR_MESSAGE, hangup=True).encode("utf-8"))
+    template_static = measure(lambda _: ERROR_TWIML)
+
+    print(f"🗣️ رد الكلام: twilio {builder_speech:.1f} ميكروثانية، القالب {template_speech:.2f} "
+          f"({builder_speech / template_speech:.0f}x)")
+    print(f"📄 رد ثابت (خطأ): twilio {builder_static:.1f} ميكروثانية، الجاهز {template_static:.2f} "
+          f"({builder_static / template_static:.0f}x)")
+
+if __name__ == "__main__":
+    run_benchmark()